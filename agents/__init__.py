@@ -1,6 +1,10 @@
 # agents/__init__.py
 from .player_agent import PlayerAgent
-from .model import GameModel
+from .model import GameModel, get_shared_llm
+from .agent_memory import AgentMemory
+from .event_log import PublicEventLog, EventLogView
+from .records import Record, json_default, to_plain
+from .llm_requests import HedgedRequester, LatencyTracker, get_latency_tracker
 
-__all__ = ["PlayerAgent", "GameModel"]
+__all__ = ["PlayerAgent", "GameModel", "get_shared_llm", "AgentMemory", "PublicEventLog", "EventLogView", "Record", "json_default", "to_plain", "HedgedRequester", "LatencyTracker", "get_latency_tracker"]
 
@@ -0,0 +1,339 @@
+# agents/agent_memory.py
+"""带索引的Agent记忆：仍是原来的 dict（每个键一个列表，序列化格式不变），
+同时按轮次、按玩家维护索引，提示词构建时不再反复扫描整个历史
+
+公开信息（所有人的描述、全员投票）不再复制到每个Agent：每局一份只追加的 PublicEventLog，
+各Agent只持有指向它的 EventLogView（自己收到了哪些事件）"""
+from typing import Dict, List, Optional
+
+from .event_log import PublicEventLog
+from .records import DescriptionRecord, RoundVotes
+
+MEMORY_KEYS = (
+    "all_descriptions",
+    "description_thinking_history",
+    "voting_history",
+    "voting_thinking_history",
+    "all_votes_history",
+    "player_analyses",
+    "self_analyses",
+)
+
+# 每局共享的公开记录；其余键是每个Agent私有的列表
+PUBLIC_KEYS = ("all_descriptions", "all_votes_history")
+
+
+def new_public_logs() -> Dict[str, PublicEventLog]:
+    """一局游戏的公开记录 {key: PublicEventLog}，传给该局每个Agent的 AgentMemory"""
+    return {key: PublicEventLog() for key in PUBLIC_KEYS}
+
+
+def normalize_player_id(key) -> int:
+    """把 1 / "1" / "player_1" / "Player 1" / "玩家1" 统一为整数ID"""
+    if isinstance(key, int):
+        return key
+    if isinstance(key, str):
+        cleaned = (
+            key.lower()
+            .replace("player_", "")
+            .replace("player ", "")
+            .replace("玩家", "")
+            .strip()
+        )
+        return int(cleaned)
+    raise ValueError(f"无法解析 player_id: {key}")
+
+
+class AgentMemory(dict):
+    """PlayerAgent 的记忆
+
+    键和内容与原来的 dict 完全一致（save_game_results_json 序列化这些列表）。
+    PUBLIC_KEYS 的值是该局公开记录的 EventLogView（可迭代，list() 后即原来的列表），
+    没有传入 public_logs 时使用Agent自己的记录。另外维护：
+    - 私有键按轮次的索引 {round: [entry, ...]}（轮内保持列表顺序）；公开记录的轮次索引在 PublicEventLog 中，各Agent共享
+    - 每个其他玩家最近一次的分析、出现过的所有玩家ID
+    - 已渲染好的历史文本块（按轮缓存，该轮的描述或投票有变化时失效）
+
+    写入必须经过本类的方法：MEMORY_KEYS 中的键不能直接赋值、删除或 update（抛出 TypeError），
+    也不要直接 append 到列表上。
+    """
+
+    def __init__(self, public_logs: Optional[Dict[str, PublicEventLog]] = None):
+        public_logs = public_logs or {}
+        super().__init__(
+            (key, self._public_log(public_logs, key).view() if key in PUBLIC_KEYS else [])
+            for key in MEMORY_KEYS
+        )
+        self._reindex()
+
+    @staticmethod
+    def _public_log(public_logs: Dict[str, PublicEventLog], key: str) -> PublicEventLog:
+        log = public_logs.get(key)
+        return PublicEventLog() if log is None else log
+
+    # ---------- 禁止绕过索引的写入 ----------
+
+    @staticmethod
+    def _check_writable(key):
+        if key in MEMORY_KEYS:
+            raise TypeError(f"记忆键 {key} 带有索引，不能直接赋值或删除，请使用 AgentMemory 的写入方法")
+
+    def __setitem__(self, key, value):
+        self._check_writable(key)
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._check_writable(key)
+        super().__delitem__(key)
+
+    def pop(self, key, *default):
+        self._check_writable(key)
+        return super().pop(key, *default)
+
+    def popitem(self):
+        raise TypeError("AgentMemory 不支持 popitem")
+
+    def clear(self):
+        raise TypeError("AgentMemory 不支持 clear")
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    # ---------- 索引维护 ----------
+
+    def _reindex(self):
+        self._by_round: Dict[str, Dict[int, List[dict]]] = {key: {} for key in MEMORY_KEYS}
+        self._latest_player_analysis: Dict[str, tuple] = {}
+        self._known_players = set()
+        # 每轮公开记录（描述、全员投票）的版本号，以及按 (kind, round) 缓存的渲染结果
+        self._round_versions: Dict[int, int] = {}
+        self._rendered: Dict[tuple, tuple] = {}
+        for key in MEMORY_KEYS:
+            if key in PUBLIC_KEYS:
+                for entry in self.get(key, ()):
+                    self._index_public(key, entry)
+                continue
+            for entry in self.get(key, []):
+                self._index(key, entry)
+
+    def _index(self, key: str, entry: dict):
+        round_num = entry.get("round", 0)
+        self._by_round[key].setdefault(round_num, []).append(entry)
+
+        if key == "player_analyses":
+            self._index_player_analyses(round_num, entry.get("analyses", {}))
+
+    def _index_public(self, key: str, entry: dict):
+        self._touch(entry.get("round", 0))
+        if key == "all_descriptions":
+            self._add_known(entry.get("player_id"))
+        else:
+            for vote in entry.get("votes", []):
+                self._add_known(vote.get("voter_id"))
+                self._add_known(vote.get("target_id"))
+
+    def _index_player_analyses(self, round_num: int, analyses: dict):
+        for player_key, analysis in analyses.items():
+            try:
+                self._add_known(normalize_player_id(player_key))
+            except Exception:
+                pass
+            latest = self._latest_player_analysis.get(player_key)
+            if latest is None or round_num >= latest[0]:
+                self._latest_player_analysis[player_key] = (round_num, analysis)
+
+    def _touch(self, round_num: int):
+        self._round_versions[round_num] = self._round_versions.get(round_num, 0) + 1
+
+    def _add_known(self, player_id):
+        if player_id:
+            self._known_players.add(player_id)
+
+    @staticmethod
+    def _infer_eliminated(votes_entry: dict) -> Optional[int]:
+        """得票唯一最多的玩家视为被淘汰；平票或没有投票时返回None"""
+        vote_counts = {}
+        for vote in votes_entry.get("votes", []):
+            target_id = vote.get("target_id")
+            if target_id:
+                vote_counts[target_id] = vote_counts.get(target_id, 0) + 1
+        if not vote_counts:
+            return None
+        max_votes = max(vote_counts.values())
+        candidates = [pid for pid, count in vote_counts.items() if count == max_votes]
+        return candidates[0] if len(candidates) == 1 else None
+
+    def _append(self, key: str, entry: dict):
+        dict.__getitem__(self, key).append(entry)
+        self._index(key, entry)
+
+    def _remove(self, key: str, round_num: int, predicate=None):
+        """移除 key 中第 round_num 轮（满足 predicate 的）条目，其余条目保持原顺序"""
+        round_entries = self._by_round[key].get(round_num)
+        if not round_entries:
+            return
+        removed = [e for e in round_entries if predicate is None or predicate(e)]
+        if not removed:
+            return
+        removed_ids = {id(e) for e in removed}
+        entries = dict.__getitem__(self, key)
+        entries[:] = [e for e in entries if id(e) not in removed_ids]
+        kept = [e for e in round_entries if id(e) not in removed_ids]
+        if kept:
+            self._by_round[key][round_num] = kept
+        else:
+            del self._by_round[key][round_num]
+        if key == "player_analyses":
+            # 被替换的分析可能是某个玩家"最近一次"的分析，也可能是某个玩家唯一出现的地方，重建全部索引
+            self._reindex()
+
+    # ---------- 写入 ----------
+
+    def receive(self, key: str, pos: int):
+        """收到该局公开记录 key 中位置 pos 的事件（由游戏只追加一次，各Agent只移动自己的视图）"""
+        view = self[key]
+        view.receive(pos)
+        self._index_public(key, view.log[pos])
+
+    def publish(self, key: str, entry: dict):
+        """追加到自己持有的公开记录并立即收到（单独使用Agent时的写法）"""
+        self.receive(key, self[key].log.append(entry))
+
+    def add_description(self, round_num: int, player_id: int, description: str, name: str):
+        self.publish("all_descriptions", DescriptionRecord(
+            round=round_num,
+            player_id=player_id,
+            description=description,
+            name=name
+        ))
+
+    def add_vote(self, entry: dict):
+        self._append("voting_history", entry)
+
+    def add_round_votes(self, round_num: int, votes: List[dict]):
+        self.publish("all_votes_history", RoundVotes(round=round_num, votes=votes))
+
+    def replace_round_entry(self, key: str, entry: dict):
+        """先移除同一轮的旧条目（防止重复），再追加新条目（思考记录等每轮一条的列表）"""
+        if key in PUBLIC_KEYS:
+            raise ValueError(f"公开记录 {key} 只能追加，不能替换")
+        self._remove(key, entry["round"])
+        self._append(key, entry)
+
+    def set_self_analysis(self, round_num: int, analysis: dict, phase: Optional[str] = None):
+        """记录第 round_num 轮对自己的分析
+
+        phase 为None时替换该轮所有旧条目；否则只替换该轮 analysis.phase == phase 的条目
+        （投票后反思不覆盖描述阶段的分析）
+        """
+        predicate = None if phase is None else (lambda e: e.get("analysis", {}).get("phase") == phase)
+        self._remove("self_analyses", round_num, predicate)
+        self._append("self_analyses", {"round": round_num, "analysis": analysis})
+
+    def merge_player_analyses(self, round_num: int, analyses: dict):
+        """按玩家ID合并到该轮第一条分析条目中；该轮还没有条目时新建（不带phase）"""
+        entries = self._by_round["player_analyses"].get(round_num)
+        if entries:
+            existing_analyses = entries[0].get("analyses", {})
+            existing_analyses.update(analyses)
+            entries[0]["analyses"] = existing_analyses
+            self._index_player_analyses(round_num, analyses)
+        else:
+            self._append("player_analyses", {"round": round_num, "analyses": analyses.copy()})
+
+    def set_player_analyses(self, round_num: int, phase: str, analyses: dict):
+        """替换该轮、该阶段的分析条目"""
+        self._remove("player_analyses", round_num, lambda e: e.get("phase") == phase)
+        self._append("player_analyses", {"round": round_num, "phase": phase, "analyses": analyses})
+
+    # ---------- 查询 ----------
+
+    def descriptions_in(self, round_num: int) -> List[dict]:
+        return self["all_descriptions"].in_round(round_num)
+
+    def description_rounds_before(self, round_num: int) -> List[int]:
+        """之前有描述的轮次（升序）"""
+        return self["all_descriptions"].rounds_before(round_num)
+
+    def descriptions_before(self, round_num: int) -> List[dict]:
+        """之前所有轮次的描述（保持记忆中的顺序）"""
+        return self["all_descriptions"].before(round_num)
+
+    def round_votes(self, round_num: int) -> Optional[dict]:
+        """该轮第一条全员投票记录 {"round", "votes"}，没有则为None"""
+        entries = self["all_votes_history"].in_round(round_num)
+        return entries[0] if entries else None
+
+    def votes_before(self, round_num: int) -> List[dict]:
+        return self["all_votes_history"].before(round_num)
+
+    def eliminated_before(self, round_num: int) -> List[int]:
+        """根据之前各轮投票推断出的被淘汰玩家（按ID排序）"""
+        view = self["all_votes_history"]
+        eliminated = set()
+        for r in view.rounds_before(round_num):
+            for pos in view.positions_in_round(r):
+                # 推断结果缓存在共享的记录上，每局每轮只算一次
+                eliminated_id = view.log.derived(pos, "eliminated", self._infer_eliminated)
+                if eliminated_id is not None:
+                    eliminated.add(eliminated_id)
+        return sorted(eliminated)
+
+    def known_players(self) -> set:
+        """描述、投票和分析中出现过的所有玩家ID"""
+        return set(self._known_players)
+
+    def self_analyses_in(self, round_num: int) -> List[dict]:
+        return self._by_round["self_analyses"].get(round_num, [])
+
+    def latest_self_analysis_before(self, round_num: int) -> Optional[dict]:
+        """round_num 之前最近一轮中第一条非空的自我分析条目"""
+        by_round = self._by_round["self_analyses"]
+        for r in sorted((r for r in by_round if r < round_num), reverse=True):
+            for entry in by_round[r]:
+                if entry.get("analysis"):
+                    return entry
+        return None
+
+    def player_analyses_in(self, round_num: int) -> List[dict]:
+        return self._by_round["player_analyses"].get(round_num, [])
+
+    def phase_player_analyses(self, round_num: int, phase: str) -> dict:
+        """该轮、该阶段所有条目合并后的分析 {player_id_str: analysis}"""
+        merged = {}
+        for entry in self.player_analyses_in(round_num):
+            if entry.get("phase") == phase:
+                merged.update(entry.get("analyses", {}))
+        return merged
+
+    def latest_player_analyses_before(self, round_num: int) -> Optional[dict]:
+        """round_num 之前最近一轮的第一条对其他玩家的分析条目"""
+        by_round = self._by_round["player_analyses"]
+        earlier = [r for r in by_round if r < round_num]
+        return by_round[max(earlier)][0] if earlier else None
+
+    def latest_player_analysis(self, player_id) -> Optional[dict]:
+        """对某个玩家最近一次的分析（最大轮次中最后写入的），没有则为None"""
+        latest = self._latest_player_analysis.get(str(player_id))
+        return latest[1] if latest else None
+
+    # ---------- 渲染缓存 ----------
+
+    def rendered(self, kind: str, round_num: int, render) -> str:
+        """返回第 round_num 轮的 kind 类文本块；该轮描述/投票自上次渲染后没有变化时直接复用
+
+        已结束的轮次不会再变化，所以每个历史轮次只会调用一次 render()
+        """
+        version = self._round_versions.get(round_num, 0)
+        cached = self._rendered.get((kind, round_num))
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        text = render()
+        self._rendered[(kind, round_num)] = (version, text)
+        return text
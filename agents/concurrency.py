@@ -0,0 +1,121 @@
+import asyncio
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager, asynccontextmanager
+
+_limiter_lock = threading.Lock()
+_inflight_limit = None
+_inflight_semaphore = None
+# asyncio semaphores are bound to one event loop, so keep one per loop
+_async_semaphores = weakref.WeakKeyDictionary()
+
+
+def set_max_inflight_requests(limit):
+    """Cap the number of LLM requests in flight across the whole process.
+
+    ``None`` or ``0`` removes the cap. The cap applies to both the threaded
+    (``inflight_slot``) and the asyncio (``async_inflight_slot``) paths.
+    """
+    global _inflight_limit, _inflight_semaphore
+    with _limiter_lock:
+        _inflight_limit = limit or None
+        _inflight_semaphore = threading.BoundedSemaphore(limit) if limit else None
+        _async_semaphores.clear()
+
+
+def get_max_inflight_requests():
+    """Current process-wide in-flight cap, or ``None`` when uncapped."""
+    return _inflight_limit
+
+
+@contextmanager
+def inflight_slot():
+    """Hold one of the global in-flight LLM request slots for the duration of the block."""
+    sem = _inflight_semaphore
+    if sem is None:
+        yield
+        return
+    with sem:
+        yield
+
+
+@asynccontextmanager
+async def async_inflight_slot():
+    """asyncio counterpart of ``inflight_slot``."""
+    limit = _inflight_limit
+    if limit is None:
+        yield
+        return
+    loop = asyncio.get_running_loop()
+    with _limiter_lock:
+        sem = _async_semaphores.get(loop)
+        if sem is None:
+            sem = _async_semaphores[loop] = asyncio.Semaphore(limit)
+    async with sem:
+        yield
+
+
+def run_games_in_order(play_game, game_ids, n_workers, on_finished):
+    """Run ``play_game(game_id)`` for many games in a thread pool.
+
+    ``on_finished(game_id, result)`` is called on the calling thread in
+    ``game_ids`` order, so anything it appends to shared files ends up in the
+    same order as a sequential run. A crashed game is reported and skipped,
+    exactly like the sequential loop does.
+    """
+    game_ids = list(game_ids)
+    finished = {}
+    next_idx = 0
+
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        future_to_game = {executor.submit(play_game, gid): gid for gid in game_ids}
+
+        for future in as_completed(future_to_game):
+            gid = future_to_game[future]
+            try:
+                finished[gid] = (True, future.result())
+                print(f"Game {gid} finished")
+            except Exception as e:
+                finished[gid] = (False, None)
+                print(f"[ERROR] Game {gid} crashed: {e}")
+                print("Skipping to next game...")
+
+            next_idx = _flush_in_order(game_ids, finished, next_idx, on_finished)
+
+
+async def run_games_in_order_async(play_game, game_ids, max_concurrent_games, on_finished):
+    """asyncio counterpart of ``run_games_in_order``.
+
+    ``play_game`` is a coroutine function; at most ``max_concurrent_games``
+    games are in progress at any time, all on the current event loop.
+    """
+    game_ids = list(game_ids)
+    finished = {}
+    next_idx = 0
+    game_slots = asyncio.Semaphore(max_concurrent_games)
+
+    async def play(gid):
+        async with game_slots:
+            try:
+                return gid, True, await play_game(gid)
+            except Exception as e:
+                print(f"[ERROR] Game {gid} crashed: {e}")
+                print("Skipping to next game...")
+                return gid, False, None
+
+    for next_done in asyncio.as_completed([play(gid) for gid in game_ids]):
+        gid, ok, result = await next_done
+        if ok:
+            print(f"Game {gid} finished")
+        finished[gid] = (ok, result)
+        next_idx = _flush_in_order(game_ids, finished, next_idx, on_finished)
+
+
+def _flush_in_order(game_ids, finished, next_idx, on_finished):
+    while next_idx < len(game_ids) and game_ids[next_idx] in finished:
+        ok, result = finished.pop(game_ids[next_idx])
+        if ok:
+            on_finished(game_ids[next_idx], result)
+        next_idx += 1
+    return next_idx
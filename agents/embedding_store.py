@@ -0,0 +1,167 @@
+# agents/embedding_store.py
+import hashlib
+import json
+import os
+import re
+import threading
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "SPYGAME_EMBEDDING_CACHE",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".embedding_cache"),
+)
+
+
+def text_key(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class _ModelShard:
+    """Vectors of one embedding model: ``{slug}.f32`` holds the raw float32 rows,
+    ``{slug}.idx`` is a JSON-lines index mapping text hash -> row.
+
+    Rows are appended before their index line, so a crash can at worst leave an
+    unreferenced row behind, never an index entry pointing at a partial vector.
+    A torn row or index line is cut off by the next ``append``.
+    """
+
+    def __init__(self, cache_dir, model):
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", model)
+        self.model = model
+        self.vec_path = os.path.join(cache_dir, f"{slug}.f32")
+        self.idx_path = os.path.join(cache_dir, f"{slug}.idx")
+        self.dim = None
+        self.rows = {}
+        self._idx_offset = 0
+        self._mmap = None
+
+    def refresh(self):
+        """Pick up index lines appended since the last call (possibly by another process)."""
+        if not os.path.exists(self.idx_path):
+            return
+        with open(self.idx_path, "r", encoding="utf-8") as f:
+            f.seek(self._idx_offset)
+            for line in f:
+                if not line.endswith("\n"):
+                    break  # partially written line, read it next time
+                self._idx_offset += len(line.encode("utf-8"))
+                entry = json.loads(line)
+                if "dim" in entry:
+                    self.dim = entry["dim"]
+                else:
+                    self.rows[entry["k"]] = entry["r"]
+
+    def matrix(self):
+        n = os.path.getsize(self.vec_path) // (4 * self.dim)
+        if self._mmap is None or self._mmap.shape[0] < n:
+            self._mmap = np.memmap(self.vec_path, dtype=np.float32, mode="r", shape=(n, self.dim))
+        return self._mmap
+
+    def append(self, keys, vecs):
+        vecs = np.ascontiguousarray(vecs, dtype=np.float32)
+        with open(self.idx_path, "a", encoding="utf-8") as idx_f:
+            if fcntl is not None:
+                fcntl.flock(idx_f, fcntl.LOCK_EX)
+            try:
+                self.refresh()
+                if os.path.getsize(self.idx_path) > self._idx_offset:
+                    # drop an index line that was being written when a process died
+                    idx_f.truncate(self._idx_offset)
+                if self.dim is None:
+                    self.dim = int(vecs.shape[1])
+                    idx_f.write(json.dumps({"model": self.model, "dim": self.dim}) + "\n")
+                elif vecs.shape[1] != self.dim:
+                    raise ValueError(
+                        f"embedding dim {vecs.shape[1]} does not match cached dim {self.dim} for {self.model}"
+                    )
+
+                row_bytes = 4 * self.dim
+                if os.path.exists(self.vec_path) and os.path.getsize(self.vec_path) % row_bytes:
+                    # drop the tail of a row that was being written when a process died
+                    os.truncate(self.vec_path, os.path.getsize(self.vec_path) // row_bytes * row_bytes)
+                with open(self.vec_path, "ab") as vec_f:
+                    start = vec_f.tell() // row_bytes
+                    vec_f.write(vecs.tobytes())
+                    vec_f.flush()
+                    os.fsync(vec_f.fileno())
+
+                lines = []
+                for i, k in enumerate(keys):
+                    self.rows[k] = start + i
+                    lines.append(json.dumps({"k": k, "r": start + i}) + "\n")
+                idx_f.write("".join(lines))
+                idx_f.flush()
+                self._idx_offset = idx_f.tell()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(idx_f, fcntl.LOCK_UN)
+
+
+class EmbeddingStore:
+    """Content-addressed on-disk embedding cache keyed by ``(model, sha1(text))``.
+
+    Each model gets a memory-mapped float32 matrix plus an index file under
+    ``cache_dir``, so vectors survive restarts and are shared between processes.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self._shards = {}
+        self._lock = threading.Lock()
+
+    def _shard(self, model):
+        shard = self._shards.get(model)
+        if shard is None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            shard = self._shards[model] = _ModelShard(self.cache_dir, model)
+        return shard
+
+    def embed_matrix(self, model, texts, fetch):
+        """Return one contiguous float32 ``(n, d)`` array for ``texts``, calling
+        ``fetch(missing_texts)`` once for the distinct texts that are not cached
+        yet. Hits are gathered from the memory-mapped rows without per-row objects."""
+        keys = [text_key(t) for t in texts]
+        with self._lock:
+            shard = self._shard(model)
+            shard.refresh()
+            rows = [shard.rows.get(k) for k in keys]
+
+        hit_pos = [i for i, r in enumerate(rows) if r is not None]
+        missing = list(dict.fromkeys(t for t, r in zip(texts, rows) if r is None))
+
+        fetched = None
+        if missing:
+            fetched = np.asarray(fetch(missing), dtype=np.float32).reshape(len(missing), -1)
+            with self._lock:
+                shard.append([text_key(t) for t in missing], fetched)
+
+        dim = fetched.shape[1] if fetched is not None else shard.dim
+        out = np.empty((len(texts), dim or 0), dtype=np.float32)
+        if hit_pos:
+            with self._lock:
+                mat = shard.matrix()
+            out[hit_pos] = mat[[rows[i] for i in hit_pos]]
+        if missing:
+            slot = {t: i for i, t in enumerate(missing)}
+            miss_pos = [i for i, r in enumerate(rows) if r is None]
+            out[miss_pos] = fetched[[slot[texts[i]] for i in miss_pos]]
+        return out
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_default_store():
+    """Process-wide store under ``DEFAULT_CACHE_DIR`` (``$SPYGAME_EMBEDDING_CACHE``)."""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = EmbeddingStore()
+        return _default_store
@@ -0,0 +1,99 @@
+# agents/embeddings.py
+import os
+import zlib
+import numpy as np
+
+BACKENDS = ("siliconflow", "hashing")
+# "siliconflow" (remote BAAI/bge-m3) or "hashing" (local, no network)
+_default_backend = os.environ.get("SPYGAME_EMBEDDING_BACKEND", "siliconflow")
+
+
+class EmbeddingBackend:
+    """Interface shared by every embedder used in the project.
+
+    Subclasses set ``model`` and implement ``embed_matrix``; ``embed`` is the
+    list-of-vectors view older call sites use.
+    """
+
+    model = None
+
+    def embed_matrix(self, texts, normalize=False):
+        """Return a float32 ``(n, d)`` array (rows L2-normalized if ``normalize``)."""
+        raise NotImplementedError
+
+    def embed(self, texts):
+        """Return embeddings for single string or list of strings."""
+        return list(self.embed_matrix(texts))
+
+
+class HashingEmbeddings(EmbeddingBackend):
+    """Offline embedder: signed hashed character n-grams, in NumPy.
+
+    Each text becomes counts of its character n-grams (``ngram_range``, on the
+    lower-cased text padded with spaces) hashed into ``dim`` buckets with a
+    hashed sign, log-scaled and L2-normalized. Deterministic across runs and
+    processes, needs no network and works for any script, so retrieval,
+    outlier scores and dataset tools can run on an air-gapped machine.
+    """
+
+    def __init__(self, dim=512, ngram_range=(2, 4)):
+        self.dim = dim
+        self.ngram_range = ngram_range
+        self.model = f"hashing-char{ngram_range[0]}-{ngram_range[1]}-{dim}"
+
+    def _ngram_hashes(self, text):
+        text = f" {text.lower()} "
+        lo, hi = self.ngram_range
+        grams = [text[i:i + n] for n in range(lo, hi + 1) for i in range(len(text) - n + 1)]
+        if not grams:
+            grams = [text]
+        return np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint32, count=len(grams))
+
+    def embed_matrix(self, texts, normalize=False):
+        if isinstance(texts, str):
+            texts = [texts]
+
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            hashes = self._ngram_hashes(text)
+            signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+            np.add.at(matrix[row], hashes % self.dim, signs)
+
+        # sublinear term frequency, then unit length so inner product == cosine
+        matrix = np.sign(matrix) * np.log1p(np.abs(matrix))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms == 0, 1, norms)
+        return matrix
+
+
+def set_default_backend(backend):
+    """Backend used by every ``make_embeddings`` call that does not name one
+    (the runners, the cheatsheet retrieval). ``None`` keeps the current default."""
+    global _default_backend
+    if backend is None:
+        return
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {backend} (expected one of {BACKENDS})")
+    _default_backend = backend
+
+
+def get_default_backend():
+    return _default_backend
+
+
+def make_embeddings(backend=None, api_key=None, base_url="https://api.siliconflow.cn/v1",
+                    model="BAAI/bge-m3", store=None, **kwargs):
+    """Build the embedder selected by ``backend`` (default: ``$SPYGAME_EMBEDDING_BACKEND``,
+    or whatever ``set_default_backend`` chose).
+
+    ``api_key``, ``base_url``, ``model`` and ``store`` only apply to
+    ``"siliconflow"``; other ``kwargs`` go to the backend class (e.g. ``dim``
+    for ``"hashing"``, ``timeout`` for ``"siliconflow"``).
+    """
+    backend = backend or _default_backend
+    if backend == "hashing":
+        return HashingEmbeddings(**kwargs)
+    if backend == "siliconflow":
+        from agents.sf_embeddings import SiliconFlowEmbeddings
+        return SiliconFlowEmbeddings(api_key=api_key, base_url=base_url, model=model, store=store, **kwargs)
+    raise ValueError(f"Unknown embedding backend: {backend} (expected one of {BACKENDS})")
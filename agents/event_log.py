@@ -0,0 +1,181 @@
+# agents/event_log.py
+"""One append-only public event log per game, shared by all of its players.
+
+Descriptions, votes and host announcements are public: every listener sees
+the same event. Instead of copying each one into every player's memory, the
+game appends it to the log once and every player holds an ``EventLogView``:
+the log positions it has received, kept as a few ``[start, stop)`` segments
+(a single one unless the player stopped listening for a while). Receiving an
+event is an O(1) cursor bump and the event itself is stored once per game
+instead of once per player.
+
+Events are shared between views, so they must not be mutated after
+``append``.
+"""
+import threading
+from bisect import bisect_left, bisect_right
+
+
+class PublicEventLog:
+    """Append-only list of public events, indexed by round (``event[round_key]``)."""
+
+    def __init__(self, round_key="round"):
+        self.round_key = round_key
+        self._events = []
+        self._round_positions = {}
+        # whether rounds never go backwards, so "every round before r" is a prefix
+        self._ordered = True
+        self._last_round = None
+        self._derived = {}
+        self._lock = threading.Lock()
+
+    def append(self, event):
+        """Add ``event`` and return its position."""
+        with self._lock:
+            pos = len(self._events)
+            self._events.append(event)
+            if self.round_key is not None:
+                round_num = event.get(self.round_key, 0)
+                self._round_positions.setdefault(round_num, []).append(pos)
+                if self._last_round is not None and round_num < self._last_round:
+                    self._ordered = False
+                self._last_round = round_num if self._last_round is None else max(self._last_round, round_num)
+            return pos
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._events)
+
+    def __getitem__(self, pos):
+        return self._events[pos]
+
+    def __iter__(self):
+        return iter(self._events[:])
+
+    def rounds(self):
+        return sorted(self._round_positions)
+
+    def round_positions(self, round_num):
+        return self._round_positions.get(round_num, ())
+
+    def derived(self, pos, name, compute):
+        """``compute(event)`` for the event at ``pos``, evaluated once per log rather than once per view."""
+        key = (pos, name)
+        with self._lock:
+            if key in self._derived:
+                return self._derived[key]
+            event = self._events[pos]
+        value = compute(event)
+        with self._lock:
+            return self._derived.setdefault(key, value)
+
+    def view(self):
+        return EventLogView(self)
+
+
+class EventLogView:
+    """The part of a ``PublicEventLog`` one player has received, plus its private events.
+
+    Iterating yields the received public events in log order, with private
+    events (``add_private``) interleaved where they were added.
+    """
+
+    def __init__(self, log):
+        self.log = log
+        self._starts = []
+        self._stops = []
+        self._offsets = []  # number of received public events before each segment
+        self._received = 0
+        self._private = []  # (number of public events received before it, event)
+        self._private_slots = []  # index of each private event in the merged sequence
+
+    def receive(self, pos):
+        """Make the event at ``pos`` visible to this view (positions must arrive in log order)."""
+        if self._stops and pos < self._stops[-1]:
+            raise ValueError(f"event {pos} received out of log order (already at {self._stops[-1]})")
+        if self._stops and self._stops[-1] == pos:
+            self._stops[-1] = pos + 1
+        else:
+            self._starts.append(pos)
+            self._stops.append(pos + 1)
+            self._offsets.append(self._received)
+        self._received += 1
+
+    def add_private(self, event):
+        self._private_slots.append(self._received + len(self._private))
+        self._private.append((self._received, event))
+
+    def sees(self, pos):
+        i = bisect_right(self._starts, pos) - 1
+        return i >= 0 and pos < self._stops[i]
+
+    def public_count(self):
+        return self._received
+
+    def positions(self):
+        for start, stop in list(zip(self._starts, self._stops)):
+            yield from range(start, stop)
+
+    def positions_in_round(self, round_num):
+        return [pos for pos in self.log.round_positions(round_num) if self.sees(pos)]
+
+    def in_round(self, round_num):
+        return [self.log[pos] for pos in self.positions_in_round(round_num)]
+
+    def rounds_before(self, round_num):
+        """Rounds before ``round_num`` with at least one visible event, ascending."""
+        return [
+            r for r in self.log.rounds()
+            if r < round_num and any(self.sees(pos) for pos in self.log.round_positions(r))
+        ]
+
+    def before(self, round_num):
+        """Visible events of every round before ``round_num``, in log order."""
+        if not self.log._ordered:
+            key = self.log.round_key
+            return [self.log[pos] for pos in self.positions() if self.log[pos].get(key, 0) < round_num]
+        result = []
+        for r in self.rounds_before(round_num):
+            result.extend(self.in_round(r))
+        return result
+
+    def __iter__(self):
+        private = self._private
+        i = 0
+        for received, pos in enumerate(self.positions()):
+            while i < len(private) and private[i][0] <= received:
+                yield private[i][1]
+                i += 1
+            yield self.log[pos]
+        for _, event in private[i:]:
+            yield event
+
+    def __len__(self):
+        return self._received + len(self._private)
+
+    def __bool__(self):
+        return bool(self._stops) or bool(self._private)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        n = len(self)
+        if index < 0:
+            index += n
+        if not 0 <= index < n:
+            raise IndexError("EventLogView index out of range")
+        j = bisect_left(self._private_slots, index)
+        if j < len(self._private_slots) and self._private_slots[j] == index:
+            return self._private[j][1]
+        # ``j`` private events come before it, the rest are received public events
+        received = index - j
+        segment = bisect_right(self._offsets, received) - 1
+        return self.log[self._starts[segment] + received - self._offsets[segment]]
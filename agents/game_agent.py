@@ -1,25 +1,58 @@
-from sys import path_hooks
 import json_repair
 from langchain.agents import create_agent
 from prompts.description_prompt import description_prompt
 from prompts.reflection_prompt import reflection_prompt 
 from prompts.voting_prompt import voting_prompt
 import json
-from agents.spy_cheatsheet_manager import SpyCheatSheetManager
+import asyncio
+import threading
+from collections import OrderedDict
+from langchain_core.language_models import BaseChatModel
+from agents.spy_cheatsheet_manager import get_shared_manager
+from agents.concurrency import inflight_slot, async_inflight_slot
+from agents.event_log import PublicEventLog
+from agents.records import DescriptionLog, IdentityGuessLog, SelfIdentityLog, VoteLog
+
+SYSTEM_PROMPT = "You are a player in the SpyGame"
+
+MAX_CACHED_AGENTS = 32
+
+# compiled create_agent graphs, keyed by (id(model), system_prompt); the model is
+# kept in the value so its id cannot be reused while the entry exists. Least
+# recently used entries are dropped past MAX_CACHED_AGENTS.
+_agents = OrderedDict()
+_agents_lock = threading.Lock()
+
+
+def get_agent(model, system_prompt=SYSTEM_PROMPT):
+    """create_agent graph for ``model``, built and compiled once per (model, system_prompt)."""
+    key = (id(model), system_prompt)
+    with _agents_lock:
+        entry = _agents.get(key)
+        if entry is None:
+            entry = _agents[key] = (model, create_agent(model, tools=[], system_prompt=system_prompt))
+            while len(_agents) > MAX_CACHED_AGENTS:
+                _agents.popitem(last=False)
+        else:
+            _agents.move_to_end(key)
+        return entry[1]
+
+
 class PlayerAgent:
     def __init__(self, model, pid, role=None, word=None,total_player_num=5,enable_cheatsheet=True,cheatsheet_prefix="default"):
         self.word=word
         self.role=role
         self.player_id = pid
         self.model=model
-        self.agent=create_agent(  
-            model,
-            tools=[],
-            system_prompt="You are a player in the SpyGame",
-        )
+        # without tools the agent graph is a single chat completion, so chat models
+        # are called directly; anything else (e.g. a "provider:model" string) goes
+        # through a shared compiled agent
+        self.agent=None if isinstance(model, BaseChatModel) else get_agent(model)
         self.cheatsheet_prefix = cheatsheet_prefix
         self.log_info=[]
-        self.memory=[]
+        # what this player has heard: a view into the game's public log (see
+        # join_game_log) plus messages added with add_memory
+        self.memory=PublicEventLog(round_key="round_num").view()
         self.identity_info = [{"role": "unknown", "reason": "default value"}for _ in range(5)]
         self.enable_cheatsheet = enable_cheatsheet
         self.model_api_key = "your api key"
@@ -29,7 +62,7 @@ class PlayerAgent:
             self.model_base_url = "https://api.siliconflow.cn/v1"
 
         if enable_cheatsheet:
-            self.cheatsheet = SpyCheatSheetManager(
+            self.cheatsheet = get_shared_manager(
                 path=f"{self.cheatsheet_prefix}_cheatsheet_memory.json",
                 api_key=self.model_api_key,
                 base_url=self.model_base_url,
@@ -38,25 +71,51 @@ class PlayerAgent:
         else:
             self.cheatsheet = None
 
+    def join_game_log(self,game_log):
+        self.memory=game_log.view()
+
     def add_memory(self,message):
-        self.memory.append(message)
+        self.memory.add_private(message)
 
     def add_log_info(self,message):
         self.log_info.append(message)
 
     def ask(self,phase=None,round_num=None,alive_players_id=None,outlier_score=None):
+        prompt=self.build_prompt(phase,round_num,alive_players_id,outlier_score)
+        response=self.invoke_model(prompt)
+        return self.handle_response(phase,response,round_num,alive_players_id)
+
+    async def ask_async(self,phase=None,round_num=None,alive_players_id=None,outlier_score=None):
+        if self.enable_cheatsheet:
+            # cheatsheet retrieval does a blocking embedding request
+            prompt=await asyncio.to_thread(self.build_prompt,phase,round_num,alive_players_id,outlier_score)
+        else:
+            prompt=self.build_prompt(phase,round_num,alive_players_id,outlier_score)
+        response=await self.ainvoke_model(prompt)
+        return self.handle_response(phase,response,round_num,alive_players_id)
+
+    def build_prompt(self,phase,round_num,alive_players_id=None,outlier_score=None):
         if phase=="description":
             print(f"Player {self.player_id} is describing his word in round {round_num}")
-            prompt=self.get_description_prompt(round_num)
-            response=self.invoke_model(prompt)
+            return self.get_description_prompt(round_num)
+
+        if phase=="reflection":
+            print(f"Player {self.player_id} is reflecting on his identity")
+            return self.get_reflection_prompt(round_num,alive_players_id,outlier_score)
+
+        if phase=="vote":
+            print(f"Player {self.player_id} is voting")
+            return self.get_vote_prompt(round_num,alive_players_id)
+
+        raise ValueError(f"Invalid phase: {phase}")
+
+    def handle_response(self,phase,response,round_num,alive_players_id=None):
+        if phase=="description":
             response=json_repair.loads(response)
-            self.add_log_info({"round_num":round_num,"role":self.player_id,"phase":"description","reason":response["thinking"],"content":response["content"]})
+            self.add_log_info(DescriptionLog(round_num=round_num,role=self.player_id,phase="description",reason=response["thinking"],content=response["content"]))
             return response["content"]
         
         if phase=="reflection":
-            print(f"Player {self.player_id} is reflecting on his identity")
-            prompt=self.get_reflection_prompt(round_num,alive_players_id,outlier_score)
-            response=self.invoke_model(prompt)
             response=json_repair.loads(response)
 
             if "self_analysis" not in response or "player_analyses" not in response:
@@ -69,7 +128,7 @@ class PlayerAgent:
                     reason=value["reason"]
 
                     self.identity_info[int(key)]={"role":role_guess,"word_guess":word_guess,"reason":reason}
-                    self.add_log_info({"round_num":round_num,"role":self.player_id,"phase":"other_identity_guess","guess_player":key,"guess_role":role_guess,"guess_word":word_guess,"guess_reason":reason})
+                    self.add_log_info(IdentityGuessLog(round_num=round_num,role=self.player_id,phase="other_identity_guess",guess_player=key,guess_role=role_guess,guess_word=word_guess,guess_reason=reason))
 
             sa = response["self_analysis"]
             role_guess = sa["role_guess"]
@@ -91,26 +150,23 @@ class PlayerAgent:
                 "grounding_consistency": grounding_consistency
             }
 
-            self.add_log_info({
-                "round_num": round_num,
-                "role": self.player_id,
-                "phase": "self_identity_guess",
-                "guess_role": role_guess,
-                "guess_reason": reason,
-                "confidence": confidence,
-                "outlier_score": outlier_used,
-                "grounding_consistency": grounding_consistency
-            })
+            self.add_log_info(SelfIdentityLog(
+                round_num=round_num,
+                role=self.player_id,
+                phase="self_identity_guess",
+                guess_role=role_guess,
+                guess_reason=reason,
+                confidence=confidence,
+                outlier_score=outlier_used,
+                grounding_consistency=grounding_consistency
+            ))
             return 
 
         if phase=="vote":
-            print(f"Player {self.player_id} is voting")
-            prompt=self.get_vote_prompt(round_num,alive_players_id)
-            response=self.invoke_model(prompt)
             response=json_repair.loads(response)
             vote_target=response["vote_target"]
             vote_reason=response["vote_reason"]
-            self.add_log_info({"round_num":round_num,"role":self.player_id,"phase":"vote","vote_target":vote_target,"vote_reason":vote_reason})
+            self.add_log_info(VoteLog(round_num=round_num,role=self.player_id,phase="vote",vote_target=vote_target,vote_reason=vote_reason))
             return vote_target
         
         else:
@@ -197,13 +253,32 @@ class PlayerAgent:
     
 
     def invoke_model(self,prompt):
-        inputs = {"messages": [{"role": "user", "content": prompt}]}
-        response = self.agent.invoke(inputs)
-        response = response['messages'][-1]
-        # response = self.model.invoke(prompt)
+        if self.agent is None:
+            messages = [{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}]
+            with inflight_slot():
+                response = self.model.invoke(messages)
+        else:
+            inputs = {"messages": [{"role": "user", "content": prompt}]}
+            with inflight_slot():
+                response = self.agent.invoke(inputs)
+            response = response['messages'][-1]
         
         print(response.content)
         return response.content
+
+    async def ainvoke_model(self,prompt):
+        if self.agent is None:
+            messages = [{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}]
+            async with async_inflight_slot():
+                response = await self.model.ainvoke(messages)
+        else:
+            inputs = {"messages": [{"role": "user", "content": prompt}]}
+            async with async_inflight_slot():
+                response = await self.agent.ainvoke(inputs)
+            response = response['messages'][-1]
+
+        print(response.content)
+        return response.content
     
     def get_cheatsheet_msg(self):
         if not self.enable_cheatsheet or self.cheatsheet is None:
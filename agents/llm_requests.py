@@ -0,0 +1,248 @@
+# agents/llm_requests.py
+"""LLM请求层：对冲请求（hedged request）、截止时间与分阶段延迟统计"""
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Optional
+
+import numpy as np
+
+from .concurrency import get_max_inflight_requests
+
+# 每个阶段单次LLM请求的默认截止时间（秒），超时后抛出 TimeoutError，由调用方走降级逻辑
+PHASE_DEADLINES = {
+    "description": 120.0,
+    "reflection": 120.0,
+    "vote": 120.0,
+    "voting_reflection": 120.0,
+}
+
+# 同步主请求不经过线程池排队（不对冲时在调用方线程上执行，可能对冲时在单独的线程上立即启动），
+# 只有对冲副本进入共享线程池；线程池大小跟随 max_inflight_requests 配置，未设置上限时使用 DEFAULT_HEDGE_WORKERS
+DEFAULT_HEDGE_WORKERS = 16
+_hedge_pool: Optional[ThreadPoolExecutor] = None
+_hedge_pool_size: Optional[int] = None
+_hedge_pool_lock = threading.Lock()
+
+
+def _get_hedge_pool() -> ThreadPoolExecutor:
+    """按当前配置返回对冲线程池；配置变化时新建线程池，旧线程池中已提交的副本照常完成"""
+    global _hedge_pool, _hedge_pool_size
+    size = get_max_inflight_requests() or DEFAULT_HEDGE_WORKERS
+    with _hedge_pool_lock:
+        if _hedge_pool is None or _hedge_pool_size != size:
+            if _hedge_pool is not None:
+                _hedge_pool.shutdown(wait=False)
+            _hedge_pool = ThreadPoolExecutor(max_workers=size, thread_name_prefix="llm-hedge")
+            _hedge_pool_size = size
+        return _hedge_pool
+
+
+def _start_thread(fn, *args) -> Future:
+    """在新线程上立即运行 fn(*args)（不在线程池中排队），返回其 Future"""
+    future = Future()
+    future.set_running_or_notify_cancel()
+
+    def run():
+        try:
+            future.set_result(fn(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name="llm-primary", daemon=True).start()
+    return future
+
+
+class LatencyTracker:
+    """按阶段记录最近 window 次成功请求的延迟，并统计对冲与超时次数（线程安全）"""
+
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self._latencies: Dict[str, deque] = {}
+        self._counters: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, phase: str, seconds: float):
+        with self._lock:
+            self._latencies.setdefault(phase, deque(maxlen=self.window)).append(seconds)
+
+    def count(self, phase: str, key: str):
+        with self._lock:
+            counters = self._counters.setdefault(phase, {"hedged": 0, "hedge_wins": 0, "timeouts": 0})
+            counters[key] += 1
+
+    def percentile(self, phase: str, q: float, min_samples: int = 1) -> Optional[float]:
+        """该阶段延迟的第 q 百分位数；样本不足 min_samples 时返回None"""
+        with self._lock:
+            samples = list(self._latencies.get(phase, ()))
+        if len(samples) < max(1, min_samples):
+            return None
+        return float(np.percentile(samples, q))
+
+    def summary(self) -> Dict[str, dict]:
+        """{phase: {"count", "p50", "p95", "p99", "hedged", "hedge_wins", "timeouts"}}"""
+        with self._lock:
+            phases = {p: list(v) for p, v in self._latencies.items()}
+            counters = {p: dict(c) for p, c in self._counters.items()}
+        result = {}
+        for phase in sorted(set(phases) | set(counters)):
+            samples = phases.get(phase, [])
+            stats = {"count": len(samples)}
+            if samples:
+                p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+                stats.update(p50=float(p50), p95=float(p95), p99=float(p99))
+            stats.update(counters.get(phase, {"hedged": 0, "hedge_wins": 0, "timeouts": 0}))
+            result[phase] = stats
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._latencies.clear()
+            self._counters.clear()
+
+
+_default_tracker = LatencyTracker()
+
+
+def get_latency_tracker() -> LatencyTracker:
+    """进程内共享的延迟统计（所有玩家、所有对局）"""
+    return _default_tracker
+
+
+class HedgedRequester:
+    """包装一个聊天模型，按阶段发送带对冲和截止时间的请求
+
+    - 对冲：请求耗时超过该阶段历史延迟的 hedge_percentile 百分位（至少有 hedge_min_samples 个样本）时，
+      再发一个相同的请求，取先返回的结果。异步请求会取消另一个；同步请求中落后的一个无法中断，
+      其结果被丢弃，请求最迟在截止时间后结束
+    - 截止时间：从请求真正开始时计时，剩余时间作为 timeout 传给模型客户端；
+      超过 deadlines[phase] 秒仍无结果时抛出 TimeoutError
+    - 每个成功请求的延迟都记录到 tracker 中
+    """
+
+    def __init__(self, llm, hedge_percentile: Optional[float] = None, hedge_min_samples: int = 20,
+                 deadlines: Optional[Dict[str, float]] = None, tracker: Optional[LatencyTracker] = None):
+        self.llm = llm
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.deadlines = PHASE_DEADLINES if deadlines is None else deadlines
+        self.tracker = tracker or get_latency_tracker()
+
+    def _hedge_delay(self, phase: str) -> Optional[float]:
+        if self.hedge_percentile is None:
+            return None
+        return self.tracker.percentile(phase, self.hedge_percentile, self.hedge_min_samples)
+
+    def _timeout_error(self, phase: str, deadline: float) -> TimeoutError:
+        self.tracker.count(phase, "timeouts")
+        return TimeoutError(f"{phase} 请求超过截止时间 {deadline:g}s")
+
+    @staticmethod
+    def _remaining(start: float, deadline: Optional[float]) -> Optional[float]:
+        if deadline is None:
+            return None
+        return max(0.0, start + deadline - time.perf_counter())
+
+    def _call(self, messages, start: float, deadline: Optional[float]):
+        """在当前线程上发送一次请求，截止前的剩余时间作为该请求的超时"""
+        remaining = self._remaining(start, deadline)
+        if remaining is None:
+            return self.llm.invoke(messages)
+        if remaining <= 0:
+            raise TimeoutError("已超过截止时间")
+        return self.llm.invoke(messages, timeout=remaining)
+
+    def invoke(self, messages, phase: str):
+        deadline = self.deadlines.get(phase)
+        hedge_delay = self._hedge_delay(phase)
+        start = time.perf_counter()
+
+        if hedge_delay is None:
+            # 不会对冲：直接在调用方线程上请求
+            try:
+                response = self._call(messages, start, deadline)
+            except Exception as e:
+                if deadline is not None and time.perf_counter() - start >= deadline:
+                    raise self._timeout_error(phase, deadline) from e
+                raise
+            self.tracker.record(phase, time.perf_counter() - start)
+            return response
+
+        # 可能对冲：主请求在单独的线程上立即启动，调用方等待先完成的一个
+        primary = _start_thread(self._call, messages, start, deadline)
+        pending = {primary}
+        hedged = False
+        try:
+            while True:
+                now = time.perf_counter()
+                waits = [] if hedged else [start + hedge_delay - now]
+                if deadline is not None:
+                    waits.append(start + deadline - now)
+                timeout = max(0.0, min(waits)) if waits else None
+                if deadline is not None and now - start >= deadline:
+                    raise self._timeout_error(phase, deadline)
+
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                # 先取出所有异常，避免失败的副本留下未处理的异常
+                errors = [future.exception() for future in done]
+                for future, error in zip(done, errors):
+                    if error is None:
+                        self.tracker.record(phase, time.perf_counter() - start)
+                        if future is not primary:
+                            self.tracker.count(phase, "hedge_wins")
+                        return future.result()
+                if not pending:
+                    if deadline is not None and time.perf_counter() - start >= deadline:
+                        raise self._timeout_error(phase, deadline) from errors[0]
+                    raise errors[0]
+
+                if not hedged and time.perf_counter() - start >= hedge_delay:
+                    hedged = True
+                    self.tracker.count(phase, "hedged")
+                    pending.add(_get_hedge_pool().submit(self._call, messages, start, deadline))
+        finally:
+            # 只能取消还在排队的副本；已在运行的请求带有截止时间，到期后自行结束
+            for future in pending:
+                future.cancel()
+
+    async def ainvoke(self, messages, phase: str):
+        deadline = self.deadlines.get(phase)
+        hedge_delay = self._hedge_delay(phase)
+        start = time.perf_counter()
+
+        primary = asyncio.ensure_future(self.llm.ainvoke(messages))
+        pending = {primary}
+        hedged = False
+        try:
+            while True:
+                now = time.perf_counter()
+                waits = []
+                if deadline is not None:
+                    waits.append(start + deadline - now)
+                if not hedged and hedge_delay is not None:
+                    waits.append(start + hedge_delay - now)
+                timeout = max(0.0, min(waits)) if waits else None
+                if deadline is not None and now - start >= deadline:
+                    raise self._timeout_error(phase, deadline)
+
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                # 先取出所有异常，避免失败的副本留下未处理的异常
+                errors = [task.exception() for task in done]
+                for task, error in zip(done, errors):
+                    if error is None:
+                        self.tracker.record(phase, time.perf_counter() - start)
+                        if task is not primary:
+                            self.tracker.count(phase, "hedge_wins")
+                        return task.result()
+                if not pending:
+                    raise errors[0]
+
+                if not hedged and hedge_delay is not None and time.perf_counter() - start >= hedge_delay:
+                    hedged = True
+                    self.tracker.count(phase, "hedged")
+                    pending.add(asyncio.ensure_future(self.llm.ainvoke(messages)))
+        finally:
+            for task in pending:
+                task.cancel()
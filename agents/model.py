@@ -1,8 +1,42 @@
 # agents/model.py
 """Model class for LLM initialization"""
+import threading
 from langchain_openai import ChatOpenAI
 from typing import Optional
 
+# 按配置共享的 ChatOpenAI 客户端，所有玩家和对局复用同一个（及其连接池）
+_llm_pool = {}
+_llm_pool_lock = threading.Lock()
+
+
+def get_shared_llm(
+    api_key: str,
+    base_url: str,
+    model: str,
+    temperature: float = 0.7,
+    max_tokens: Optional[int] = None,
+    timeout: Optional[float] = 60.0
+) -> ChatOpenAI:
+    """
+    获取（必要时创建）与该配置对应的共享ChatOpenAI客户端
+
+    以 (api_key, base_url, model, temperature, max_tokens, timeout) 为键缓存，
+    ChatOpenAI 本身无状态，可以在线程和协程之间共享。
+    """
+    key = (api_key, base_url, model, temperature, max_tokens, timeout)
+    with _llm_pool_lock:
+        llm = _llm_pool.get(key)
+        if llm is None:
+            llm = _llm_pool[key] = ChatOpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                model=model,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                timeout=timeout
+            )
+        return llm
+
 
 class GameModel:
     
@@ -13,23 +47,34 @@ class GameModel:
         model: str = "Qwen/Qwen2.5-32B-Instruct",
         temperature: float = 0.7,
         max_tokens: Optional[int] = None,
-        timeout: Optional[float] = 60.0
+        timeout: Optional[float] = 60.0,
+        shared: bool = True,
+        hedge_percentile: Optional[float] = None
     ):
+        """
+        Args:
+            shared: 为True时复用相同配置的共享客户端（见get_shared_llm），为False时单独创建
+            hedge_percentile: 请求耗时超过该阶段历史延迟的这个百分位（例如95）时发送对冲请求，None表示不对冲
+        """
         self.api_key = api_key
         self.base_url = base_url
         self.model_name = model
         self.temperature = temperature
         self.max_tokens = max_tokens
         self.timeout = timeout
+        self.hedge_percentile = hedge_percentile
         
-        self.llm = ChatOpenAI(
-            api_key=api_key,
-            base_url=base_url,
-            model=model,
-            temperature=temperature,
-            max_tokens=max_tokens,
-            timeout=timeout
-        )
+        if shared:
+            self.llm = get_shared_llm(api_key, base_url, model, temperature, max_tokens, timeout)
+        else:
+            self.llm = ChatOpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                model=model,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                timeout=timeout
+            )
     
     def get_llm(self) -> ChatOpenAI:
         return self.llm
@@ -2,9 +2,13 @@
 from typing import List, Dict, Optional
 from langchain_core.messages import HumanMessage
 from .model import GameModel
+from .llm_requests import HedgedRequester
+from .agent_memory import AgentMemory, normalize_player_id
+from .event_log import PublicEventLog
 import json_repair
 import json
 import os
+import threading
 
 from prompts import (
     get_description_user_prompt,
@@ -15,19 +19,10 @@ from prompts.identity_reflection_prompts import get_identity_reflection_prompt,
 
 class PlayerAgent:
     def _normalize_player_id(self, key):
-        if isinstance(key, int):
-            return key
-        if isinstance(key, str):
-            cleaned = (
-                key.lower()
-                .replace("player_", "")
-                .replace("player ", "")
-                .replace("玩家", "")
-                .strip()
-            )
-            return int(cleaned)
-        raise ValueError(f"无法解析 player_id: {key}")
-    def __init__(self, player_id: int, name: str, word: str, model: Optional[GameModel] = None):
+        return normalize_player_id(key)
+
+    def __init__(self, player_id: int, name: str, word: str, model: Optional[GameModel] = None,
+                 public_logs: Optional[Dict[str, PublicEventLog]] = None):
         """初始化玩家智能体
         
         Args:
@@ -35,6 +30,7 @@ class PlayerAgent:
             name: 玩家名称
             word: 玩家的词汇
             model: GameModel实例，如果为None则使用默认配置创建
+            public_logs: 本局共享的公开记录（new_public_logs()），为None时Agent使用自己的记录
         """
         self.player_id = player_id
         self.name = name
@@ -49,23 +45,50 @@ class PlayerAgent:
             self.model = GameModel()
             self.llm = self.model.get_llm()
         
+        # 所有LLM请求经过请求层：按阶段的截止时间、可选的对冲请求和延迟统计
+        self.requester = HedgedRequester(self.llm, hedge_percentile=getattr(self.model, "hedge_percentile", None))
+        
         # 记忆系统：存储所有历史对话、投票记录和推理过程
-        self.memory = {
-            "all_descriptions": [],  # 存储所有轮次中所有玩家的描述
-            # 格式: [{"round": 1, "player_id": 1, "description": "...", "name": "玩家1"}, ...]
-            "description_thinking_history": [],  # 存储每轮描述前的思考和描述
-            # 格式: [{"round": 1, "thinking": "在给出最终描述前的思考", "description": "描述内容"}, ...]
-            "voting_history": [],  # 存储自己的投票历史（投给了谁，包含完整的reason）
-            # 格式: [{"round": 1, "target_id": 2, "target_name": "玩家2", "vote_number": 1, "reason": "..."}, ...]
-            "voting_thinking_history": [],  # 存储投票阶段的思考过程
-            # 格式: [{"round": 1, "thinking": "在做出最终投票决策前的思考过程..."}, ...]
-            "all_votes_history": [],  # 存储所有人的投票记录
-            # 格式: [{"round": 1, "votes": [{"voter_id": 1, "target_id": 2, "voter_name": "玩家1", "target_name": "玩家2"}, ...]}, ...]
-            "player_analyses": [],  # 存储每轮对每个其他玩家的完整分析（包含word_guess, role_guess等）
-            # 格式: [{"round": 1, "analyses": {"1": {"word_guess": "...", "word_reason": "...", "role_guess": "...", "role_reason": "..."}, ...}}, ...]
-            "self_analyses": [],  # 存储每轮对自己的完整分析（新格式）
-            # 格式: [{"round": 1, "analysis": {"role_guess": "...", "role_reason": "..."}}, ...]
-        }
+        # AgentMemory 仍是按下列键组织的 dict（序列化格式不变），另外按轮次和玩家建立索引
+        self.memory = AgentMemory(public_logs)
+        # 反思结果写入记忆的令牌：阶段结束（或不再等待某次反思）时更新令牌，之后才完成的旧反思不再写入记忆
+        self._reflection_token = 0
+        self._reflection_lock = threading.Lock()
+        # 各键的格式（all_descriptions 和 all_votes_history 是本局公开记录的视图，不是各自的副本）:
+        # all_descriptions: 存储所有轮次中所有玩家的描述
+        #   格式: [{"round": 1, "player_id": 1, "description": "...", "name": "玩家1"}, ...]
+        # description_thinking_history: 存储每轮描述前的思考和描述
+        #   格式: [{"round": 1, "thinking": "在给出最终描述前的思考", "description": "描述内容"}, ...]
+        # voting_history: 存储自己的投票历史（投给了谁，包含完整的reason）
+        #   格式: [{"round": 1, "target_id": 2, "target_name": "玩家2", "vote_number": 1, "reason": "..."}, ...]
+        # voting_thinking_history: 存储投票阶段的思考过程
+        #   格式: [{"round": 1, "thinking": "在做出最终投票决策前的思考过程..."}, ...]
+        # all_votes_history: 存储所有人的投票记录
+        #   格式: [{"round": 1, "votes": [{"voter_id": 1, "target_id": 2, "voter_name": "玩家1", "target_name": "玩家2"}, ...]}, ...]
+        # player_analyses: 存储每轮对每个其他玩家的完整分析（包含word_guess, role_guess等）
+        #   格式: [{"round": 1, "analyses": {"1": {"word_guess": "...", "word_reason": "...", "role_guess": "...", "role_reason": "..."}, ...}}, ...]
+        # self_analyses: 存储每轮对自己的完整分析（新格式）
+        #   格式: [{"round": 1, "analysis": {"role_guess": "...", "role_reason": "..."}}, ...]
+    
+    def open_reflections(self) -> int:
+        """使之前发出的反思全部过期，返回新的令牌（之后发出的反思带上它）"""
+        with self._reflection_lock:
+            self._reflection_token += 1
+            return self._reflection_token
+    
+    def close_reflections(self):
+        """使所有未完成的反思过期：正在写入的反思先写完，之后完成的反思不再写入记忆"""
+        self.open_reflections()
+    
+    def _reflection_stale(self, token: Optional[int]) -> bool:
+        return token is not None and token != self._reflection_token
+    
+    def _apply_reflection(self, token: Optional[int], parse, *args) -> Optional[dict]:
+        """令牌仍有效时解析反思结果并写入记忆（整体在锁内完成，不会与 close_reflections 交错）"""
+        with self._reflection_lock:
+            if self._reflection_stale(token):
+                return None
+            return parse(*args)
     
     def add_to_memory(self, round_num: int, descriptions: List[dict] = None, 
                      vote_record: dict = None, all_votes: List[dict] = None,
@@ -84,13 +107,10 @@ class PlayerAgent:
         """
         if descriptions:
             for desc in descriptions:
-                memory_entry = {
-                    "round": round_num,
-                    "player_id": desc["player_id"],
-                    "description": desc["description"],
-                    "name": desc.get("name", f"玩家{desc['player_id']}")
-                }
-                self.memory["all_descriptions"].append(memory_entry)
+                self.memory.add_description(
+                    round_num, desc["player_id"], desc["description"],
+                    desc.get("name", f"玩家{desc['player_id']}")
+                )
         
         if vote_record:
             voting_entry = {
@@ -100,62 +120,27 @@ class PlayerAgent:
                 "vote_number": vote_record.get("vote_number", 1),
                 "reason": vote_record.get("reason", "无理由")
             }
-            self.memory["voting_history"].append(voting_entry)
+            self.memory.add_vote(voting_entry)
         
         if all_votes:
-            votes_entry = {
-                "round": round_num,
-                "votes": all_votes  # [{"voter_id": int, "target_id": int, "voter_name": str, "target_name": str}, ...]
-            }
-            self.memory["all_votes_history"].append(votes_entry)
+            # [{"voter_id": int, "target_id": int, "voter_name": str, "target_name": str}, ...]
+            self.memory.add_round_votes(round_num, all_votes)
         
         if player_analyses is not None:
-            # 查找当前轮是否已有条目
-            existing_entry = None
-            for entry in self.memory["player_analyses"]:
-                if entry.get("round") == round_num:
-                    existing_entry = entry
-                    break
-            if existing_entry:
-                # 如果存在当前轮的条目，按玩家ID更新分析（相同key则更新value）
-                existing_analyses = existing_entry.get("analyses", {})
-                # 更新或添加每个玩家的分析
-                for player_id, analysis in player_analyses.items():
-                    existing_analyses[player_id] = analysis
-                existing_entry["analyses"] = existing_analyses
-            else:
-                # 如果不存在当前轮的条目，创建新条目
-                analyses_entry = {
-                    "round": round_num,
-                    "analyses": player_analyses.copy()  # {player_id: {"word_guess": str, "word_reason": str, "role_guess": str, "role_reason": str}, ...}
-                }
-                self.memory["player_analyses"].append(analyses_entry)
+            # 当前轮已有条目时按玩家ID更新分析（相同key则更新value），否则创建新条目
+            # {player_id: {"word_guess": str, "word_reason": str, "role_guess": str, "role_reason": str}, ...}
+            self.memory.merge_player_analyses(round_num, player_analyses)
         
         if self_analysis is not None:
-            # 先移除当前轮的所有旧条目（防止重复）
-            self.memory["self_analyses"] = [
-                a for a in self.memory["self_analyses"] 
-                if a.get("round") != round_num
-            ]
-            # 添加新分析
-            self_analysis_entry = {
-                "round": round_num,
-                "analysis": self_analysis  # {"role_guess": str, "role_reason": str}
-            }
-            self.memory["self_analyses"].append(self_analysis_entry)
+            # 替换当前轮的所有旧条目（防止重复）
+            self.memory.set_self_analysis(round_num, self_analysis)  # {"role_guess": str, "role_reason": str}
         
         if voting_thinking is not None:
-            # 先移除当前轮的所有旧条目（防止重复）
-            self.memory["voting_thinking_history"] = [
-                t for t in self.memory["voting_thinking_history"] 
-                if t.get("round") != round_num
-            ]
-            # 添加新的思考记录
-            thinking_entry = {
+            # 替换当前轮的旧思考记录（防止重复）
+            self.memory.replace_round_entry("voting_thinking_history", {
                 "round": round_num,
                 "thinking": voting_thinking
-            }
-            self.memory["voting_thinking_history"].append(thinking_entry)
+            })
         
     def generate_description(self, round_num: int, output_dir: str = None, game_id: str = None) -> str:
         """生成对词汇的描述 - 玩家不知道自己的身份，需要通过其他人的描述推测
@@ -168,15 +153,37 @@ class PlayerAgent:
         Returns:
             str: 描述文本（从JSON响应中提取）
         """
-        # 从记忆中获取所有历史（排除当前轮）
-        all_history = [h for h in self.memory["all_descriptions"] 
-                      if h["round"] < round_num]
-        history_text = self._format_history_from_memory(all_history)
+        messages = self._build_description_messages(round_num, output_dir, game_id)
+        
+        try:
+            response = self.requester.invoke(messages, phase="description")
+            response_text = response.content.strip()
+        except Exception as e:
+            return self._description_failed(round_num, e)
+        
+        return self._parse_description_response(round_num, response_text)
+    
+    async def generate_description_async(self, round_num: int, output_dir: str = None, game_id: str = None) -> str:
+        """generate_description 的异步版本（使用 requester.ainvoke）"""
+        messages = self._build_description_messages(round_num, output_dir, game_id)
+        
+        try:
+            response = await self.requester.ainvoke(messages, phase="description")
+            response_text = response.content.strip()
+        except Exception as e:
+            return self._description_failed(round_num, e)
+        
+        return self._parse_description_response(round_num, response_text)
+    
+    def _build_description_messages(self, round_num: int, output_dir: str = None, game_id: str = None) -> List[HumanMessage]:
+        """构建描述阶段的 prompt 消息"""
+        # 从记忆中获取所有历史（排除当前轮），已结束轮次的文本块只渲染一次
+        history_text = self._format_history_before(round_num)
         
         # 从记忆中获取当前轮次已经说过的描述（排除自己）
         current_round_descriptions = [
-            h for h in self.memory["all_descriptions"] 
-            if h["round"] == round_num and h["player_id"] != self.player_id
+            h for h in self.memory.descriptions_in(round_num)
+            if h["player_id"] != self.player_id
         ]
         
         # 格式化当前轮次已说过的描述
@@ -225,29 +232,24 @@ class PlayerAgent:
         #     except Exception as e:
         #         print(f"    ⚠️  保存 description prompt 失败: {e}")
 
-        messages = [
+        return [
             HumanMessage(content=user_prompt)
         ]
-        
-        try:
-            response = self.llm.invoke(messages)
-            response_text = response.content.strip()
-        except Exception as e:
-            # 如果LLM调用超时或失败，返回默认描述
-            print(f"    ⚠️  玩家{self.player_id} 描述生成失败: {e}")
-            default_description = f"This is a description related to {self.word}."
-            # 即使失败，也记录到memory中
-            self.memory["description_thinking_history"] = [
-                entry for entry in self.memory["description_thinking_history"]
-                if entry.get("round") != round_num
-            ]
-            self.memory["description_thinking_history"].append({
-                "round": round_num,
-                "thinking": f"LLM调用失败: {e}",
-                "description": default_description
-            })
-            return default_description
-        
+    
+    def _description_failed(self, round_num: int, e: Exception) -> str:
+        """LLM调用超时或失败时，返回默认描述（同时记录到memory中）"""
+        print(f"    ⚠️  玩家{self.player_id} 描述生成失败: {e}")
+        default_description = f"This is a description related to {self.word}."
+        # 即使失败，也记录到memory中
+        self.memory.replace_round_entry("description_thinking_history", {
+            "round": round_num,
+            "thinking": f"LLM调用失败: {e}",
+            "description": default_description
+        })
+        return default_description
+    
+    def _parse_description_response(self, round_num: int, response_text: str) -> str:
+        """解析描述阶段的JSON响应，并把思考和描述保存到记忆中"""
         # 解析JSON响应，提取"thinking"和"word_description"字段
         thinking = ""
         description = ""
@@ -271,13 +273,8 @@ class PlayerAgent:
                 description = response_text.strip()
         
         # 保存思考和描述到记忆中
-        # 先移除当前轮的所有旧条目（防止重复）
-        self.memory["description_thinking_history"] = [
-            entry for entry in self.memory["description_thinking_history"]
-            if entry.get("round") != round_num
-        ]
-        # 添加新条目
-        self.memory["description_thinking_history"].append({
+        # 替换当前轮的旧条目（防止重复）
+        self.memory.replace_round_entry("description_thinking_history", {
             "round": round_num,
             "thinking": thinking,
             "description": description
@@ -288,7 +285,8 @@ class PlayerAgent:
     def reflect_on_identity(self, round_num: int, speaking_order: int, 
                            all_descriptions: List[dict], 
                            output_dir: str = None, game_id: str = None, 
-                           speaker_id: int = None) -> Optional[dict]:
+                           speaker_id: int = None, token: Optional[int] = None,
+                           history_from_memory: bool = False) -> Optional[dict]:
         """在描述阶段重新审视自己的身份（每个agent在每个其他agent发言后都会调用）
         
         Args:
@@ -298,11 +296,62 @@ class PlayerAgent:
             output_dir: 输出目录，用于保存 prompt（可选）
             game_id: 游戏ID，用于保存 prompt（可选）
             speaker_id: 触发这次 reflection 的发言者ID（可选）
+            token: open_reflections() 返回的令牌（可选）；令牌过期后结果不再写入记忆
+            history_from_memory: all_descriptions 中的历史轮次是否就是本Agent记忆中的公开记录；
+                为True时直接复用记忆里已渲染好的历史文本块
         
         Returns:
             dict: {"role_guess": "civilian"/"undercover"/"unknown", "role_reason": "...", "confidence": "high"/"medium"/"low"}
-            如果解析失败或没有前面玩家的描述，返回None
+            如果解析失败、没有前面玩家的描述或令牌已过期，返回None
         """
+        if self._reflection_stale(token):
+            return None
+        messages = self._build_identity_reflection_messages(
+            round_num, speaking_order, all_descriptions, output_dir, game_id, speaker_id, history_from_memory
+        )
+        if messages is None:
+            return None
+        
+        try:
+            response = self.requester.invoke(messages, phase="reflection")
+
+            response_text = response.content.strip()
+        except Exception as e:
+            # 如果LLM调用超时或失败，返回None（不影响游戏流程）
+            print(f"    ⚠️  玩家{self.player_id} 身份反思失败: {e}")
+            return None
+        
+        return self._apply_reflection(token, self._parse_identity_reflection_response, round_num, speaking_order, response_text)
+    
+    async def reflect_on_identity_async(self, round_num: int, speaking_order: int, 
+                                        all_descriptions: List[dict], 
+                                        output_dir: str = None, game_id: str = None, 
+                                        speaker_id: int = None, token: Optional[int] = None,
+                                        history_from_memory: bool = False) -> Optional[dict]:
+        """reflect_on_identity 的异步版本（使用 requester.ainvoke）"""
+        if self._reflection_stale(token):
+            return None
+        messages = self._build_identity_reflection_messages(
+            round_num, speaking_order, all_descriptions, output_dir, game_id, speaker_id, history_from_memory
+        )
+        if messages is None:
+            return None
+        
+        try:
+            response = await self.requester.ainvoke(messages, phase="reflection")
+            response_text = response.content.strip()
+        except Exception as e:
+            print(f"    ⚠️  玩家{self.player_id} 身份反思失败: {e}")
+            return None
+        
+        return self._apply_reflection(token, self._parse_identity_reflection_response, round_num, speaking_order, response_text)
+    
+    def _build_identity_reflection_messages(self, round_num: int, speaking_order: int, 
+                                            all_descriptions: List[dict], 
+                                            output_dir: str = None, game_id: str = None, 
+                                            speaker_id: int = None,
+                                            history_from_memory: bool = False) -> Optional[List[HumanMessage]]:
+        """构建描述阶段身份反思的 prompt 消息；没有可供审视的描述时返回None"""
         # 如果没有描述，无法进行身份审视
         if not all_descriptions or len(all_descriptions) == 0:
             return None
@@ -316,7 +365,11 @@ class PlayerAgent:
             return None
         
         # 格式化历史描述（包含投票和淘汰信息）
-        history_text = self._format_history_with_votes_and_eliminations(history_descriptions, round_num)
+        # 调用方声明历史来自记忆中的公开记录时，复用自己记忆里已渲染好的轮次文本块；否则按传入的数据渲染
+        if history_from_memory:
+            history_text = self._format_history_with_votes_before(round_num)
+        else:
+            history_text = self._format_history_with_votes_and_eliminations(history_descriptions, round_num)
         
         # Format descriptions already spoken in current round
         current_desc_text = "\n".join([
@@ -328,11 +381,8 @@ class PlayerAgent:
             return None
         
         # 获取当前轮次的旧 self_analysis（如果存在），用于基于旧判断更新
-        previous_self_analysis = None
-        for analysis in self.memory["self_analyses"]:
-            if analysis.get("round") == round_num:
-                previous_self_analysis = analysis.get("analysis")
-                break
+        current_round_self = self.memory.self_analyses_in(round_num)
+        previous_self_analysis = current_round_self[0].get("analysis") if current_round_self else None
         
         # 获取身份猜测（格式化后的文本，用于显示在 prompt 中）
         # 在身份反思时，应该基于上一轮或当前轮已有的分析进行更新
@@ -384,19 +434,13 @@ class PlayerAgent:
         #     except Exception as e:
         #         print(f"    ⚠️  保存 identity reflection prompt 失败: {e}")
         
-        messages = [
+        return [
             HumanMessage(content=reflection_prompt)
         ]
-        
-        try:
-            response = self.llm.invoke(messages)
-
-            response_text = response.content.strip()
-        except Exception as e:
-            # 如果LLM调用超时或失败，返回None（不影响游戏流程）
-            print(f"    ⚠️  玩家{self.player_id} 身份反思失败: {e}")
-            return None
-        
+    
+    def _parse_identity_reflection_response(self, round_num: int, speaking_order: int, 
+                                            response_text: str) -> Optional[dict]:
+        """解析描述阶段身份反思的响应，并更新 self_analyses / player_analyses"""
         # 解析JSON响应
         try:
             # 尝试直接解析
@@ -433,34 +477,15 @@ class PlayerAgent:
                     "phase": "description_reflection"
                 }
                 
-                # 更新记忆中的self_analyses（如果当前轮还没有，则添加；如果有，则更新）
-                # 先移除当前轮的所有旧条目（防止重复）
-                self.memory["self_analyses"] = [
-                    a for a in self.memory["self_analyses"] 
-                    if a.get("round") != round_num
-                ]
-                # 添加新分析
-                self.memory["self_analyses"].append({
-                    "round": round_num,
-                    "analysis": self_analysis
-                })
+                # 更新记忆中的self_analyses（替换当前轮的所有旧条目，防止重复）
+                self.memory.set_self_analysis(round_num, self_analysis)
                 
                 # 保存对其他玩家的分析到记忆中
                 if player_analyses_data:
                     # 更新记忆中的player_analyses（按玩家ID更新，区分阶段）
                     # 先找到当前轮、当前阶段的所有现有分析
                     phase = "description_reflection"
-                    existing_analyses_dict = {}
-                    for analysis in self.memory["player_analyses"]:
-                        if analysis.get("round") == round_num and analysis.get("phase") == phase:
-                            # 合并所有现有分析
-                            existing_analyses_dict.update(analysis.get("analyses", {}))
-                    
-                    # 移除当前轮、当前阶段的所有旧条目（防止重复）
-                    self.memory["player_analyses"] = [
-                        a for a in self.memory["player_analyses"] 
-                        if not (a.get("round") == round_num and a.get("phase") == phase)
-                    ]
+                    existing_analyses_dict = self.memory.phase_player_analyses(round_num, phase)
                     
                     # 合并旧数据和新数据（按玩家ID更新）
                     if existing_analyses_dict:
@@ -476,12 +501,8 @@ class PlayerAgent:
                         if eliminated_id_str in final_analyses:
                             final_analyses[eliminated_id_str]["role_guess"] = "eliminated"
                     
-                    # 添加分析（包含phase字段，区分阶段）
-                    self.memory["player_analyses"].append({
-                        "round": round_num,
-                        "phase": phase,
-                        "analyses": final_analyses
-                    })
+                    # 替换当前轮、当前阶段的旧条目（包含phase字段，区分阶段）
+                    self.memory.set_player_analyses(round_num, phase, final_analyses)
                 
                 return result
             else:
@@ -495,7 +516,7 @@ class PlayerAgent:
                                         current_votes: List[dict],
                                         eliminated_player: dict = None,
                                         output_dir: str = None, 
-                                        game_id: str = None) -> Optional[dict]:
+                                        game_id: str = None, token: Optional[int] = None) -> Optional[dict]:
         """在投票阶段结束后重新审视自己的身份（基于投票行为）
         
         Args:
@@ -504,15 +525,58 @@ class PlayerAgent:
             eliminated_player: 被淘汰的玩家信息（如果有），格式: {"player_id": int, "name": str, "role": str}
             output_dir: 输出目录，用于保存 prompt（可选）
             game_id: 游戏ID，用于保存 prompt（可选）
+            token: open_reflections() 返回的令牌（可选）；令牌过期后结果不再写入记忆
         
         Returns:
             dict: {"role_guess": "civilian"/"undercover"/"unknown", "role_reason": "...", "confidence": "high"/"medium"/"low"}
-            如果解析失败，返回None
+            如果解析失败或令牌已过期，返回None
         """
+        if self._reflection_stale(token):
+            return None
+        messages = self._build_voting_reflection_messages(
+            round_num, current_votes, eliminated_player, output_dir, game_id
+        )
+        
+        try:
+            response = self.requester.invoke(messages, phase="voting_reflection")
+            response_text = response.content.strip()
+        except Exception as e:
+            # 如果LLM调用超时或失败，返回None（不影响游戏流程）
+            print(f"    ⚠️  玩家{self.player_id} 投票后身份反思失败: {e}")
+            return None
+        
+        return self._apply_reflection(token, self._parse_voting_reflection_response, round_num, eliminated_player, response_text)
+    
+    async def reflect_on_identity_after_voting_async(self, round_num: int, 
+                                                     current_votes: List[dict],
+                                                     eliminated_player: dict = None,
+                                                     output_dir: str = None, 
+                                                     game_id: str = None, token: Optional[int] = None) -> Optional[dict]:
+        """reflect_on_identity_after_voting 的异步版本（使用 requester.ainvoke）"""
+        if self._reflection_stale(token):
+            return None
+        messages = self._build_voting_reflection_messages(
+            round_num, current_votes, eliminated_player, output_dir, game_id
+        )
+        
+        try:
+            response = await self.requester.ainvoke(messages, phase="voting_reflection")
+            response_text = response.content.strip()
+        except Exception as e:
+            print(f"    ⚠️  玩家{self.player_id} 投票后身份反思失败: {e}")
+            return None
+        
+        return self._apply_reflection(token, self._parse_voting_reflection_response, round_num, eliminated_player, response_text)
+    
+    def _build_voting_reflection_messages(self, round_num: int, 
+                                          current_votes: List[dict],
+                                          eliminated_player: dict = None,
+                                          output_dir: str = None, 
+                                          game_id: str = None) -> List[HumanMessage]:
+        """构建投票后身份反思的 prompt 消息"""
         # 从记忆中获取历史描述
-        history_descriptions = [h for h in self.memory["all_descriptions"] if h["round"] < round_num]
-        # 使用包含投票和淘汰信息的历史格式化方法
-        history_text = self._format_history_with_votes_and_eliminations(history_descriptions, round_num)
+        # 使用包含投票和淘汰信息的历史格式化方法（已结束轮次的文本块只渲染一次）
+        history_text = self._format_history_with_votes_before(round_num)
         
         # Format current round voting results
         current_votes_text = "Voting results this round:\n"
@@ -591,18 +655,13 @@ class PlayerAgent:
         #     except Exception as e:
         #         print(f"    ⚠️  保存 identity reflection after voting prompt 失败: {e}")
         
-        messages = [
+        return [
             HumanMessage(content=reflection_prompt)
         ]
-        
-        try:
-            response = self.llm.invoke(messages)
-            response_text = response.content.strip()
-        except Exception as e:
-            # 如果LLM调用超时或失败，返回None（不影响游戏流程）
-            print(f"    ⚠️  玩家{self.player_id} 投票后身份反思失败: {e}")
-            return None
-        
+    
+    def _parse_voting_reflection_response(self, round_num: int, eliminated_player: Optional[dict], 
+                                          response_text: str) -> Optional[dict]:
+        """解析投票后身份反思的响应，并更新 self_analyses / player_analyses"""
         # 解析JSON响应
         try:
             # 尝试直接解析
@@ -638,34 +697,15 @@ class PlayerAgent:
                     "phase": "voting_reflection"
                 }
                 
-                # 更新记忆中的self_analyses（如果当前轮还没有，则添加；如果有，则更新）
-                # 先移除当前轮的所有旧条目（防止重复）
-                self.memory["self_analyses"] = [
-                    a for a in self.memory["self_analyses"] 
-                    if not (a.get("round") == round_num and a.get("analysis", {}).get("phase") == "voting_reflection")
-                ]
-                # 添加新分析
-                self.memory["self_analyses"].append({
-                    "round": round_num,
-                    "analysis": self_analysis
-                })
+                # 更新记忆中的self_analyses（只替换当前轮投票后反思的旧条目，保留描述阶段的分析）
+                self.memory.set_self_analysis(round_num, self_analysis, phase="voting_reflection")
                 
                 # 保存对其他玩家的分析到记忆中
                 if player_analyses_data:
                     # 更新记忆中的player_analyses（按玩家ID更新，区分阶段）
                     # 先找到当前轮、当前阶段的所有现有分析
                     phase = "voting_reflection"
-                    existing_analyses_dict = {}
-                    for analysis in self.memory["player_analyses"]:
-                        if analysis.get("round") == round_num and analysis.get("phase") == phase:
-                            # 合并所有现有分析
-                            existing_analyses_dict.update(analysis.get("analyses", {}))
-                    
-                    # 移除当前轮、当前阶段的所有旧条目（防止重复）
-                    self.memory["player_analyses"] = [
-                        a for a in self.memory["player_analyses"] 
-                        if not (a.get("round") == round_num and a.get("phase") == phase)
-                    ]
+                    existing_analyses_dict = self.memory.phase_player_analyses(round_num, phase)
                     
                     # 合并旧数据和新数据（按玩家ID更新）
                     if existing_analyses_dict:
@@ -687,12 +727,8 @@ class PlayerAgent:
                         if eliminated_id_str in final_analyses:
                             final_analyses[eliminated_id_str]["role_guess"] = "eliminated"
                     
-                    # 添加分析（包含phase字段，区分阶段）
-                    self.memory["player_analyses"].append({
-                        "round": round_num,
-                        "phase": phase,
-                        "analyses": final_analyses
-                    })
+                    # 替换当前轮、当前阶段的旧条目（包含phase字段，区分阶段）
+                    self.memory.set_player_analyses(round_num, phase, final_analyses)
                 
                 return result
             else:
@@ -722,11 +758,48 @@ class PlayerAgent:
             reason 包含对所有其他玩家的详细分析过程
             vote_number 表示要投票给哪个玩家（玩家ID）
         """
-        # 从记忆中获取历史
-        history_descriptions = [h for h in self.memory["all_descriptions"] if h["round"] < round_num]
+        messages = self._build_voting_messages(
+            alive_players, descriptions, round_num, is_tie_break, tie_players, output_dir, game_id
+        )
         
-        # 格式化历史描述（包含投票和淘汰信息）
-        history_text = self._format_history_with_votes_and_eliminations(history_descriptions, round_num)
+        try:
+            response = self.requester.invoke(messages, phase="vote")
+            response_text = response.content.strip()
+        except Exception as e:
+            return self._default_vote(alive_players, round_num, e)
+        
+        # 解析响应，提取reason和vote_number
+        # 如果是平票重投，只能投票给平票玩家
+        valid_targets = tie_players if (is_tie_break and tie_players) else alive_players
+        voting_result = self._parse_voting_response(response_text, valid_targets, round_num)
+        
+        return voting_result
+    
+    async def vote_async(self, alive_players: List[int], 
+                         descriptions: List[dict], round_num: int,
+                         is_tie_break: bool = False, tie_players: List[int] = None,
+                         output_dir: str = None, game_id: str = None) -> dict:
+        """vote 的异步版本（使用 requester.ainvoke）"""
+        messages = self._build_voting_messages(
+            alive_players, descriptions, round_num, is_tie_break, tie_players, output_dir, game_id
+        )
+        
+        try:
+            response = await self.requester.ainvoke(messages, phase="vote")
+            response_text = response.content.strip()
+        except Exception as e:
+            return self._default_vote(alive_players, round_num, e)
+        
+        valid_targets = tie_players if (is_tie_break and tie_players) else alive_players
+        return self._parse_voting_response(response_text, valid_targets, round_num)
+    
+    def _build_voting_messages(self, alive_players: List[int], 
+                               descriptions: List[dict], round_num: int,
+                               is_tie_break: bool = False, tie_players: List[int] = None,
+                               output_dir: str = None, game_id: str = None) -> List[HumanMessage]:
+        """构建投票阶段的 prompt 消息"""
+        # 从记忆中获取历史，格式化历史描述（包含投票和淘汰信息，已结束轮次的文本块只渲染一次）
+        history_text = self._format_history_with_votes_before(round_num)
         
         # 格式化投票历史（自己的投票记录）
         voting_history_text = self._format_voting_history_from_memory()
@@ -788,58 +861,43 @@ class PlayerAgent:
         #     except Exception as e:
         #         print(f"    ⚠️  保存 voting prompt 失败: {e}")
         
-        messages = [
+        return [
             HumanMessage(content=user_prompt)
         ]
+    
+    def _default_vote(self, alive_players: List[int], round_num: int, e: Exception) -> dict:
+        """LLM调用超时或失败时，返回默认投票（投票给第一个存活玩家）"""
+        print(f"    ⚠️  玩家{self.player_id} 投票生成失败: {e}")
+        valid_players = [pid for pid in alive_players if pid != self.player_id]
+        if valid_players:
+            default_vote_number = valid_players[0]
+        else:
+            default_vote_number = alive_players[0] if alive_players else 1
         
-        try:
-            response = self.llm.invoke(messages)
-            response_text = response.content.strip()
-        except Exception as e:
-            # 如果LLM调用超时或失败，返回默认投票（投票给第一个存活玩家）
-            print(f"    ⚠️  玩家{self.player_id} 投票生成失败: {e}")
-            valid_players = [pid for pid in alive_players if pid != self.player_id]
-            if valid_players:
-                default_vote_number = valid_players[0]
-            else:
-                default_vote_number = alive_players[0] if alive_players else 1
-            
-            # 从记忆中获取描述阶段的推理结果
-            player_analyses = {}
-            self_analysis = {}
-            
-            if self.memory.get("self_analyses"):
-                for analysis in self.memory["self_analyses"]:
-                    if analysis.get("round") == round_num:
-                        if analysis.get("analysis"):
-                            self_analysis = analysis["analysis"]
-                        break
-            
-            if self.memory.get("player_analyses"):
-                # 优先查找描述阶段的分析，如果没有则查找投票阶段的分析
-                # 兼容旧的没有phase字段的条目
-                for analysis in self.memory["player_analyses"]:
-                    if analysis.get("round") == round_num:
-                        phase = analysis.get("phase")
-                        # 优先使用描述阶段的分析
-                        if phase == "description_reflection" or phase is None:
-                            if analysis.get("analyses"):
-                                player_analyses.update(analysis.get("analyses", {}))
-            
-            return {
-                "reason": "LLM调用失败，使用默认投票",
-                "vote_number": default_vote_number,
-                "thinking": "",
-                "player_analyses": player_analyses,
-                "self_analysis": self_analysis
-            }
+        # 从记忆中获取描述阶段的推理结果
+        player_analyses = {}
+        self_analysis = {}
         
-        # 解析响应，提取reason和vote_number
-        # 如果是平票重投，只能投票给平票玩家
-        valid_targets = tie_players if (is_tie_break and tie_players) else alive_players
-        voting_result = self._parse_voting_response(response_text, valid_targets, round_num)
+        current_round_self = self.memory.self_analyses_in(round_num)
+        if current_round_self and current_round_self[0].get("analysis"):
+            self_analysis = current_round_self[0]["analysis"]
         
-        return voting_result
+        # 优先查找描述阶段的分析，如果没有则查找投票阶段的分析
+        # 兼容旧的没有phase字段的条目
+        for analysis in self.memory.player_analyses_in(round_num):
+            phase = analysis.get("phase")
+            # 优先使用描述阶段的分析
+            if phase == "description_reflection" or phase is None:
+                if analysis.get("analyses"):
+                    player_analyses.update(analysis.get("analyses", {}))
+        
+        return {
+            "reason": "LLM调用失败，使用默认投票",
+            "vote_number": default_vote_number,
+            "thinking": "",
+            "player_analyses": player_analyses,
+            "self_analysis": self_analysis
+        }
     
     def _parse_voting_response(self, response: str, alive_players: List[int], round_num: int) -> dict:
         """解析投票响应，提取投票决策
@@ -860,40 +918,35 @@ class PlayerAgent:
         
         # 获取当前轮次的推理结果（从记忆中）
         # 找到当前轮次的 self_analyses 和 player_analyses
-        if self.memory.get("self_analyses"):
-            for analysis in self.memory["self_analyses"]:
-                if analysis.get("round") == round_num:
-                    if analysis.get("analysis"):
-                        self_analysis = analysis["analysis"]
-                    break
-        
-        if self.memory.get("player_analyses"):
-            # 优先查找描述阶段的分析，如果没有则查找投票阶段的分析
-            # 兼容旧的没有phase字段的条目
-            description_phase_analyses = {}
-            voting_phase_analyses = {}
-            no_phase_analyses = {}
-            
-            for analysis in self.memory["player_analyses"]:
-                if analysis.get("round") == round_num:
-                    phase = analysis.get("phase")
-                    if phase == "description_reflection":
-                        if analysis.get("analyses"):
-                            description_phase_analyses.update(analysis.get("analyses", {}))
-                    elif phase == "voting_reflection":
-                        if analysis.get("analyses"):
-                            voting_phase_analyses.update(analysis.get("analyses", {}))
-                    elif phase is None:  # 兼容旧的没有phase字段的条目
-                        if analysis.get("analyses"):
-                            no_phase_analyses.update(analysis.get("analyses", {}))
-            
-            # 优先使用描述阶段的分析，其次投票阶段，最后是没有phase的旧数据
-            if description_phase_analyses:
-                player_analyses.update(description_phase_analyses)
-            elif voting_phase_analyses:
-                player_analyses.update(voting_phase_analyses)
-            elif no_phase_analyses:
-                player_analyses.update(no_phase_analyses)
+        current_round_self = self.memory.self_analyses_in(round_num)
+        if current_round_self and current_round_self[0].get("analysis"):
+            self_analysis = current_round_self[0]["analysis"]
+        
+        # 优先查找描述阶段的分析，如果没有则查找投票阶段的分析
+        # 兼容旧的没有phase字段的条目
+        description_phase_analyses = {}
+        voting_phase_analyses = {}
+        no_phase_analyses = {}
+        
+        for analysis in self.memory.player_analyses_in(round_num):
+            phase = analysis.get("phase")
+            if phase == "description_reflection":
+                if analysis.get("analyses"):
+                    description_phase_analyses.update(analysis.get("analyses", {}))
+            elif phase == "voting_reflection":
+                if analysis.get("analyses"):
+                    voting_phase_analyses.update(analysis.get("analyses", {}))
+            elif phase is None:  # 兼容旧的没有phase字段的条目
+                if analysis.get("analyses"):
+                    no_phase_analyses.update(analysis.get("analyses", {}))
+        
+        # 优先使用描述阶段的分析，其次投票阶段，最后是没有phase的旧数据
+        if description_phase_analyses:
+            player_analyses.update(description_phase_analyses)
+        elif voting_phase_analyses:
+            player_analyses.update(voting_phase_analyses)
+        elif no_phase_analyses:
+            player_analyses.update(no_phase_analyses)
         
         # 直接尝试解析整个响应为JSON
         try:
@@ -970,10 +1023,13 @@ class PlayerAgent:
             "self_analysis": self_analysis
         }
     
+    _FIRST_ROUND_HISTORY_TEXT = "This is the first round, there are no historical descriptions yet. You need to carefully give the first description."
+    _FIRST_ROUND_EVENTS_TEXT = "This is the first round, there are no historical descriptions and events yet."
+    
     def _format_history_from_memory(self, history: List[dict]) -> str:
         """Format historical records from memory (including all rounds)"""
         if not history:
-            return "This is the first round, there are no historical descriptions yet. You need to carefully give the first description."
+            return self._FIRST_ROUND_HISTORY_TEXT
         
         # Organize by round
         rounds_dict = {}
@@ -983,16 +1039,38 @@ class PlayerAgent:
                 rounds_dict[round_num] = []
             rounds_dict[round_num].append(h)
         
+        return self._wrap_description_history(
+            self._render_description_round(round_num, rounds_dict[round_num])
+            for round_num in sorted(rounds_dict.keys())
+        )
+    
+    def _format_history_before(self, round_num: int) -> str:
+        """与 _format_history_from_memory(记忆中 round_num 之前的描述) 相同，但每个历史轮次的文本块只渲染一次"""
+        rounds = self.memory.description_rounds_before(round_num)
+        if not rounds:
+            return self._FIRST_ROUND_HISTORY_TEXT
+        return self._wrap_description_history(
+            self.memory.rendered(
+                "descriptions", r,
+                lambda r=r: self._render_description_round(r, self.memory.descriptions_in(r))
+            )
+            for r in rounds
+        )
+    
+    @staticmethod
+    def _wrap_description_history(round_blocks) -> str:
         text = "**⚠️ Important: Historical descriptions from previous rounds (you cannot repeat these descriptions)**:\n"
         text += "Historical conversation records (all rounds, carefully analyze each player's description patterns, but absolutely must not repeat):\n"
-        for round_num in sorted(rounds_dict.keys()):
-            text += f"\nRound {round_num}:\n"
-            for h in rounds_dict[round_num]:
-                name = h.get("name", f"Player {h['player_id']}")
-                text += f"  {name}: {h['description']}\n"
-        
+        text += "".join(round_blocks)
         text += "\n**⚠️ Warning: You must avoid repeating any content, keywords, or expressions from the above historical descriptions!**\n"
-
+        return text
+    
+    @staticmethod
+    def _render_description_round(round_num: int, descriptions: List[dict]) -> str:
+        text = f"\nRound {round_num}:\n"
+        for h in descriptions:
+            name = h.get("name", f"Player {h['player_id']}")
+            text += f"  {name}: {h['description']}\n"
         return text
     
     def _format_history_with_votes_and_eliminations(self, history_descriptions: List[dict], 
@@ -1007,15 +1085,7 @@ class PlayerAgent:
             格式化后的历史文本，包含描述、投票和淘汰信息
         """
         if not history_descriptions and not self.memory.get("all_votes_history"):
-            return "This is the first round, there are no historical descriptions and events yet."
-        
-        text_parts = []
-        
-        # Get historical voting records (excluding current round)
-        historical_votes = [
-            entry for entry in self.memory.get("all_votes_history", [])
-            if entry.get("round", 0) < current_round
-        ]
+            return self._FIRST_ROUND_EVENTS_TEXT
         
         # Organize descriptions by round
         if history_descriptions:
@@ -1027,74 +1097,102 @@ class PlayerAgent:
                 rounds_dict[round_num].append(h)
             
             # Add descriptions, votes, and elimination information for each historical round
-            for round_num in sorted(rounds_dict.keys()):
-                text_parts.append(f"\n**Round {round_num}:**")
-                
-                # Add descriptions
-                text_parts.append("[Description Phase]")
-                for h in rounds_dict[round_num]:
-                    name = h.get("name", f"Player {h['player_id']}")
-                    text_parts.append(f"  {name}: {h['description']}")
-                
-                # Add voting information (if any)
-                round_votes = next((entry for entry in historical_votes if entry.get("round") == round_num), None)
-                if round_votes:
-                    text_parts.append("\n[Voting Phase]")
-                    votes = round_votes.get("votes", [])
-                    vote_counts = {}
-                    for vote in votes:
-                        target_id = vote.get("target_id")
-                        voter_name = vote.get("voter_name", f"Player {vote.get('voter_id')}")
-                        target_name = vote.get("target_name", f"Player {target_id}")
-                        text_parts.append(f"  {voter_name} voted for {target_name}")
-                        vote_counts[target_id] = vote_counts.get(target_id, 0) + 1
-                    
-                    # Infer eliminated player (player with most votes)
-                    if vote_counts:
-                        max_votes = max(vote_counts.values())
-                        eliminated_candidates = [pid for pid, count in vote_counts.items() if count == max_votes]
-                        if len(eliminated_candidates) == 1:
-                            eliminated_id = eliminated_candidates[0]
-                            eliminated_name = next(
-                                (v.get("target_name", f"Player {eliminated_id}") 
-                                 for v in votes if v.get("target_id") == eliminated_id),
-                                f"Player {eliminated_id}"
-                            )
-                            text_parts.append(f"\n[Elimination Result]")
-                            text_parts.append(f"  Player {eliminated_id} ({eliminated_name}) was eliminated (votes: {max_votes})")
-                else:
-                    text_parts.append("\n[Voting Phase]")
-                    text_parts.append("  (Voting information for this round is unavailable)")
+            return "\n".join(
+                self._render_round_with_votes(
+                    round_num, rounds_dict[round_num],
+                    self.memory.round_votes(round_num) if round_num < current_round else None
+                )
+                for round_num in sorted(rounds_dict.keys())
+            )
         
         # If no historical descriptions but there is voting history
-        elif historical_votes:
-            text_parts.append("Historical voting records:")
+        historical_votes = self.memory.votes_before(current_round)
+        if historical_votes:
+            text_parts = ["Historical voting records:"]
             for entry in historical_votes:
                 round_num = entry.get("round", 0)
                 text_parts.append(f"\nRound {round_num} voting:")
                 votes = entry.get("votes", [])
-                vote_counts = {}
                 for vote in votes:
                     voter_name = vote.get("voter_name", f"Player {vote.get('voter_id')}")
                     target_name = vote.get("target_name", f"Player {vote.get('target_id')}")
                     text_parts.append(f"  {voter_name} voted for {target_name}")
-                    target_id = vote.get("target_id")
-                    vote_counts[target_id] = vote_counts.get(target_id, 0) + 1
                 
                 # Infer eliminated player
-                if vote_counts:
-                    max_votes = max(vote_counts.values())
-                    eliminated_candidates = [pid for pid, count in vote_counts.items() if count == max_votes]
-                    if len(eliminated_candidates) == 1:
-                        eliminated_id = eliminated_candidates[0]
-                        eliminated_name = next(
-                            (v.get("target_name", f"Player {eliminated_id}") 
-                             for v in votes if v.get("target_id") == eliminated_id),
-                            f"Player {eliminated_id}"
-                        )
-                        text_parts.append(f"  Elimination result: Player {eliminated_id} ({eliminated_name}) was eliminated (votes: {max_votes})")
-        
-        return "\n".join(text_parts) if text_parts else "This is the first round, there are no historical descriptions and events yet."
+                elimination = self._infer_elimination(votes)
+                if elimination:
+                    eliminated_id, eliminated_name, max_votes = elimination
+                    text_parts.append(f"  Elimination result: Player {eliminated_id} ({eliminated_name}) was eliminated (votes: {max_votes})")
+            return "\n".join(text_parts)
+        
+        return self._FIRST_ROUND_EVENTS_TEXT
+    
+    def _format_history_with_votes_before(self, current_round: int) -> str:
+        """与 _format_history_with_votes_and_eliminations(记忆中 current_round 之前的描述, current_round) 相同，
+        但每个历史轮次（描述+投票+淘汰）的文本块只渲染一次，之后直接复用
+        """
+        rounds = self.memory.description_rounds_before(current_round)
+        if not rounds:
+            return self._format_history_with_votes_and_eliminations([], current_round)
+        return "\n".join(
+            self.memory.rendered(
+                "descriptions_with_votes", r,
+                lambda r=r: self._render_round_with_votes(r, self.memory.descriptions_in(r), self.memory.round_votes(r))
+            )
+            for r in rounds
+        )
+    
+    def _render_round_with_votes(self, round_num: int, descriptions: List[dict], round_votes: Optional[dict]) -> str:
+        """一个历史轮次的文本块：描述、投票和淘汰结果"""
+        text_parts = [f"\n**Round {round_num}:**"]
+        
+        # Add descriptions
+        text_parts.append("[Description Phase]")
+        for h in descriptions:
+            name = h.get("name", f"Player {h['player_id']}")
+            text_parts.append(f"  {name}: {h['description']}")
+        
+        # Add voting information (if any)
+        text_parts.append("\n[Voting Phase]")
+        if round_votes:
+            votes = round_votes.get("votes", [])
+            for vote in votes:
+                target_id = vote.get("target_id")
+                voter_name = vote.get("voter_name", f"Player {vote.get('voter_id')}")
+                target_name = vote.get("target_name", f"Player {target_id}")
+                text_parts.append(f"  {voter_name} voted for {target_name}")
+            
+            # Infer eliminated player (player with most votes)
+            elimination = self._infer_elimination(votes)
+            if elimination:
+                eliminated_id, eliminated_name, max_votes = elimination
+                text_parts.append(f"\n[Elimination Result]")
+                text_parts.append(f"  Player {eliminated_id} ({eliminated_name}) was eliminated (votes: {max_votes})")
+        else:
+            text_parts.append("  (Voting information for this round is unavailable)")
+        
+        return "\n".join(text_parts)
+    
+    @staticmethod
+    def _infer_elimination(votes: List[dict]):
+        """得票唯一最多的玩家视为被淘汰，返回 (player_id, name, votes)；平票或没有投票时返回None"""
+        vote_counts = {}
+        for vote in votes:
+            target_id = vote.get("target_id")
+            vote_counts[target_id] = vote_counts.get(target_id, 0) + 1
+        if not vote_counts:
+            return None
+        max_votes = max(vote_counts.values())
+        eliminated_candidates = [pid for pid, count in vote_counts.items() if count == max_votes]
+        if len(eliminated_candidates) != 1:
+            return None
+        eliminated_id = eliminated_candidates[0]
+        eliminated_name = next(
+            (v.get("target_name", f"Player {eliminated_id}") 
+             for v in votes if v.get("target_id") == eliminated_id),
+            f"Player {eliminated_id}"
+        )
+        return eliminated_id, eliminated_name, max_votes
     
     def _format_voting_history_from_memory(self, voting_history: List[dict] = None) -> str:
         """从记忆中格式化投票历史记录
@@ -1173,37 +1271,30 @@ class PlayerAgent:
         Returns:
             格式化后的当前轮次自我分析文本（如果当前轮次没有，则返回最近一轮的分析）
         """
-        self_analyses_history = self.memory.get("self_analyses", [])
-        
         # First, look for current round's analysis
-        for analysis_entry in self_analyses_history:
-            if analysis_entry.get("round") == round_num:
-                self_analysis = analysis_entry.get("analysis", {})
-                if self_analysis:
-                    role_guess = self_analysis.get("role_guess", "unknown")
-                    role_en = "civilian" if role_guess == "civilian" else ("undercover" if role_guess == "undercover" else "unknown")
-                    role_reason = self_analysis.get("role_reason", "No reason")
-                    confidence = self_analysis.get("confidence", "medium")
-                    confidence_en = {"high": "high", "medium": "medium", "low": "low"}.get(confidence, "medium")
-                    
-                    return f"Identity guess: {role_en}\nReason: {role_reason}\nConfidence: {confidence_en}"
+        for analysis_entry in self.memory.self_analyses_in(round_num):
+            self_analysis = analysis_entry.get("analysis", {})
+            if self_analysis:
+                role_guess = self_analysis.get("role_guess", "unknown")
+                role_en = "civilian" if role_guess == "civilian" else ("undercover" if role_guess == "undercover" else "unknown")
+                role_reason = self_analysis.get("role_reason", "No reason")
+                confidence = self_analysis.get("confidence", "medium")
+                confidence_en = {"high": "high", "medium": "medium", "low": "low"}.get(confidence, "medium")
+                
+                return f"Identity guess: {role_en}\nReason: {role_reason}\nConfidence: {confidence_en}"
         
         # If current round has no analysis, find the most recent round's analysis (previous round)
-        if self_analyses_history:
-            # Sort by round, get the most recent round's analysis
-            sorted_analyses = sorted(self_analyses_history, key=lambda x: x.get("round", 0), reverse=True)
-            for analysis_entry in sorted_analyses:
-                if analysis_entry.get("round") < round_num:  # Only look for previous rounds
-                    self_analysis = analysis_entry.get("analysis", {})
-                    if self_analysis:
-                        analysis_round = analysis_entry.get("round", 0)
-                        role_guess = self_analysis.get("role_guess", "unknown")
-                        role_en = "civilian" if role_guess == "civilian" else ("undercover" if role_guess == "undercover" else "unknown")
-                        role_reason = self_analysis.get("role_reason", "No reason")
-                        confidence = self_analysis.get("confidence", "medium")
-                        confidence_en = {"high": "high", "medium": "medium", "low": "low"}.get(confidence, "medium")
-                        
-                        return f"(Analysis from Round {analysis_round}) Identity guess: {role_en}\nReason: {role_reason}\nConfidence: {confidence_en}"
+        analysis_entry = self.memory.latest_self_analysis_before(round_num)
+        if analysis_entry:
+            self_analysis = analysis_entry["analysis"]
+            analysis_round = analysis_entry.get("round", 0)
+            role_guess = self_analysis.get("role_guess", "unknown")
+            role_en = "civilian" if role_guess == "civilian" else ("undercover" if role_guess == "undercover" else "unknown")
+            role_reason = self_analysis.get("role_reason", "No reason")
+            confidence = self_analysis.get("confidence", "medium")
+            confidence_en = {"high": "high", "medium": "medium", "low": "low"}.get(confidence, "medium")
+            
+            return f"(Analysis from Round {analysis_round}) Identity guess: {role_en}\nReason: {role_reason}\nConfidence: {confidence_en}"
         
         return "No guess about your own identity yet."
     
@@ -1213,36 +1304,10 @@ class PlayerAgent:
         Returns:
             所有玩家ID列表（排除自己），按ID排序
         """
-        all_player_ids = set()
-        
-        # 从所有描述中获取玩家ID
-        for desc in self.memory.get("all_descriptions", []):
-            player_id = desc.get("player_id")
-            if player_id and player_id != self.player_id:
-                all_player_ids.add(player_id)
-        
-        # 从所有投票记录中获取玩家ID
-        for vote_entry in self.memory.get("all_votes_history", []):
-            for vote in vote_entry.get("votes", []):
-                voter_id = vote.get("voter_id")
-                target_id = vote.get("target_id")
-                if voter_id and voter_id != self.player_id:
-                    all_player_ids.add(voter_id)
-                if target_id and target_id != self.player_id:
-                    all_player_ids.add(target_id)
-        
-        # 从分析记录中获取玩家ID
-        for analysis_entry in self.memory.get("player_analyses", []):
-            analyses = analysis_entry.get("analyses", {})
-            for key in analyses.keys():
-                try:
-                    player_id = self._normalize_player_id(key)
-                    if player_id != self.player_id:
-                        all_player_ids.add(player_id)
-                except Exception:
-                    continue
-        
-        return sorted(list(all_player_ids))
+        # 描述、投票记录和分析记录中出现过的玩家ID由记忆索引维护
+        all_player_ids = self.memory.known_players()
+        all_player_ids.discard(self.player_id)
+        return sorted(all_player_ids)
     
     def _get_eliminated_players_from_memory(self, current_round: int) -> List[int]:
         """从记忆中推断被淘汰的玩家ID（基于投票历史）
@@ -1253,34 +1318,8 @@ class PlayerAgent:
         Returns:
             被淘汰的玩家ID列表，按ID排序
         """
-        eliminated_players = []
-        
-        # 从投票历史中推断被淘汰的玩家（得票最多的玩家）
-        for vote_entry in self.memory.get("all_votes_history", []):
-            round_num = vote_entry.get("round", 0)
-            if round_num >= current_round:
-                continue  # 跳过当前轮次及之后的轮次
-            
-            votes = vote_entry.get("votes", [])
-            if not votes:
-                continue
-            
-            # 统计得票数
-            vote_counts = {}
-            for vote in votes:
-                target_id = vote.get("target_id")
-                if target_id:
-                    vote_counts[target_id] = vote_counts.get(target_id, 0) + 1
-            
-            # 找出得票最多的玩家（被淘汰）
-            if vote_counts:
-                max_votes = max(vote_counts.values())
-                eliminated_candidates = [pid for pid, count in vote_counts.items() if count == max_votes]
-                # 如果只有一个得票最多的玩家，则被淘汰
-                if len(eliminated_candidates) == 1:
-                    eliminated_players.append(eliminated_candidates[0])
-        
-        return sorted(list(set(eliminated_players)))
+        # 每轮得票唯一最多的玩家在写入投票记录时就已推断好
+        return self.memory.eliminated_before(current_round)
     
     def _format_current_player_analyses_from_memory(self, round_num: int, alive_players: Optional[List[int]] = None) -> str:
         """从记忆中格式化当前轮次对其他玩家的分析（描述阶段的推理结果）
@@ -1294,8 +1333,6 @@ class PlayerAgent:
         Returns:
             格式化后的当前轮次对其他玩家的分析文本（如果当前轮次没有，则返回最近一轮的分析）
         """
-        player_analyses_history = self.memory.get("player_analyses", [])
-        
         # 确定要显示的所有玩家（排除自己）
         if alive_players is None:
             # 如果没有指定存活玩家，从memory中推断所有玩家
@@ -1313,16 +1350,15 @@ class PlayerAgent:
         voting_phase_analyses = {}
         no_phase_analyses = {}
         
-        for analysis_entry in player_analyses_history:
-            if analysis_entry.get("round") == round_num:
-                phase = analysis_entry.get("phase")
-                analyses = analysis_entry.get("analyses", {})
-                if phase == "description_reflection":
-                    description_phase_analyses.update(analyses)
-                elif phase == "voting_reflection":
-                    voting_phase_analyses.update(analyses)
-                elif phase is None:  # 兼容旧的没有phase字段的条目
-                    no_phase_analyses.update(analyses)
+        for analysis_entry in self.memory.player_analyses_in(round_num):
+            phase = analysis_entry.get("phase")
+            analyses = analysis_entry.get("analyses", {})
+            if phase == "description_reflection":
+                description_phase_analyses.update(analyses)
+            elif phase == "voting_reflection":
+                voting_phase_analyses.update(analyses)
+            elif phase is None:  # 兼容旧的没有phase字段的条目
+                no_phase_analyses.update(analyses)
         
         # 优先使用描述阶段的分析，其次投票阶段，最后是没有phase的旧数据
         if description_phase_analyses:
@@ -1334,14 +1370,12 @@ class PlayerAgent:
         
         # 如果当前轮次没有分析，查找最近一轮的分析
         analysis_round = None
-        if not current_analyses and player_analyses_history:
-            # 按轮次排序，获取最近一轮的分析
-            sorted_analyses = sorted(player_analyses_history, key=lambda x: x.get("round", 0), reverse=True)
-            for analysis_entry in sorted_analyses:
-                if analysis_entry.get("round") < round_num:  # 只查找之前的轮次
-                    current_analyses = analysis_entry.get("analyses", {})
-                    analysis_round = analysis_entry.get("round", 0)
-                    break
+        if not current_analyses:
+            # 只查找之前的轮次，取最近一轮的分析
+            analysis_entry = self.memory.latest_player_analyses_before(round_num)
+            if analysis_entry:
+                current_analyses = analysis_entry.get("analyses", {})
+                analysis_round = analysis_entry.get("round", 0)
         
         # 获取被淘汰的玩家列表（用于检查玩家是否被淘汰）
         eliminated_players = self._get_eliminated_players_from_memory(round_num)
@@ -0,0 +1,157 @@
+# agents/records.py
+"""Compact record types for the events a game produces in bulk.
+
+Descriptions, votes, host messages and player logs used to be dicts with
+the same handful of string keys, one hash table per event and per copy.
+These records are slotted dataclasses (a few pointers each, no per-instance
+``__dict__``) that still behave like the dicts they replace:
+``record["round"]``, ``record.get(...)``, ``dict(record)``, ``{**record}``,
+``==`` against a dict and a dict-style ``repr``. Fields are declared in the
+key order of the old dicts, so ``to_plain`` / ``json_default`` serialize
+them exactly as before.
+"""
+from collections.abc import MutableMapping
+from dataclasses import dataclass, fields
+from typing import Any, List
+
+from .event_log import EventLogView
+
+
+class Record(MutableMapping):
+    """Mapping view over the fields of a slotted dataclass (fixed keys: no adding or deleting)."""
+
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if key not in self.__dataclass_fields__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self.__dataclass_fields__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __delitem__(self, key):
+        raise TypeError(f"{type(self).__name__} fields cannot be deleted")
+
+    def __iter__(self):
+        return iter(self.__dataclass_fields__)
+
+    def __len__(self):
+        return len(self.__dataclass_fields__)
+
+    def __contains__(self, key):
+        return key in self.__dataclass_fields__
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in self.__dataclass_fields__}
+
+
+def record(cls):
+    """``@dataclass`` with ``__slots__``, keeping ``Record``'s dict-style ``==`` and ``repr``.
+
+    ``dataclass(slots=True)`` needs Python 3.10, so the slotted class is built
+    by hand the same way: recreate it with one slot per field.
+    """
+    cls = dataclass(eq=False, repr=False)(cls)
+    names = tuple(f.name for f in fields(cls))
+    namespace = {k: v for k, v in cls.__dict__.items() if k not in names + ("__dict__", "__weakref__")}
+    namespace["__slots__"] = names
+    return type(cls)(cls.__name__, cls.__bases__, namespace)
+
+
+def json_default(obj):
+    """``default=`` hook for ``json.dump``: records become objects, log views become arrays."""
+    if isinstance(obj, Record):
+        return obj.to_dict()
+    if isinstance(obj, EventLogView):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def to_plain(obj):
+    """Deep copy of ``obj`` with records turned into dicts and log views into lists."""
+    if isinstance(obj, (Record, dict)):
+        return {key: to_plain(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple, EventLogView)):
+        return [to_plain(value) for value in obj]
+    return obj
+
+
+# ---------- graph engine (agents/player_agent.py, graph/) ----------
+
+@record
+class DescriptionRecord(Record):
+    round: int
+    player_id: int
+    description: str
+    name: str
+
+
+@record
+class VoteRecord(Record):
+    voter_id: int
+    target_id: int
+    voter_name: str
+    target_name: str
+
+
+@record
+class RoundVotes(Record):
+    round: int
+    votes: List[VoteRecord]
+
+
+# ---------- legacy runners (single_model_game.py, multi_model_game.py) ----------
+
+@record
+class PublicMessage(Record):
+    round_num: int
+    role: Any  # "host" or the speaking player's id
+    phase: str
+    content: Any
+
+
+@record
+class DescriptionLog(Record):
+    round_num: int
+    role: int
+    phase: str
+    reason: Any
+    content: Any
+
+
+@record
+class IdentityGuessLog(Record):
+    round_num: int
+    role: int
+    phase: str
+    guess_player: str
+    guess_role: Any
+    guess_word: Any
+    guess_reason: Any
+
+
+@record
+class SelfIdentityLog(Record):
+    round_num: int
+    role: int
+    phase: str
+    guess_role: Any
+    guess_reason: Any
+    confidence: Any
+    outlier_score: Any
+    grounding_consistency: Any
+
+
+@record
+class VoteLog(Record):
+    round_num: int
+    role: int
+    phase: str
+    vote_target: Any
+    vote_reason: Any
@@ -0,0 +1,80 @@
+# agents/reflection_schedule.py
+"""When players re-examine their identity during the description phase.
+
+``every_speaker`` (the original behaviour) makes every other alive player
+reflect after each description, i.e. N*(N-1) reflection calls per round.
+``per_round`` reflects once, after the last description, and ``every_k``
+after every k-th speaker (and after the last one), so a round costs N or
+about N*N/k calls instead.
+"""
+
+REFLECTION_MODES = ("every_speaker", "per_round", "every_k")
+
+
+class ReflectionSchedule:
+    def __init__(self, mode="every_speaker", k=1):
+        if mode not in REFLECTION_MODES:
+            raise ValueError(f"Unknown reflection schedule: {mode} (expected one of {REFLECTION_MODES})")
+        if mode == "every_k" and k < 1:
+            raise ValueError("every_k needs k >= 1")
+        self.mode = mode
+        self.k = k
+
+    @classmethod
+    def parse(cls, value):
+        """Build a schedule from a config value: ``None`` / ``"every_speaker"``,
+        ``"per_round"``, an int ``k`` or ``"every_k"``-style strings like ``"every_3"``."""
+        if isinstance(value, cls):
+            return value
+        if value is None or value == "every_speaker":
+            return cls()
+        if value == "per_round":
+            return cls("per_round")
+        if isinstance(value, int):
+            return cls("every_k", value)
+        if isinstance(value, str) and value.startswith("every_") and value[6:].isdigit():
+            return cls("every_k", int(value[6:]))
+        raise ValueError(f"Unknown reflection schedule: {value!r}")
+
+    def is_checkpoint(self, position, total):
+        """Whether players reflect after the ``position``-th (1-based) of ``total`` speakers."""
+        if self.mode == "every_speaker":
+            return True
+        if self.mode == "per_round":
+            return position == total
+        return position % self.k == 0 or position == total
+
+    def start_round(self, player_ids):
+        return RoundReflections(self, player_ids)
+
+    def __repr__(self):
+        return f"ReflectionSchedule({self.mode!r}, k={self.k})" if self.mode == "every_k" \
+            else f"ReflectionSchedule({self.mode!r})"
+
+
+class RoundReflections:
+    """Tracks, within one round, which descriptions each player has not reflected on yet.
+
+    ``record(speaker_id)`` returns the players (in ``player_ids`` order) that
+    should reflect now: at a checkpoint, everyone who heard at least one other
+    player since their last reflection. With ``every_speaker`` that is exactly
+    "everyone but the speaker", as before.
+    """
+
+    def __init__(self, schedule, player_ids):
+        self.schedule = schedule
+        self.total = len(player_ids)
+        self.spoken = 0
+        self.unseen = {pid: [] for pid in player_ids}
+
+    def record(self, speaker_id):
+        self.spoken += 1
+        for pid, unseen in self.unseen.items():
+            if pid != speaker_id:
+                unseen.append(speaker_id)
+        if not self.schedule.is_checkpoint(self.spoken, self.total):
+            return []
+        due = [pid for pid, unseen in self.unseen.items() if unseen]
+        for pid in due:
+            self.unseen[pid] = []
+        return due
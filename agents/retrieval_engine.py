@@ -1,38 +1,137 @@
 # agents/retrieval_engine.py
+import json
 import numpy as np
 import faiss
 import os
-from agents.sf_embeddings import SiliconFlowEmbeddings
+import threading
+import uuid
+from contextlib import contextmanager
+from agents.embeddings import make_embeddings
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
 
 PCA_DIM = 128
+QUERY_CACHE_SIZE = 1024
 # INDEX_PATH = "cheatsheet.index"
 # TEXT_PATH = "cheatsheet_texts.json"
 # PCA_PATH = "cheatsheet_pca.npy"
 
 
+EVICTION_POLICIES = ("fifo", "lru", "utility")
+
+
+def atomic_write(path, write):
+    """Call ``write(tmp_path)``, fsync the result and rename it over ``path``.
+
+    Readers see either the old file or the complete new one, never a partial write.
+    """
+    tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        write(tmp)
+        fd = os.open(tmp, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+@contextmanager
+def file_lock(path):
+    """Exclusive advisory lock on ``path`` (created if missing), held across processes."""
+    with open(path, "a", encoding="utf-8") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _write_json(obj, **kwargs):
+    def write(path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(obj, f, ensure_ascii=False, **kwargs)
+    return write
+
+
+def _write_npy(arr):
+    def write(path):
+        with open(path, "wb") as f:
+            np.save(f, arr)
+    return write
+
+
 class RetrievalEngine:
-    def __init__(self, api_key, base_url, embedding_model="BAAI/bge-m3",prefix="default"):
-        self.embedder = SiliconFlowEmbeddings(
+    """FAISS-backed text pool.
+
+    Every text is stored under a stable integer ID (``IndexIDMap2``), so when
+    ``capacity`` is set the engine can drop entries from the index itself:
+    ``fifo`` evicts the oldest entry, ``lru`` the one retrieved least recently
+    and ``utility`` the one retrieved least often.
+    """
+
+    def __init__(self, api_key, base_url, embedding_model="BAAI/bge-m3",prefix="default",embedding_store=None,
+                 capacity=None, eviction_policy="fifo", embedding_backend=None):
+        if eviction_policy not in EVICTION_POLICIES:
+            raise ValueError(f"Unknown eviction policy: {eviction_policy} (expected one of {EVICTION_POLICIES})")
+        # raw vectors come from the on-disk EmbeddingStore behind the embedder;
+        # embedding_cache below only keeps the (PCA-projected) vectors of this process
+        # (or from a local backend, see agents.embeddings.make_embeddings)
+        self.embedder = make_embeddings(
+            embedding_backend,
             api_key=api_key,
             base_url=base_url,
-            model=embedding_model
+            model=embedding_model,
+            store=embedding_store
         )
         self.prefix = prefix
-        self.pool_text = []
+        self.capacity = capacity
+        self.eviction_policy = eviction_policy
+        self.records = {}  # id -> {"id", "text", "hits", "last_used"}, in insertion order
+        self.id_by_text = {}
+        self.next_id = 0
+        self.clock = 0  # bumped on every add/search, drives "last_used"
         self.embedding_cache = {}
+        # (query, top_k) -> results, valid for index version `query_cache_version` only
+        self.query_cache = {}
+        self.query_cache_version = None
         self.index = None
         self.pca_matrix = None 
+        self.version = 0  # snapshot version this engine was loaded from / last saved
+        self.snapshot_files = {}  # manifest entries of that snapshot
+        self.MANIFEST_PATH = f"{self.prefix}_cheatsheet_manifest.json"
+        # unversioned files written before snapshots existed, still read if there is no manifest
         self.INDEX_PATH = f"{self.prefix}_cheatsheet.index"
         self.TEXT_PATH = f"{self.prefix}_cheatsheet_texts.json"
         self.PCA_PATH = f"{self.prefix}_cheatsheet_pca.npy"
+        # serializes snapshot writes of every process using this prefix
+        self.LOCK_PATH = f"{self.prefix}_cheatsheet.lock"
+        self._index_is_mapped = False
+        self._manifest_stamp = None
+        # engines are shared between threads (see SpyCheatSheetManager registry)
+        self.lock = threading.RLock()
+        self._exclusive_depth = 0
         self._try_load_index()
 
+    @property
+    def pool_text(self):
+        return [r["text"] for r in self.records.values()]
 
     def _fit_pca(self, matrix):
         """Fit PCA matrix using SVD"""
         U, S, Vt = np.linalg.svd(matrix - matrix.mean(0), full_matrices=False)
         pca = Vt[:PCA_DIM]  
-        np.save(self.PCA_PATH, pca)
+        # a new PCA file is written with the next snapshot
+        self.snapshot_files.pop("pca", None)
         return pca
 
     def _apply_pca(self, vec):
@@ -40,88 +139,376 @@ class RetrievalEngine:
             return vec.astype("float32")
         return vec @ self.pca_matrix.T
 
+    def _set_records(self, records):
+        self.records = {r["id"]: r for r in sorted(records, key=lambda r: r["id"])}
+        self.id_by_text = {r["text"]: r["id"] for r in records}
+        self.next_id = max(self.records, default=-1) + 1
+        self.clock = max((r["last_used"] for r in records), default=0)
+
+    def _snapshot_path(self, name):
+        return os.path.join(os.path.dirname(self.MANIFEST_PATH), name)
+
+    def read_manifest(self):
+        if not os.path.exists(self.MANIFEST_PATH):
+            return None
+        with open(self.MANIFEST_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _read_manifest_stamp(self):
+        try:
+            st = os.stat(self.MANIFEST_PATH)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
     def _try_load_index(self):
-        """Load FAISS index + text list + PCA if exists."""
-        import json
+        """Load FAISS index + text list + PCA of the current snapshot if exists."""
+        # a writer may remove the files of the snapshot we just read the manifest of; retry
+        for attempt in range(3):
+            self._manifest_stamp = self._read_manifest_stamp()
+            manifest = self.read_manifest()
+            if manifest is None:
+                self._try_load_legacy_index()
+                return
+            if manifest.get("embedding_model", "BAAI/bge-m3") != self.embedder.model:
+                # vectors of another embedding model live in a different space; rebuild
+                print(f"[RetrievalEngine] Snapshot was built with {manifest.get('embedding_model', 'BAAI/bge-m3')}, "
+                      f"ignoring it for {self.embedder.model}.")
+                return
+            try:
+                self._load_snapshot(manifest)
+                return
+            except FileNotFoundError:
+                if attempt == 2:
+                    raise
+
+    def _load_snapshot(self, manifest):
+        # the index and PCA matrix are memory-mapped read-only, so every engine and
+        # process loading the same snapshot shares one copy in the page cache
+        pca = None
+        if manifest.get("pca"):
+            pca = np.load(self._snapshot_path(manifest["pca"]), mmap_mode="r")
+
+        index = faiss.read_index(self._snapshot_path(manifest["index"]),
+                                 faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+
+        with open(self._snapshot_path(manifest["texts"]), "r", encoding="utf-8") as f:
+            data = json.load(f)
+
+        self.pca_matrix = pca
+        self.index = index
+        self._index_is_mapped = True
+        self._set_records(data["items"])
+        self.next_id = max(self.next_id, data.get("next_id", 0))
+        self.version = manifest["version"]
+        self.snapshot_files = {k: manifest[k] for k in ("index", "texts", "pca") if manifest.get(k)}
+
+        print("[RetrievalEngine] Successfully loaded cached FAISS index.")
 
+    def _try_load_legacy_index(self):
         if not os.path.exists(self.INDEX_PATH) or not os.path.exists(self.TEXT_PATH):
             return
+        if self.embedder.model != "BAAI/bge-m3":
+            # unversioned files were always built with bge-m3
+            return
 
         # load pca
         if os.path.exists(self.PCA_PATH):
             self.pca_matrix = np.load(self.PCA_PATH)
 
         # load FAISS
-        self.index = faiss.read_index(self.INDEX_PATH)
+        index = faiss.read_index(self.INDEX_PATH)
 
         # load text list
         with open(self.TEXT_PATH, "r", encoding="utf-8") as f:
-            self.pool_text = json.load(f)
+            data = json.load(f)
+
+        if isinstance(data, list):
+            # old format: plain list of texts whose positions are the index rows
+            records = [{"id": i, "text": t, "hits": 0, "last_used": i} for i, t in enumerate(data)]
+        else:
+            records = data["items"]
+        self._set_records(records)
+        if not isinstance(data, list):
+            self.next_id = max(self.next_id, data.get("next_id", 0))
+
+        if not isinstance(index, faiss.IndexIDMap2):
+            # old format: plain IndexFlatIP, wrap it so rows can be removed by ID
+            vecs = index.reconstruct_n(0, index.ntotal)
+            index = faiss.IndexIDMap2(faiss.IndexFlatIP(index.d))
+            index.add_with_ids(vecs, np.arange(len(vecs), dtype="int64"))
+        self.index = index
 
         print("[RetrievalEngine] Successfully loaded cached FAISS index.")
 
-    def _save_index(self):
-        """Save FAISS + texts + PCA matrix"""
-        import json
-
-        faiss.write_index(self.index, self.INDEX_PATH)
+    def _writable_index(self):
+        """Copy a memory-mapped index into memory before the first mutation."""
+        if self._index_is_mapped:
+            self.index = faiss.clone_index(self.index)
+            self._index_is_mapped = False
+        return self.index
+
+    @contextmanager
+    def exclusive(self):
+        """Hold the engine lock and the store's file lock, on top of the latest snapshot.
+
+        Every writer saves under the same file lock, so reading the next version,
+        writing the files, replacing the manifest and removing the superseded files
+        happen as one step, and each change builds on the snapshot saved last.
+        Re-entrant within the thread holding it.
+        """
+        with self.lock:
+            if self._exclusive_depth:
+                self._exclusive_depth += 1
+                try:
+                    yield
+                finally:
+                    self._exclusive_depth -= 1
+                return
+            with file_lock(self.LOCK_PATH):
+                self._exclusive_depth = 1
+                try:
+                    self.refresh()
+                    yield
+                finally:
+                    self._exclusive_depth = 0
 
-        with open(self.TEXT_PATH, "w", encoding="utf-8") as f:
-            json.dump(self.pool_text, f, ensure_ascii=False, indent=2)
+    def _save_index(self):
+        """Write a new snapshot (FAISS + texts + PCA matrix) and switch the manifest to it.
+
+        Every snapshot gets fresh file names and the manifest is replaced last, so a
+        crash at any point leaves the previous snapshot intact and loadable.
+        Callers hold ``exclusive()``.
+        """
+        manifest = self.read_manifest() or {}
+        version = max(self.version, manifest.get("version", 0)) + 1
+        tag = f"v{version}-{uuid.uuid4().hex[:8]}"
+        files = {
+            "index": f"{os.path.basename(self.prefix)}_cheatsheet.{tag}.index",
+            "texts": f"{os.path.basename(self.prefix)}_cheatsheet_texts.{tag}.json",
+        }
+
+        atomic_write(self._snapshot_path(files["index"]), lambda p: faiss.write_index(self.index, p))
+        atomic_write(self._snapshot_path(files["texts"]),
+                     _write_json({"next_id": self.next_id, "items": list(self.records.values())}, indent=2))
 
         if self.pca_matrix is not None:
-            np.save(self.PCA_PATH, self.pca_matrix)
+            # the PCA matrix only changes when it is fitted; otherwise reuse its file
+            files["pca"] = self.snapshot_files.get("pca")
+            if files["pca"] is None:
+                files["pca"] = f"{os.path.basename(self.prefix)}_cheatsheet_pca.{tag}.npy"
+                atomic_write(self._snapshot_path(files["pca"]), _write_npy(np.asarray(self.pca_matrix)))
+
+        atomic_write(self.MANIFEST_PATH, _write_json({
+            "version": version,
+            **files,
+            "count": len(self.records),
+            "dim": self.index.d,
+            "embedding_model": self.embedder.model,
+        }, indent=2))
+
+        # drop the files of the snapshot this engine superseded
+        # (processes that still have them mapped keep working on POSIX)
+        for name in set(self.snapshot_files.values()) - set(files.values()):
+            try:
+                os.remove(self._snapshot_path(name))
+            except FileNotFoundError:
+                pass
+
+        self.version = version
+        self.snapshot_files = files
+        self._manifest_stamp = self._read_manifest_stamp()
 
         print("[RetrievalEngine] Index saved to disk.")
 
-    def _get_embedding(self, text):
-        if text in self.embedding_cache:
-            return self.embedding_cache[text]
-
-        emb = self.embedder.embed(text)[0].astype("float32")
-
-        # Apply PCA if exists
-        if self.pca_matrix is not None:
-            emb = self._apply_pca(emb)
-
-        self.embedding_cache[text] = emb
-        return emb
-
-    def _build_index(self):
-        emb_matrix = np.array([self._get_embedding(t) for t in self.pool_text])
-
-        # Fit PCA only on first build
-        if self.pca_matrix is None and emb_matrix.shape[0] >= PCA_DIM:
-            self.pca_matrix = self._fit_pca(emb_matrix)
-            emb_matrix = emb_matrix @ self.pca_matrix.T
-
-        dim = emb_matrix.shape[1]
-        self.index = faiss.IndexFlatIP(dim)
-        self.index.add(emb_matrix)
+    def refresh(self):
+        """Reload in place if another engine (or process) saved a newer snapshot.
+
+        Only a stat of the manifest when nothing changed. Returns True if reloaded.
+        """
+        with self.lock:
+            stamp = self._read_manifest_stamp()
+            if stamp is None or stamp == self._manifest_stamp:
+                return False
+            manifest = self.read_manifest()
+            if manifest["version"] == self.version:
+                self._manifest_stamp = stamp
+                return False
+
+            old_pca = self.snapshot_files.get("pca")
+            self._try_load_index()
+            if self.snapshot_files.get("pca") != old_pca:
+                # cached vectors were projected with the old PCA matrix
+                self.embedding_cache = {}
+            return True
 
-        self._save_index()
-
-    def add(self, text: str):
-        if text in self.pool_text:
+    def _get_embedding(self, text):
+        return self._get_embeddings([text])[0]
+
+    def _fetch_missing(self, texts):
+        """Raw vectors for the texts not in ``embedding_cache``, in one embed request.
+
+        Does not touch engine state, so callers run it before taking ``self.lock``.
+        """
+        missing = list(dict.fromkeys(t for t in texts if t not in self.embedding_cache))
+        if not missing:
+            return {}
+        return dict(zip(missing, self.embedder.embed_matrix(missing)))
+
+    def _get_embeddings(self, texts, fetched=None):
+        """Embeddings for ``texts``; everything not cached goes out in one embed request."""
+        fetched = dict(fetched or {})
+        fetched.update(self._fetch_missing([t for t in texts if t not in fetched]))
+        for text, emb in fetched.items():
+            if text in self.embedding_cache:
+                continue
+            emb = emb.astype("float32")
+
+            # Apply PCA if exists
+            if self.pca_matrix is not None:
+                emb = self._apply_pca(emb)
+
+            self.embedding_cache[text] = emb
+        return [self.embedding_cache[t] for t in texts]
+
+    def _refit_pca(self):
+        """Fit PCA on the vectors already in the index and re-index them projected."""
+        ids = np.array(list(self.records), dtype="int64")
+        emb_matrix = np.vstack([self.index.reconstruct(int(i)) for i in ids])
+
+        self.pca_matrix = self._fit_pca(emb_matrix)
+        emb_matrix = (emb_matrix @ self.pca_matrix.T).astype("float32")
+        # cached vectors were not projected yet; keep only the projected ones
+        self.embedding_cache = {self.records[i]["text"]: v for i, v in zip(ids, emb_matrix)}
+
+        self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(emb_matrix.shape[1]))
+        self._index_is_mapped = False
+        self.index.add_with_ids(emb_matrix, ids)
+
+    def _eviction_key(self, record):
+        if self.eviction_policy == "lru":
+            return (record["last_used"], record["id"])
+        if self.eviction_policy == "utility":
+            return (record["hits"], record["id"])
+        return (record["id"],)
+
+    def _evict(self, protected=()):
+        """Drop entries until the pool fits ``capacity``; ``protected`` IDs go last."""
+        if self.capacity is None or len(self.records) <= self.capacity:
             return
+        ranked = sorted(self.records.values(), key=lambda r: (r["id"] in protected, self._eviction_key(r)))
+        self._remove_ids([r["id"] for r in ranked[:len(self.records) - self.capacity]])
+
+    def _remove_ids(self, ids):
+        self._writable_index().remove_ids(np.array(ids, dtype="int64"))
+        for i in ids:
+            record = self.records.pop(i)
+            del self.id_by_text[record["text"]]
+            self.embedding_cache.pop(record["text"], None)
+
+    def _append(self, texts, fetched=None, persist=True):
+        """Embed only ``texts`` and add them to the index, evict, then save once.
+
+        With ``persist=False`` only the in-memory index changes: nothing is evicted or saved.
+        """
+        new_vecs = np.array(self._get_embeddings(texts, fetched), dtype="float32")
+        ids = np.arange(self.next_id, self.next_id + len(texts), dtype="int64")
+        self.next_id += len(texts)
+
+        if self.index is None:
+            self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(new_vecs.shape[1]))
+        self._writable_index().add_with_ids(new_vecs, ids)
+        for i, text in zip(ids, texts):
+            self.clock += 1
+            self.records[int(i)] = {"id": int(i), "text": text, "hits": 0, "last_used": self.clock}
+            self.id_by_text[text] = int(i)
+
+        # Fit PCA once the pool is large enough
+        if self.pca_matrix is None and len(self.records) >= PCA_DIM:
+            self._refit_pca()
+
+        if persist:
+            self._evict(protected=set(int(i) for i in ids))
+            self._save_index()
 
-        self.pool_text.append(text)
-
-        # rebuild full index anytime new strategy added
-        self._build_index()
+    def add(self, text: str):
+        self.add_many([text])
+
+    def add_many(self, texts, persist=True):
+        """Add a batch of texts: one embed request, one index update, one save.
+
+        ``persist=False`` indexes them in memory only (no eviction, no snapshot),
+        e.g. to index an existing store when it is loaded.
+        """
+        fetched = self._fetch_missing([t for t in texts if t not in self.id_by_text])
+        with self.exclusive() if persist else self.lock:
+            new_texts = [t for t in dict.fromkeys(texts) if t not in self.id_by_text]
+            if not new_texts:
+                return
+
+            self._append(new_texts, fetched, persist=persist)
+
+    def remove_many(self, texts, persist=True):
+        """Remove texts from the pool and the index, then save once (``persist=False``: in memory only)."""
+        with self.exclusive() if persist else self.lock:
+            ids = [self.id_by_text[t] for t in dict.fromkeys(texts) if t in self.id_by_text]
+            if not ids:
+                return
+
+            self._remove_ids(ids)
+            if persist:
+                self._save_index()
+
+    def trim(self):
+        """Evict down to ``capacity`` (e.g. after loading a larger store) and save if anything changed."""
+        with self.exclusive():
+            if self.capacity is not None and len(self.records) > self.capacity:
+                self._evict()
+                self._save_index()
+
+    def _touch(self, ids):
+        """Update the retrieval statistics used by the lru / utility eviction policies."""
+        self.clock += 1
+        for i in ids:
+            record = self.records[i]
+            record["hits"] += 1
+            record["last_used"] = self.clock
+
+    def _cached_search(self, query, top_k):
+        if self.query_cache_version != self.version:
+            self.query_cache = {}
+            self.query_cache_version = self.version
+            return None
+        return self.query_cache.get((query, top_k))
 
     def search(self, query: str, top_k: int = 5):
-        if self.index is None or len(self.pool_text) == 0:
+        if self.index is None or len(self.records) == 0:
             return []
 
-        q_vec = self._get_embedding(query).reshape(1, -1)
-        scores, indices = self.index.search(q_vec, top_k)
-
-        results = []
-        for idx in indices[0]:
-            if idx == -1:
-                continue
-            results.append(self.pool_text[idx])
-
-        return results
-
+        # results only change when the index does, i.e. with the snapshot version
+        with self.lock:
+            ids = self._cached_search(query, top_k)
+            if ids is not None:
+                self._touch(ids)
+                return [self.records[i]["text"] for i in ids]
+
+        # the embedding request is the slow part; keep it outside the lock
+        fetched = self._fetch_missing([query])
+        with self.lock:
+            if self.index is None or len(self.records) == 0:
+                return []
+
+            q_vec = self._get_embeddings([query], fetched)[0].reshape(1, -1)
+            scores, indices = self.index.search(q_vec, top_k)
+
+            ids = [int(idx) for idx in indices[0] if idx != -1]
+            self._touch(ids)
+
+            if self.query_cache_version != self.version:
+                self.query_cache = {}
+                self.query_cache_version = self.version
+            elif len(self.query_cache) >= QUERY_CACHE_SIZE:
+                self.query_cache.pop(next(iter(self.query_cache)))
+            self.query_cache[(query, top_k)] = ids
+
+            return [self.records[i]["text"] for i in ids]
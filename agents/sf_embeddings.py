@@ -1,22 +1,259 @@
 # agents/sf_embeddings.py
+import email.utils
+import queue
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 import requests
 import numpy as np
+from requests.adapters import HTTPAdapter
+from agents.embedding_store import get_default_store
+from agents.embeddings import EmbeddingBackend
 
-class SiliconFlowEmbeddings:
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# keep-alive sessions shared by every client with the same pool size
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(pool_size=10):
+    with _sessions_lock:
+        session = _sessions.get(pool_size)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[pool_size] = session
+        return session
+
+
+def _retry_after_seconds(resp):
+    value = resp.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class EmbeddingBatcher:
+    """Coalesces concurrent embed calls into fewer /embeddings requests.
+
+    ``submit`` queues the texts and blocks; a background thread collects
+    submissions for up to ``window`` seconds (or until ``max_batch_size``
+    texts), sends the distinct texts with one ``request(texts)`` call and hands
+    every caller its own vectors back. Up to ``max_inflight`` batches are in
+    flight at once.
+
+    A failed batch (including an endpoint answering with the wrong number of
+    rows) raises in every caller of that batch; ``submit`` gives up with
+    ``TimeoutError`` after ``timeout`` seconds.
+    """
+
+    def __init__(self, request, window=0.005, max_batch_size=64, max_inflight=4, timeout=None):
+        self.request = request
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=max_inflight, thread_name_prefix="embed-batch")
+        self._thread = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, texts):
+        future = Future()
+        self._queue.put((list(texts), future))
+        return future.result(timeout=self.timeout)
+
+    def _run(self):
+        while True:
+            pending = [self._queue.get()]
+            size = len(pending[0][0])
+            deadline = time.monotonic() + self.window
+            while size < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                pending.append(item)
+                size += len(item[0])
+            self._executor.submit(self._send, pending)
+
+    def _send(self, pending):
+        try:
+            unique = list(dict.fromkeys(t for texts, _ in pending for t in texts))
+            vecs = {}
+            for i in range(0, len(unique), self.max_batch_size):
+                chunk = unique[i:i + self.max_batch_size]
+                rows = self.request(chunk)
+                if len(rows) != len(chunk):
+                    raise ValueError(f"embedding endpoint returned {len(rows)} rows for {len(chunk)} texts")
+                vecs.update(zip(chunk, rows))
+            results = [[vecs[t] for t in texts] for texts, _ in pending]
+        except BaseException as e:
+            for _, future in pending:
+                future.set_exception(e)
+            return
+        for (_, future), result in zip(pending, results):
+            future.set_result(result)
+
+
+_batchers = {}
+_endpoint_stats = {}
+_registry_lock = threading.Lock()
+
+
+def get_batcher(key, request, **kwargs):
+    """One batcher per ``key``, so every client of it shares batches.
+
+    The batcher sends with the ``request`` of the client that created it, so
+    ``key`` must cover everything that request depends on.
+    """
+    with _registry_lock:
+        batcher = _batchers.get(key)
+        if batcher is None:
+            batcher = _batchers[key] = EmbeddingBatcher(request, **kwargs)
+        return batcher
+
+
+def _get_endpoint_stats(key):
+    with _registry_lock:
+        stats = _endpoint_stats.get(key)
+        if stats is None:
+            stats = _endpoint_stats[key] = {"requests": 0, "retries": 0, "failures": 0,
+                                            "latency_total": 0.0, "latency_max": 0.0}
+        return stats
+
+
+class SiliconFlowEmbeddings(EmbeddingBackend):
     """
     Lightweight embedding wrapper for SiliconFlow /embeddings endpoint.
+
+    Vectors are looked up in an on-disk ``EmbeddingStore`` first (the shared
+    default one unless ``store`` is given); pass ``use_cache=False`` to always
+    hit the endpoint.
+
+    Requests go through a pooled keep-alive session. 429/5xx responses and
+    connection errors are retried up to ``max_retries`` times with jittered
+    exponential backoff, waiting at least as long as a ``Retry-After`` header
+    asks (up to ``timeout``). ``get_stats()`` reports request, retry and
+    latency counters.
+
+    With ``batch_window_ms`` > 0, cache misses from all clients of the same
+    endpoint/model/key are coalesced by a shared ``EmbeddingBatcher``. Since a
+    batch mixes callers, the counters are kept per endpoint/model/key as well.
     """
 
-    def __init__(self, api_key, base_url="https://api.siliconflow.cn/v1", model="BAAI/bge-m3"):
+    def __init__(self, api_key, base_url="https://api.siliconflow.cn/v1", model="BAAI/bge-m3",
+                 store=None, use_cache=True, timeout=60.0, connect_timeout=10.0,
+                 pool_size=10, max_retries=4, backoff_base=0.5, backoff_max=20.0,
+                 batch_window_ms=5, max_batch_size=64):
         self.api_key = api_key
         self.base_url = base_url.rstrip("/")
         self.model = model
+        self.timeout = (connect_timeout, timeout)
+        self.store = (store or get_default_store()) if use_cache else None
+        self.session = get_session(pool_size)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # own RNG so the jitter never shifts the game's seeded `random` sequence
+        self._rng = random.Random()
+        self._stats_lock = _registry_lock
+        self._stats = _get_endpoint_stats((self.base_url, self.model, self.api_key))
+        if batch_window_ms:
+            # clients only share a batcher (and so its request) if they would send identical requests
+            request_settings = (self.timeout, pool_size, max_retries, backoff_base, backoff_max)
+            # the longest one batch can take with every retry; callers never block past it
+            batch_timeout = (connect_timeout + timeout + max(backoff_max, timeout)) * (max_retries + 1)
+            self._fetch = get_batcher(
+                (self.base_url, self.model, self.api_key, request_settings, batch_window_ms, max_batch_size),
+                self._request, window=batch_window_ms / 1000, max_batch_size=max_batch_size,
+                timeout=batch_timeout,
+            ).submit
+        else:
+            self._fetch = self._request
 
-    def embed(self, texts):
-        """Return embeddings for single string or list of strings."""
+    def embed_matrix(self, texts, normalize=False):
+        """Return embeddings as one contiguous float32 ``(n, d)`` array.
+
+        With ``normalize=True`` rows are L2-normalized, so inner products
+        (e.g. ``IndexFlatIP`` scores) are cosine similarities.
+        """
         if isinstance(texts, str):
             texts = [texts]
 
+        if self.store is None:
+            matrix = np.asarray(self._fetch(texts), dtype=np.float32).reshape(len(texts), -1)
+        else:
+            matrix = self.store.embed_matrix(self.model, texts, self._fetch)
+
+        if normalize:
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix /= np.where(norms == 0, 1, norms)
+        return matrix
+
+    def get_stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["latency_avg"] = stats["latency_total"] / stats["requests"] if stats["requests"] else 0.0
+        return stats
+
+    def _count(self, key, value=1):
+        with self._stats_lock:
+            self._stats[key] += value
+
+    def _backoff(self, attempt, resp=None):
+        """Jittered exponential backoff capped at ``backoff_max``; a ``Retry-After``
+        header is waited out in full, up to the read timeout of one request."""
+        delay = self._rng.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        retry_after = _retry_after_seconds(resp) if resp is not None else None
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.timeout[1]))
+        time.sleep(delay)
+
+    def _post(self, url, payload, headers):
+        for attempt in range(self.max_retries + 1):
+            last_try = attempt == self.max_retries
+            start = time.perf_counter()
+            try:
+                resp = self.session.post(url, json=payload, headers=headers, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if last_try:
+                    self._count("failures")
+                    raise
+                self._count("retries")
+                self._backoff(attempt)
+                continue
+            finally:
+                elapsed = time.perf_counter() - start
+                with self._stats_lock:
+                    self._stats["requests"] += 1
+                    self._stats["latency_total"] += elapsed
+                    self._stats["latency_max"] = max(self._stats["latency_max"], elapsed)
+
+            if resp.status_code in RETRY_STATUS and not last_try:
+                self._count("retries")
+                self._backoff(attempt, resp)
+                continue
+            if resp.status_code >= 400:
+                self._count("failures")
+            resp.raise_for_status()
+            return resp
+
+    def _request(self, texts):
         url = f"{self.base_url}/embeddings"
         headers = {
             "Authorization": f"Bearer {self.api_key}",
@@ -24,14 +261,15 @@ class SiliconFlowEmbeddings:
         }
 
         payload = {
-            "model": self.model,    
+            "model": self.model,
             "input": texts
         }
 
-        resp = requests.post(url, json=payload, headers=headers)
-        resp.raise_for_status()
+        resp = self._post(url, payload, headers)
 
-        data = resp.json()
-        embeds = [d["embedding"] for d in data["data"]]
+        data = resp.json()["data"]
+        if len(data) != len(texts):
+            raise ValueError(f"embedding endpoint returned {len(data)} rows for {len(texts)} texts")
 
-        return [np.array(e) for e in embeds]
+        # decode straight into one float32 matrix instead of an array per row
+        return np.array([d["embedding"] for d in data], dtype=np.float32)
@@ -1,49 +1,114 @@
 # agents/spy_cheatsheet_manager.py
 import json
 import os
-from agents.retrieval_engine import RetrievalEngine
+import threading
+from agents.retrieval_engine import RetrievalEngine, atomic_write
 
 MAX_CHEATSHEET_SIZE = 10
 
 class SpyCheatSheetManager:
-    def __init__(self, path="cheatsheet_memory.json", api_key=None, base_url=None,prefix="default"):
+    def __init__(self, path="cheatsheet_memory.json", api_key=None, base_url=None,prefix="default",
+                 capacity=MAX_CHEATSHEET_SIZE, eviction_policy="fifo", embedding_backend=None):
         self.path = path
         self.pool = []
         self.prefix = prefix
 
         # load texts
-        if os.path.exists(path):
+        has_memory_file = os.path.exists(path)
+        if has_memory_file:
             with open(path, "r", encoding="utf-8") as f:
                 self.pool = json.load(f)
 
         # RetrievalEngine will automatically load FAISS index if exists
-        self.engine = RetrievalEngine(api_key=api_key, base_url=base_url,prefix=self.prefix)
+        # and evicts entries from the index itself once it holds more than `capacity`
+        self.engine = RetrievalEngine(api_key=api_key, base_url=base_url,prefix=self.prefix,
+                                      capacity=capacity, eviction_policy=eviction_policy,
+                                      embedding_backend=embedding_backend)
 
-        # If no FAISS index exists but pool has content → build once
+        # Loading never evicts or writes anything: a store larger than `capacity`
+        # (e.g. one saved before the index was bounded) keeps every entry in memory
+        # until the next add_items trims it and saves a snapshot.
+        # If no FAISS index exists but pool has content → build it in memory
         if self.engine.index is None and len(self.pool) > 0:
             print("[SpyCheatSheetManager] No index found, building new index...")
-            for item in self.pool:
-                self.engine.add(item)
+            self.engine.add_many(self.pool, persist=False)
+        elif has_memory_file:
+            # stores written before the index was bounded kept every text ever added;
+            # ignore whatever the memory file no longer holds
+            stale = [t for t in self.engine.pool_text if t not in self.pool]
+            if stale:
+                print(f"[SpyCheatSheetManager] Ignoring {len(stale)} stale entries of the index...")
+                self.engine.remove_many(stale, persist=False)
+            self.engine.add_many(self.pool, persist=False)
+        self.pool = self.engine.pool_text
 
     def save(self):
-        with open(self.path, "w", encoding="utf-8") as f:
-            json.dump(self.pool, f, ensure_ascii=False, indent=2)
+        def write(tmp_path):
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.pool, f, ensure_ascii=False, indent=2)
+
+        atomic_write(self.path, write)
 
     def add_item(self, text):
-        if text in self.pool:
-            return
+        self.add_items([text])
+
+    def add_items(self, texts):
+        """Add several curated lines at once: RetrievalEngine embeds and indexes
+        the whole batch in one go, and the memory file is written once."""
+        # the memory file is written under the same cross-process lock as the snapshot
+        with self.engine.exclusive():
+            # exclusive() reloaded the latest snapshot: build on it, not on what this process loaded earlier
+            self.pool = self.engine.pool_text
+            new_texts = [t for t in dict.fromkeys(texts) if t not in self.pool]
+            if not new_texts:
+                return
 
-        self.pool.append(text)
-        if len(self.pool) > MAX_CHEATSHEET_SIZE:
-            self.pool = self.pool[-MAX_CHEATSHEET_SIZE:]
+            # let RetrievalEngine index + evict (down to capacity, including
+            # anything an oversized store brought in on load) + save FAISS
+            self.engine.add_many(new_texts)
+            self._sync_pool()
 
-        self.save()
+    def _sync_pool(self):
+        """Keep the memory file identical to what the index holds."""
+        if self.pool != self.engine.pool_text:
+            self.pool = self.engine.pool_text
+            self.save()
 
-        # let RetrievalEngine rebuild + save FAISS
-        self.engine.add(text)
+    def refresh(self):
+        """Pick up a snapshot saved by another manager or process (cheap when unchanged)."""
+        with self.engine.lock:
+            if self.engine.refresh():
+                # the writer already wrote the matching memory file
+                self.pool = self.engine.pool_text
 
     def retrieve(self, query, top_k=5):
+        self.refresh()
         return self.engine.search(query, top_k)
 
 
+_shared_managers = {}
+_shared_managers_lock = threading.Lock()
+
+
+def get_shared_manager(prefix="default", path=None, api_key=None, base_url=None, **kwargs):
+    """Process-wide SpyCheatSheetManager for ``prefix``.
 
+    All agents (and the curator update) using the same prefix share one manager,
+    one RetrievalEngine and one embedding cache instead of each loading the
+    index from disk. The manager reloads itself when a newer snapshot appears.
+    ``kwargs`` (capacity, eviction_policy, embedding_backend) only apply when the manager is created.
+    """
+    with _shared_managers_lock:
+        manager = _shared_managers.get(prefix)
+        if manager is None:
+            manager = SpyCheatSheetManager(
+                path=path or f"{prefix}_cheatsheet_memory.json",
+                api_key=api_key,
+                base_url=base_url,
+                prefix=prefix,
+                **kwargs
+            )
+            _shared_managers[prefix] = manager
+            return manager
+    manager.refresh()
+    return manager
@@ -1,5 +1,6 @@
 # agents/spy_curator_agent.py
 import json
+from agents.concurrency import inflight_slot
 
 CURATOR_TEMPLATE = """
 You are the SpyGame Dynamic Cheatsheet Curator (Retrieval + Synthesis Mode).
@@ -28,6 +29,7 @@ class SpyCuratorAgent:
             retrieved=retr,
             game_log=json.dumps(game_log, ensure_ascii=False)
         )
-        resp = self.llm.invoke(prompt)
+        with inflight_slot():
+            resp = self.llm.invoke(prompt)
         lines = resp.content.strip().split("\n")
         return [l.replace("-", "").strip() for l in lines if l.strip()]
@@ -1,42 +1,12 @@
 import os
+import sys
 import json
 import requests
-import numpy as np
 from typing import List, Dict
 
-
-class SiliconFlowEmbeddings:
-    """
-    Lightweight embedding wrapper for SiliconFlow /embeddings endpoint.
-    """
-
-    def __init__(self, api_key, base_url="https://api.siliconflow.cn/v1", model="BAAI/bge-m3"):
-        self.api_key = api_key
-        self.base_url = base_url.rstrip("/")
-        self.model = model
-
-    def embed(self, texts):
-        if isinstance(texts, str):
-            texts = [texts]
-
-        url = f"{self.base_url}/embeddings"
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-        }
-
-        payload = {
-            "model": self.model,
-            "input": texts
-        }
-
-        resp = requests.post(url, json=payload, headers=headers, timeout=60)
-        resp.raise_for_status()
-
-        data = resp.json()
-        embeds = [d["embedding"] for d in data["data"]]
-
-        return [np.array(e) for e in embeds]
+# 复用 agents 里带磁盘缓存的 embedding 客户端，重复运行时已见过的文本不再请求接口
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from agents.embeddings import EmbeddingBackend, make_embeddings
 
 
 
@@ -76,10 +46,6 @@ Word: {word}
 
 
 
-def cosine_similarity(a, b):
-    return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
-
-
 def load_keyword_pairs(path: str):
     with open(path, "r", encoding="utf-8") as f:
         pairs = json.load(f)
@@ -91,7 +57,7 @@ def load_keyword_pairs(path: str):
 def score_keyword_pairs_with_gpt_and_embedding(
     keyword_pairs: List[List[str]],
     gpt_model: SimpleGPTClient,
-    embed_model: SiliconFlowEmbeddings
+    embed_model: EmbeddingBackend
 ) -> List[Dict]:
 
     results = []
@@ -103,8 +69,8 @@ def score_keyword_pairs_with_gpt_and_embedding(
             spy_desc = describe_word_with_gpt(gpt_model, spy_word)
             civ_desc = describe_word_with_gpt(gpt_model, civ_word)
 
-            emb_spy, emb_civ = embed_model.embed([spy_desc, civ_desc])
-            sim = cosine_similarity(emb_spy, emb_civ)
+            emb_spy, emb_civ = embed_model.embed_matrix([spy_desc, civ_desc], normalize=True)
+            sim = float(emb_spy @ emb_civ)
 
             results.append({
                 "spy_word": spy_word,
@@ -202,9 +168,10 @@ if __name__ == "__main__":
         model="gpt-4o-mini-2024-07-18"
     )
 
-    embed_model = SiliconFlowEmbeddings(
+    # set SPYGAME_EMBEDDING_BACKEND=hashing to score offline
+    embed_model = make_embeddings(
         api_key=QWEN_KEY,
-        model="BAAI/bge-m3"
+        model="BAAI/bge-m3",
     )
 
     build_difficulty_keyword_dataset(
@@ -1,23 +1,35 @@
 # graph/__init__.py
-from .workflow import run_game, create_undercover_workflow
+from .workflow import run_game, run_game_async, run_games, run_games_async, get_compiled_app, create_undercover_workflow
 from .state import GameState, PlayerState
+from .registry import get_game_agents, release_game
 from .nodes import (
     initialize_game,
     description_phase,
     voting_phase,
     check_win_condition,
+    description_phase_async,
+    voting_phase_async,
+    check_win_condition_async,
     end_game
 )
 
 __all__ = [
     "run_game",
+    "run_game_async",
+    "run_games",
+    "run_games_async",
+    "get_compiled_app",
     "create_undercover_workflow",
     "GameState",
     "PlayerState",
+    "get_game_agents",
+    "release_game",
     "initialize_game",
     "description_phase",
     "voting_phase",
     "check_win_condition",
+    "description_phase_async",
+    "voting_phase_async",
+    "check_win_condition_async",
     "end_game"
 ]
-
@@ -1,12 +1,22 @@
 # graph/nodes.py
+import asyncio
 import random
 import json
 import os
+import threading
+import time
 import uuid
 from typing import List, Dict
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import replace
+from functools import partial
 from .state import GameState, PlayerState
+from .registry import register_game_agents, get_game_agents, release_game
 from agents import PlayerAgent, GameModel
+from agents.agent_memory import new_public_logs
+from agents.records import DescriptionRecord, VoteRecord, RoundVotes, json_default
+from agents.reflection_schedule import ReflectionSchedule
+from agents.llm_requests import get_latency_tracker
 
 # 默认词汇对数据库（中文）
 DEFAULT_WORD_PAIRS = [
@@ -23,6 +33,15 @@ DEFAULT_WORD_PAIRS = [
 # 全局词汇对（可以通过 load_word_pairs 函数设置）
 WORD_PAIRS = DEFAULT_WORD_PAIRS.copy()
 
+# 多局游戏并发运行时，保护结果文件的“读取-修改-写回”
+_results_file_lock = threading.Lock()
+
+# 描述阶段所有身份反思共享的截止时间（秒）：发言者等待自己的反思、阶段结束前收集反思结果都从同一个预算中扣除。
+# 这是有意的取舍：每个Agent的反思队列是串行的，every_speaker 节奏下一轮最多有 N-1 次反思（每次单独的截止时间为
+# PHASE_DEADLINES["reflection"]），模型较慢时后发言者触发的反思会在预算用完后被放弃（结果不写入记忆），
+# 换来的是阶段耗时有固定上限、不随玩家数增长。需要完整反思时使用 per_round / every_k 节奏或调大该值
+DESCRIPTION_REFLECTION_DEADLINE = 300.0
+
 
 def set_word_pairs(word_pairs: List[Dict[str, str]]):
     """设置全局词汇对"""
@@ -113,8 +132,10 @@ def initialize_game(state: GameState) -> GameState:
     
     print(f"✅ 已创建 {len(models)} 个模型实例")
     
-    # 创建Agent实例并保存到state中（持久化，让Agent有记忆）
+    # 创建Agent实例并按game_id登记到注册表中（持久化，让Agent有记忆；不放入state）
     agents_map = {}
+    # 本局的公开记录（描述、全员投票）只存一份，所有Agent共享
+    public_logs = new_public_logs()
     
     for i, player in enumerate(players):
         # 为每个Agent分配对应的模型实例
@@ -122,7 +143,8 @@ def initialize_game(state: GameState) -> GameState:
             player_id=player["player_id"],
             name=player["name"],
             word=player["word"],  # Agent只知道自己的词汇，不知道自己是平民还是卧底
-            model=models[i]  # 分配模型实例
+            model=models[i],  # 分配模型实例
+            public_logs=public_logs
         )
         agents_map[player["player_id"]] = agent
     
@@ -145,17 +167,13 @@ def initialize_game(state: GameState) -> GameState:
         
         # 添加初始分析条目（round=0表示游戏开始前的初始状态）
         if initial_analyses:
-            agent.memory["player_analyses"].append({
-                "round": 0,
-                "phase": "initial",
-                "analyses": initial_analyses
-            })
+            agent.memory.set_player_analyses(0, "initial", initial_analyses)
     
     print(f"✅ 已初始化 {len(players)} 个玩家的分析")
+    register_game_agents(game_id, agents_map)
     
     return {
-        **state,
-        "game_id": game_id,  # 明确包含game_id，确保传递到后续状态
+        "game_id": game_id,  # 明确包含game_id，后续节点据此查找Agent实例
         "output_dir": state.get("output_dir", "game_results"),  # 保留output_dir
         "round": 1,
         "phase": "description",
@@ -168,7 +186,6 @@ def initialize_game(state: GameState) -> GameState:
         "elimination_history": [],
         "winner": None,
         "game_over": False,
-        "agents_map": agents_map,  # 保存Agent实例
         "word_pair": word_pair,  # 保存词汇对信息
         # 显式保留模型配置字段
         "fixed_model_undercover": fixed_model_undercover,
@@ -184,295 +201,362 @@ def initialize_game(state: GameState) -> GameState:
     }
 
 
+def _get_speaking_order(players: List[PlayerState]) -> Dict[int, int]:
+    """确定所有存活玩家的发言顺序 {player_id: speaking_order}"""
+    alive_players_list = [p for p in players if p["alive"]]
+    player_speaking_order = {}  # {player_id: speaking_order}
+    for idx, p in enumerate(alive_players_list, start=1):
+        player_speaking_order[p["player_id"]] = idx
+    return player_speaking_order
+
+
+def _record_description(state: GameState, player: PlayerState, description: str, agents_map: Dict,
+                        current_descriptions: List[dict], conversation_history: List[dict]) -> dict:
+    """记录一条描述：更新当前轮描述、对话历史，并广播到所有存活Agent的记忆（玩家描述历史在阶段结束时更新，见 _with_description_history）
+    
+    记忆写入在图线程上同步完成，不排在任何反思之后：即使某个反思超时或卡住，下一位发言者也能看到之前所有的描述
+    """
+    players = state["players"]
+    description_entry = DescriptionRecord(
+        round=state["round"],  # 添加round字段，用于区分历史描述和当前描述
+        player_id=player["player_id"],
+        description=description,
+        name=player["name"],  # 添加name，用于记忆
+    )
+    
+    current_descriptions.append(description_entry)
+    
+    conversation_history.append({
+        "type": "description",
+        "round": state["round"],
+        "player_id": player["player_id"],
+        "content": description
+    })
+    
+    print(f"  {player['name']} 对所有人说: {description}")
+    
+    # 实时更新所有Agent的记忆，让后续说话的agent能看到前面已说过的描述
+    _publish_public_event(players, agents_map, "all_descriptions", description_entry)
+    
+    return description_entry
+
+
+def _with_description_history(players: List[PlayerState], current_descriptions: List[dict]) -> List[PlayerState]:
+    """返回新的玩家列表：本轮发言者的描述历史追加本轮描述（不修改原有的 PlayerState）"""
+    spoken = {d["player_id"]: d["description"] for d in current_descriptions}
+    return [
+        replace(p, description_history=p["description_history"] + [spoken[p["player_id"]]])
+        if p["player_id"] in spoken else p
+        for p in players
+    ]
+
+
+def _publish_public_event(players: List[PlayerState], agents_map: Dict, key: str, entry: dict):
+    """把公开事件追加到本局的公开记录（同一份记录只追加一次），再让每个存活Agent收到它
+    
+    收到只是移动Agent自己的视图，不复制事件
+    """
+    positions = {}
+    for p in players:
+        if not p["alive"]:
+            continue
+        memory = agents_map[p["player_id"]].memory
+        log = memory[key].log
+        if id(log) not in positions:
+            positions[id(log)] = log.append(entry)
+        memory.receive(key, positions[id(log)])
+
+
+def _get_history_descriptions(players: List[PlayerState], agents_map: Dict, round_num: int) -> List[dict]:
+    """获取历史描述（所有之前轮次的描述）"""
+    history_descriptions = []
+    if players and agents_map:
+        # 使用第一个存活玩家的agent来获取历史描述（所有agent的记忆中历史描述应该是一样的）
+        first_alive_player = next((p for p in players if p["alive"]), None)
+        if first_alive_player:
+            agent = agents_map[first_alive_player["player_id"]]
+            # 从agent的记忆中获取历史描述
+            history_descriptions = agent.memory.descriptions_before(round_num)
+    return history_descriptions
+
+
+def _print_reflection_results(reflection_results: List[dict]):
+    """打印身份审视结果（用于调试）"""
+    for result in reflection_results:
+        p = result["player"]
+        reflection_result = result["reflection_result"]
+        if reflection_result:
+            print(f"    💭 {p['name']} 重新审视身份: {reflection_result.get('role_guess', 'unknown')} (信心: {reflection_result.get('confidence', 'medium')})")
+
+
+def _remaining(deadline: float) -> float:
+    """距截止时间（time.monotonic()）还剩的秒数，不小于0"""
+    return max(0.0, deadline - time.monotonic())
+
+
+class _AgentPipeline:
+    """描述阶段的反思调度：每个Agent一个单线程队列，只执行身份反思（LLM调用）
+    
+    同一Agent的反思按提交顺序串行执行，每次反思都基于自己上一次反思的结果；
+    下一位发言者只需等自己的队列清空，不必等待其他玩家的反思。描述的记忆写入不经过队列。
+    """
+    
+    def __init__(self, player_ids: List[int]):
+        self.executors = {pid: ThreadPoolExecutor(max_workers=1) for pid in player_ids}
+        self.last = {}
+    
+    def submit(self, player_id: int, fn, *args):
+        future = self.executors[player_id].submit(fn, *args)
+        self.last[player_id] = future
+        return future
+    
+    def wait(self, player_id: int, timeout: float) -> bool:
+        """等待该Agent之前提交的所有任务完成（队列串行，等最后一个即可），超时返回False"""
+        future = self.last.get(player_id)
+        if future is None:
+            return True
+        done, _ = wait([future], timeout=timeout)
+        return bool(done)
+    
+    def close(self):
+        """取消还在排队的反思；超过截止时间仍在运行的反思不再等待
+        
+        运行中的反思完成后会自己写入记忆，调用方需用 _close_reflections 使其令牌过期，写入才会被丢弃
+        """
+        for executor in self.executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _open_reflections(agents_map: Dict, player_ids: List[int]) -> Dict[int, int]:
+    """为本阶段的反思发放令牌 {player_id: token}（见 PlayerAgent.open_reflections）"""
+    return {pid: agents_map[pid].open_reflections() for pid in player_ids}
+
+
+def _close_reflections(agents_map: Dict, player_ids: List[int]):
+    """阶段结束：超时仍未完成的反思令牌过期，之后完成也不再写入记忆（不会与下一阶段竞争）"""
+    for pid in player_ids:
+        agents_map[pid].close_reflections()
+
+
+def _collect_results(futures: List, timeout: float, error_label: str, fallbacks: List = None) -> List[dict]:
+    """按提交顺序收集一组任务的结果，最多等待 timeout 秒
+    
+    超时或失败的任务不会中断收集：提供了 fallbacks（与 futures 一一对应的无参函数）时使用降级结果，否则只记录错误。
+    超时后不再等待仍在运行的任务（运行中的任务无法取消，其LLM请求会在自身截止时间后结束），
+    调用方应以 shutdown(wait=False, cancel_futures=True) 关闭线程池，而不是在 with 块退出时阻塞
+    """
+    done, _ = wait(futures, timeout=timeout)
+    results = []
+    for i, future in enumerate(futures):
+        if future in done:
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"    ⚠️  {error_label}超时或失败: {e}")
+                result = fallbacks[i]() if fallbacks else None
+        else:
+            print(f"    ⚠️  {error_label}超时或失败: timeout")
+            result = fallbacks[i]() if fallbacks else None
+        if result:
+            results.append(result)
+    return results
+
+
 def description_phase(state: GameState) -> GameState:
-    """描述阶段节点 - 每个agent轮流向所有其他agent说话"""
+    """描述阶段节点 - 每个agent轮流向所有其他agent说话
+    
+    发言仍严格按顺序进行；身份反思按Agent流水线执行（见 _AgentPipeline），
+    下一位发言者只等待自己的反思完成，与其他玩家的反思重叠进行。
+    """
     print(f"\n💬 第 {state['round']} 轮 - 描述阶段（每个玩家轮流向所有人说话）")
     
     players = state["players"]
     current_descriptions = []
     conversation_history = []
     
-    # 使用持久化的Agent实例（从state中获取）
-    agents_map = state.get("agents_map", {})
+    # 使用持久化的Agent实例（按game_id从注册表中获取）
+    agents_map = _require_agents_map(state)
+    
+    # 获取 output_dir 和 game_id 用于保存 prompt
+    output_dir = state.get("output_dir", "game_results")
+    game_id = state.get("game_id", "unknown")
 
     # 首先确定所有存活玩家的发言顺序
-    alive_players_list = [p for p in players if p["alive"]]
-    player_speaking_order = {}  # {player_id: speaking_order}
-    for idx, p in enumerate(alive_players_list, start=1):
-        player_speaking_order[p["player_id"]] = idx
+    player_speaking_order = _get_speaking_order(players)
+    # 按反思节奏决定每次发言后哪些玩家进行身份反思
+    round_reflections = ReflectionSchedule.parse(state.get("reflection_schedule")).start_round(
+        [p["player_id"] for p in players if p["alive"]]
+    )
+    # 历史描述（所有之前轮次的描述）在本轮内不变
+    history_descriptions = _get_history_descriptions(players, agents_map, state["round"])
     
-    speaking_order = 0
-    for player in players:
-        if not player["alive"]:
-            continue
-        
-        speaking_order += 1
-        agent = agents_map[player["player_id"]]
-        
-        # 获取 output_dir 和 game_id 用于保存 prompt
-        output_dir = state.get("output_dir", "game_results")
-        game_id = state.get("game_id", "unknown")
+    # 本阶段所有反思等待共享一个截止时间，最坏情况下的等待不随玩家数增长
+    deadline = time.monotonic() + DESCRIPTION_REFLECTION_DEADLINE
+    
+    def process_reflection(reflection_player, all_descriptions, speaker_id, token):
+        """处理单个玩家的身份反思（在该玩家自己的队列中执行）"""
+        other_agent = agents_map[reflection_player["player_id"]]
+        # 获取这个agent的实际发言顺序
+        other_speaking_order = player_speaking_order.get(reflection_player["player_id"], 999)
         
-        # 生成描述：Agent从记忆中读取历史描述和当前轮次已说过的描述（排除自己），避免重复
-        description = agent.generate_description(
+        # 进行身份审视（静默进行，不打印，结果保存在记忆中）
+        reflection_result = other_agent.reflect_on_identity(
             state["round"],
+            other_speaking_order,
+            all_descriptions,  # 传入所有描述（历史+当前，包括刚发言的玩家）
             output_dir=output_dir,  # 传递 output_dir 用于保存 prompt
-            game_id=game_id  # 传递 game_id 用于保存 prompt
+            game_id=game_id,  # 传递 game_id 用于保存 prompt
+            speaker_id=speaker_id,  # 传递触发这次 reflection 的发言者ID
+            token=token,  # 令牌过期（阶段结束或发言者不再等待）后结果不写入记忆
+            history_from_memory=True  # 历史描述取自公开记录，与每个agent记忆中的相同
         )
+        # 保存 reflection_result 到文件（已取消输出重定向）
+        # if reflection_result and output_dir and game_id:
+        #     try:
+        #         result_dir = os.path.join(output_dir, "identity_reflection_results")
+        #         os.makedirs(result_dir, exist_ok=True)
+        #         
+        #         # 文件名格式：round_{round_num}_player_{player_id}_after_{speaker_id}_result.json
+        #         if speaker_id:
+        #             filename = f"round_{state['round']}_player_{reflection_player['player_id']}_after_{speaker_id}_result.json"
+        #         else:
+        #             filename = f"round_{state['round']}_player_{reflection_player['player_id']}_result.json"
+        #         
+        #         filepath = os.path.join(result_dir, filename)
+        #         
+        #         # 构建完整的保存数据（包含元数据和结果）
+        #         result_data = {
+        #             "game_id": game_id,
+        #             "round": state["round"],
+        #             "reflection_player_id": reflection_player["player_id"],
+        #             "reflection_player_name": reflection_player["name"],
+        #             "reflection_player_word": reflection_player.get("word", ""),
+        #             "reflection_player_speaking_order": other_speaking_order,
+        #             "triggered_after_speaker_id": speaker_id,
+        #             "reflection_result": reflection_result
+        #         }
+        #         
+        #         # 写入 JSON 文件
+        #         with open(filepath, "w", encoding="utf-8") as f:
+        #             json.dump(result_data, f, ensure_ascii=False, indent=2)
+        #         
+        #         print(f"    💾 已保存 identity reflection result 到: {filepath}")
+        #     except Exception as e:
+        #         print(f"    ⚠️  保存 identity reflection result 失败: {e}")
         
-        description_entry = {
-            "round": state["round"],  # 添加round字段，用于区分历史描述和当前描述
-            "player_id": player["player_id"],
-            "description": description,
-            "name": player["name"],  # 添加name，用于记忆
+        return {
+            "player": reflection_player,
+            "reflection_result": reflection_result
         }
-        
-        current_descriptions.append(description_entry)
-        
-        # 更新玩家的描述历史
-        player["description_history"].append(description)
-        
-        conversation_history.append({
-            "type": "description",
-            "round": state["round"],
-            "player_id": player["player_id"],
-            "content": description
-        })
-        
-        print(f"  {player['name']} 对所有人说: {description}")
-        
-        # 实时更新所有Agent的记忆，让后续说话的agent能看到前面已说过的描述
-        for p in players:
-            if not p["alive"]:
+    
+    alive_ids = [p["player_id"] for p in players if p["alive"]]
+    pipeline = _AgentPipeline(alive_ids)
+    tokens = _open_reflections(agents_map, alive_ids)
+    reflection_batches = []
+    try:
+        for player in players:
+            if not player["alive"]:
                 continue
-            agents_map[p["player_id"]].add_to_memory(state["round"], descriptions=[description_entry])
-        
-        # 实时身份审视：让所有其他agent重新审视自己的身份（并发执行）
-        reflection_players = [p for p in players if p["alive"] and p["player_id"] != player["player_id"]]
-        
-        if reflection_players:
-            # 获取历史描述（所有之前轮次的描述）
-            history_descriptions = []
-            if players and agents_map:
-                # 使用第一个存活玩家的agent来获取历史描述（所有agent的记忆中历史描述应该是一样的）
-                first_alive_player = next((p for p in players if p["alive"]), None)
-                if first_alive_player:
-                    agent = agents_map[first_alive_player["player_id"]]
-                    # 从agent的记忆中获取历史描述
-                    for desc in agent.memory.get("all_descriptions", []):
-                        if desc.get("round", 0) < state["round"]:
-                            history_descriptions.append(desc)
             
-            # 定义身份反思函数，用于并发执行
-            def process_reflection(reflection_player):
-                """处理单个玩家的身份反思（用于并发执行）"""
-                if not reflection_player["alive"]:
-                    return None
-                
-                other_agent = agents_map[reflection_player["player_id"]]
-                # 获取这个agent的实际发言顺序
-                other_speaking_order = player_speaking_order.get(reflection_player["player_id"], 999)
-                
-                # 合并历史描述和当前描述
-                all_descriptions = history_descriptions + current_descriptions
-                
-                # 获取 output_dir 和 game_id 用于保存 prompt
-                output_dir = state.get("output_dir", "game_results")
-                game_id = state.get("game_id", "unknown")
-                speaker_id = player["player_id"]  # 触发这次 reflection 的发言者ID
-                
-                # 进行身份审视（静默进行，不打印，结果保存在记忆中）
-                reflection_result = other_agent.reflect_on_identity(
-                    state["round"],
-                    other_speaking_order,
-                    all_descriptions,  # 传入所有描述（历史+当前，包括刚发言的玩家）
-                    output_dir=output_dir,  # 传递 output_dir 用于保存 prompt
-                    game_id=game_id,  # 传递 game_id 用于保存 prompt
-                    speaker_id=speaker_id  # 传递触发这次 reflection 的发言者ID
-                )     
-                # 保存 reflection_result 到文件（已取消输出重定向）
-                # if reflection_result and output_dir and game_id:
-                #     try:
-                #         result_dir = os.path.join(output_dir, "identity_reflection_results")
-                #         os.makedirs(result_dir, exist_ok=True)
-                #         
-                #         # 文件名格式：round_{round_num}_player_{player_id}_after_{speaker_id}_result.json
-                #         if speaker_id:
-                #             filename = f"round_{state['round']}_player_{reflection_player['player_id']}_after_{speaker_id}_result.json"
-                #         else:
-                #             filename = f"round_{state['round']}_player_{reflection_player['player_id']}_result.json"
-                #         
-                #         filepath = os.path.join(result_dir, filename)
-                #         
-                #         # 构建完整的保存数据（包含元数据和结果）
-                #         result_data = {
-                #             "game_id": game_id,
-                #             "round": state["round"],
-                #             "reflection_player_id": reflection_player["player_id"],
-                #             "reflection_player_name": reflection_player["name"],
-                #             "reflection_player_word": reflection_player.get("word", ""),
-                #             "reflection_player_speaking_order": other_speaking_order,
-                #             "triggered_after_speaker_id": speaker_id,
-                #             "reflection_result": reflection_result
-                #         }
-                #         
-                #         # 写入 JSON 文件
-                #         with open(filepath, "w", encoding="utf-8") as f:
-                #             json.dump(result_data, f, ensure_ascii=False, indent=2)
-                #         
-                #         print(f"    💾 已保存 identity reflection result 到: {filepath}")
-                #     except Exception as e:
-                #         print(f"    ⚠️  保存 identity reflection result 失败: {e}")
-                
-                return {
-                    "player": reflection_player,
-                    "reflection_result": reflection_result
-                }
+            agent = agents_map[player["player_id"]]
             
-            # 使用线程池并发执行身份反思
-            REFLECTION_TIMEOUT = 120.0  # 身份反思超时时间（秒）
-            with ThreadPoolExecutor(max_workers=len(reflection_players)) as executor:
-                # 提交所有身份反思任务
-                future_to_player = {
-                    executor.submit(process_reflection, p): p 
-                    for p in reflection_players
-                }
-                
-                # 收集结果（按完成顺序），设置超时
-                reflection_results = []
-                for future in as_completed(future_to_player, timeout=REFLECTION_TIMEOUT):
-                    try:
-                        result = future.result(timeout=REFLECTION_TIMEOUT)
-                        if result:
-                            reflection_results.append(result)
-                    except Exception as e:
-                        # 如果某个任务超时或失败，记录错误但继续处理其他任务
-                        print(f"    ⚠️  身份反思任务超时或失败: {e}")
-                        continue
+            # 之前的描述已同步写入记忆；发言者只需等自己之前的反思（更新它的身份分析）完成
+            if not pipeline.wait(player["player_id"], _remaining(deadline)):
+                # 超时：之前的反思不再写入记忆，不与本次发言竞争
+                tokens[player["player_id"]] = agent.open_reflections()
+            
+            # 生成描述：Agent从记忆中读取历史描述和当前轮次已说过的描述（排除自己），避免重复
+            description = agent.generate_description(
+                state["round"],
+                output_dir=output_dir,  # 传递 output_dir 用于保存 prompt
+                game_id=game_id  # 传递 game_id 用于保存 prompt
+            )
             
+            _record_description(state, player, description, agents_map, current_descriptions, conversation_history)
+            
+            # 实时身份审视：让到达反思节点的agent重新审视自己的身份（各自队列中并发执行）
+            # 默认每次发言后所有其他agent都反思；per_round / every_k 节奏下只在节点处反思
+            due = round_reflections.record(player["player_id"])
+            if due:
+                # 合并历史描述和当前描述（快照，后续发言不影响这次反思）
+                all_descriptions = history_descriptions + current_descriptions
+                reflection_batches.append([
+                    pipeline.submit(p["player_id"], process_reflection, p, all_descriptions, player["player_id"],
+                                    tokens[p["player_id"]])
+                    for p in players if p["player_id"] in due
+                ])
+        
+        # 进入投票前等待本轮所有反思完成（剩余的共享预算）
+        for futures in reflection_batches:
             # 可选：打印身份审视结果（用于调试）
-            for result in reflection_results:
-                p = result["player"]
-                reflection_result = result["reflection_result"]
-                if reflection_result:
-                    print(f"    💭 {p['name']} 重新审视身份: {reflection_result.get('role_guess', 'unknown')} (信心: {reflection_result.get('confidence', 'medium')})")
+            _print_reflection_results(_collect_results(futures, _remaining(deadline), "身份反思任务"))
+    finally:
+        pipeline.close()
+        _close_reflections(agents_map, alive_ids)
     
+    # 只返回本节点更新的字段（新的 players 列表，描述历史已更新）
     return {
-        **state,
-        "game_id": state.get("game_id"),  # 明确保留game_id
-        "output_dir": state.get("output_dir", "game_results"),  # 明确保留output_dir
         "phase": "voting",
+        "players": _with_description_history(players, current_descriptions),
         "current_descriptions": current_descriptions,
-        "agents_map": agents_map,  # 保存更新后的Agent实例
         "conversation_history": conversation_history
     }
 
 
-def voting_phase(state: GameState) -> GameState:
-    """投票阶段节点 - 如果有平票，没有人出局，直接进入下一轮"""
-    print(f"\n🗳️  第 {state['round']} 轮 - 投票阶段")
-    
-    players = state["players"]
-    descriptions = state["current_descriptions"]
-    alive_player_ids = [p["player_id"] for p in players if p["alive"]]
-    
-    # 使用持久化的Agent实例（从state中获取）
-    agents_map = state.get("agents_map", {})
-    
-    # 如果agents_map为空，重新创建（使用默认模型配置）
+def _require_agents_map(state: GameState) -> Dict:
+    """获取本局的Agent实例（在 initialize_game 中按本局的模型配置创建并登记）
+
+    注册表中没有时直接报错，而不是用默认模型悄悄重建：那样会丢掉本局的模型配置和记忆
+    （例如游戏已被 release_game 释放，或从检查点恢复到了新进程）
+    """
+    game_id = state.get("game_id")
+    agents_map = get_game_agents(game_id)
     if not agents_map:
-        for player in players:
-            if not player["alive"]:
-                continue
-            # 创建默认模型实例
-            model = GameModel()
-            agent = PlayerAgent(
-                player_id=player["player_id"],
-                name=player["name"],
-                word=player["word"],
-                model=model
-            )
-            agents_map[player["player_id"]] = agent
+        raise RuntimeError(f"游戏 {game_id} 的Agent未在注册表中登记（已释放或不在当前进程），请从 initialize_game 重新开始该局")
+    return agents_map
+
+
+def _build_vote_result(player: PlayerState, agent, voting_result: dict, alive_ids: List[int]) -> dict:
+    """校验投票目标（无效时随机投给其他存活玩家），返回投票结果"""
+    # 提取投票目标（vote_number就是玩家ID）
+    target_id = voting_result.get("vote_number", 0)
+    target_reason = voting_result.get("reason", "No reason")
     
-    # 获取 output_dir 和 game_id 用于保存 prompt
-    output_dir = state.get("output_dir", "game_results")
-    game_id = state.get("game_id", "unknown")
+    # 验证target_id有效
+    valid_targets = [pid for pid in alive_ids if pid != player["player_id"]]
     
-    # 定义投票函数，用于并发执行
-    def process_vote(player, current_descriptions_list):
-        """处理单个玩家的投票（用于并发执行）"""
-        if not player["alive"]:
-            return None
-        
-        agent = agents_map[player["player_id"]]
-        alive_ids = [p["player_id"] for p in players if p["alive"]]
-        
-        # 获取投票结果（包含reason和vote_number）
-        voting_result = agent.vote(
-            alive_ids, 
-            current_descriptions_list, 
-            state["round"],
-            is_tie_break=False,
-            tie_players=None,
-            output_dir=output_dir,  # 传递 output_dir 用于保存 prompt
-            game_id=game_id  # 传递 game_id 用于保存 prompt
-        )
-        
-        # 提取投票目标（vote_number就是玩家ID）
-        target_id = voting_result.get("vote_number", 0)
-        target_reason = voting_result.get("reason", "No reason")
-        
-        # 验证target_id有效
-        valid_targets = [pid for pid in alive_ids if pid != player["player_id"]]
-        
-        if target_id not in valid_targets or target_id == player["player_id"]:
-            # 如果无效，随机选择一个
-            if valid_targets:
-                target_id = random.choice(valid_targets)
-                target_reason = "Failed to parse response, random vote"
-            else:
-                target_id = alive_ids[0] if alive_ids else player["player_id"]
-                target_reason = "Default vote"
-        
-        return {
-            "player": player,
-            "agent": agent,
-            "voting_result": voting_result,
-            "target_id": target_id,
-            "target_reason": target_reason
-        }
-    
-    # 重置投票计数
-    for player in players:
-        player["votes_received"] = 0
+    if target_id not in valid_targets or target_id == player["player_id"]:
+        # 如果无效，随机选择一个
+        if valid_targets:
+            target_id = random.choice(valid_targets)
+            target_reason = "Failed to parse response, random vote"
+        else:
+            target_id = alive_ids[0] if alive_ids else player["player_id"]
+            target_reason = "Default vote"
     
+    return {
+        "player": player,
+        "agent": agent,
+        "voting_result": voting_result,
+        "target_id": target_id,
+        "target_reason": target_reason
+    }
+
+
+def _fallback_vote_result(player: PlayerState, agents_map: Dict, alive_ids: List[int], round_num: int) -> dict:
+    """投票任务超时或失败时的默认投票结果"""
+    agent = agents_map[player["player_id"]]
+    voting_result = agent._default_vote(alive_ids, round_num, TimeoutError("投票超时"))
+    return _build_vote_result(player, agent, voting_result, alive_ids)
+
+
+def _apply_vote_results(state: GameState, vote_results: List[dict], 
+                        current_descriptions_list: List[dict], agents_map: Dict) -> GameState:
+    """统计投票结果、更新所有Agent的记忆并确定淘汰玩家"""
+    players = state["players"]
     current_votes = []
-    alive_players_list = [p for p in players if p["alive"]]
-    current_descriptions_list = descriptions.copy()
     conversation_history = []
-    
-    print(f"  🚀 并发执行 {len(alive_players_list)} 个玩家的投票...")
-    
-    # 使用线程池并发执行投票
-    VOTING_TIMEOUT = 120.0  # 投票超时时间（秒）
-    with ThreadPoolExecutor(max_workers=len(alive_players_list)) as executor:
-        # 提交所有投票任务
-        future_to_player = {
-            executor.submit(process_vote, player, current_descriptions_list): player 
-            for player in alive_players_list
-        }
-        
-        # 收集结果（按完成顺序），设置超时
-        vote_results = []
-        for future in as_completed(future_to_player, timeout=VOTING_TIMEOUT):
-            try:
-                result = future.result(timeout=VOTING_TIMEOUT)
-                if result:
-                    vote_results.append(result)
-            except Exception as e:
-                # 如果某个任务超时或失败，记录错误但继续处理其他任务
-                print(f"    ⚠️  投票任务超时或失败: {e}")
-                continue
+    vote_counts = {}
     
     # 处理投票结果
     for result in vote_results:
@@ -489,12 +573,8 @@ def voting_phase(state: GameState) -> GameState:
         })
         
         # 更新被投票者的计数
-        target_player = None
-        for p in players:
-            if p["player_id"] == target_id:
-                p["votes_received"] += 1
-                target_player = p
-                break
+        vote_counts[target_id] = vote_counts.get(target_id, 0) + 1
+        target_player = next((p for p in players if p["player_id"] == target_id), None)
         
         # 更新Agent的投票记忆
         # 1. 记录自己投给了谁（包含完整的reason，不包含thinking）
@@ -530,19 +610,18 @@ def voting_phase(state: GameState) -> GameState:
     for vote in current_votes:
         voter_player = next((p for p in players if p["player_id"] == vote["voter_id"]), None)
         target_player = next((p for p in players if p["player_id"] == vote["target_id"]), None)
-        all_votes_list.append({
-            "voter_id": vote["voter_id"],
-            "target_id": vote["target_id"],
-            "voter_name": voter_player["name"] if voter_player else f"Player {vote['voter_id']}",
-            "target_name": target_player["name"] if target_player else f"Player {vote['target_id']}"
-        })
+        all_votes_list.append(VoteRecord(
+            voter_id=vote["voter_id"],
+            target_id=vote["target_id"],
+            voter_name=voter_player["name"] if voter_player else f"Player {vote['voter_id']}",
+            target_name=target_player["name"] if target_player else f"Player {vote['target_id']}"
+        ))
     
-    # 更新所有Agent的记忆，添加所有人的投票记录
-    for player in players:
-        if not player["alive"]:
-            continue
-        agent = agents_map[player["player_id"]]
-        agent.add_to_memory(state["round"], all_votes=all_votes_list)
+    # 更新所有Agent的记忆，添加所有人的投票记录（本局只存一份）
+    _publish_public_event(players, agents_map, "all_votes_history", RoundVotes(round=state["round"], votes=all_votes_list))
+    
+    # 本轮得票写入新的 PlayerState（不修改已有状态中的记录）
+    players = [replace(p, votes_received=vote_counts.get(p["player_id"], 0)) for p in players]
     
     # 找出得票最多的玩家（用于确定被淘汰的玩家）
     max_votes = max(p["votes_received"] for p in players if p["alive"])
@@ -556,54 +635,106 @@ def voting_phase(state: GameState) -> GameState:
         print(f"  ➡️  没有人出局，直接进入下一轮...")
         
         return {
-            **state,
-            "game_id": state.get("game_id"),  # 明确保留game_id
-            "output_dir": state.get("output_dir", "game_results"),  # 明确保留output_dir
             "phase": "check",
+            "players": players,
             "current_votes": current_votes,
             "current_descriptions": current_descriptions_list,
-            "agents_map": agents_map,  # 保存Agent实例
             "conversation_history": conversation_history
         }
     else:
         # 没有平票，确定淘汰玩家
-        eliminated = candidates[0]
-        eliminated["alive"] = False
+        eliminated = replace(candidates[0], alive=False)
+        players = [eliminated if p["player_id"] == eliminated["player_id"] else p for p in players]
         
         print(f"\n❌ 玩家{eliminated['player_id']} ({eliminated['role']}) 被淘汰！")
         
-        elimination_history = state.get("elimination_history", [])
-        elimination_history.append({
+        # 返回新列表而不是原地追加，已有的状态（以及检查点）不会被修改
+        elimination_history = state.get("elimination_history", []) + [{
             "round": state["round"],
             "player_id": eliminated["player_id"],
             "role": eliminated["role"],
             "votes": eliminated["votes_received"]
-        })
+        }]
         
-        eliminated_players = state.get("eliminated_players", [])
-        eliminated_players.append(eliminated["player_id"])
+        eliminated_players = state.get("eliminated_players", []) + [eliminated["player_id"]]
         
         return {
-            **state,
-            "game_id": state.get("game_id"),  # 明确保留game_id
-            "output_dir": state.get("output_dir", "game_results"),  # 明确保留output_dir
             "phase": "check",
+            "players": players,
             "current_votes": current_votes,
             "current_descriptions": current_descriptions_list,
             "eliminated_players": eliminated_players,
             "elimination_history": elimination_history,
-            "agents_map": agents_map,  # 保存Agent实例
             "conversation_history": conversation_history
         }
 
 
-def check_win_condition(state: GameState) -> GameState:
-    """检查胜利条件节点"""
-    print(f"\n🎯 检查胜利条件...")
+def voting_phase(state: GameState) -> GameState:
+    """投票阶段节点 - 如果有平票，没有人出局，直接进入下一轮"""
+    print(f"\n🗳️  第 {state['round']} 轮 - 投票阶段")
     
-    # 不再保存txt格式的记忆文件，所有信息已保存在JSON格式中
-    # save_agent_memories(state)  # 已禁用
+    players = state["players"]
+    descriptions = state["current_descriptions"]
+    alive_player_ids = [p["player_id"] for p in players if p["alive"]]
+    
+    # 使用持久化的Agent实例（按game_id从注册表中获取）
+    agents_map = _require_agents_map(state)
+    
+    # 获取 output_dir 和 game_id 用于保存 prompt
+    output_dir = state.get("output_dir", "game_results")
+    game_id = state.get("game_id", "unknown")
     
+    # 定义投票函数，用于并发执行
+    def process_vote(player, current_descriptions_list):
+        """处理单个玩家的投票（用于并发执行）"""
+        if not player["alive"]:
+            return None
+        
+        agent = agents_map[player["player_id"]]
+        alive_ids = [p["player_id"] for p in players if p["alive"]]
+        
+        # 获取投票结果（包含reason和vote_number）
+        voting_result = agent.vote(
+            alive_ids, 
+            current_descriptions_list, 
+            state["round"],
+            is_tie_break=False,
+            tie_players=None,
+            output_dir=output_dir,  # 传递 output_dir 用于保存 prompt
+            game_id=game_id  # 传递 game_id 用于保存 prompt
+        )
+        
+        return _build_vote_result(player, agent, voting_result, alive_ids)
+    
+    alive_players_list = [p for p in players if p["alive"]]
+    current_descriptions_list = descriptions.copy()
+    
+    print(f"  🚀 并发执行 {len(alive_players_list)} 个玩家的投票...")
+    
+    # 使用线程池并发执行投票
+    VOTING_TIMEOUT = 120.0  # 投票超时时间（秒）
+    executor = ThreadPoolExecutor(max_workers=len(alive_players_list))
+    try:
+        # 提交所有投票任务
+        futures = [
+            executor.submit(process_vote, player, current_descriptions_list)
+            for player in alive_players_list
+        ]
+        
+        # 收集结果（按提交顺序）；超时或失败的玩家使用默认投票，不影响其他玩家
+        vote_results = _collect_results(
+            futures, VOTING_TIMEOUT, "投票任务",
+            fallbacks=[partial(_fallback_vote_result, player, agents_map, alive_player_ids, state["round"])
+                       for player in alive_players_list]
+        )
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    
+    return _apply_vote_results(state, vote_results, current_descriptions_list, agents_map)
+
+
+def _decide_winner(state: GameState):
+    """统计存活身份并判断游戏是否结束，返回 (game_over, winner, alive_civilians, alive_undercover)"""
     players = state["players"]
     
     alive_civilians = sum(1 for p in players if p["alive"] and p["role"] == "civilian")
@@ -624,32 +755,95 @@ def check_win_condition(state: GameState) -> GameState:
         game_over = True
         winner = "undercover"
         print(f"🎉 卧底胜利！游戏在第 {state['round']} 轮结束")
-    else:
+    
+    return game_over, winner, alive_civilians, alive_undercover
+
+
+def _get_round_eliminated_player(state: GameState):
+    """确定被淘汰的玩家（从上一轮的投票结果中获取）"""
+    eliminated_player = None
+    elimination_history = state.get("elimination_history", [])
+    if elimination_history:
+        last_elimination = elimination_history[-1]
+        if last_elimination.get("round") == state["round"]:
+            eliminated_player = {
+                "player_id": last_elimination.get("player_id"),
+                "name": f"Player {last_elimination.get('player_id')}",
+                "role": last_elimination.get("role")
+            }
+    return eliminated_player
+
+
+def _get_votes_with_names(players: List[PlayerState], current_votes: List[dict]) -> List[dict]:
+    """准备投票结果列表（包含 voter_name 和 target_name）"""
+    votes_for_reflection = []
+    for vote in current_votes:
+        voter_player = next((p for p in players if p["player_id"] == vote["voter_id"]), None)
+        target_player = next((p for p in players if p["player_id"] == vote["target_id"]), None)
+        votes_for_reflection.append({
+            "voter_id": vote["voter_id"],
+            "target_id": vote["target_id"],
+            "voter_name": voter_player["name"] if voter_player else f"Player {vote['voter_id']}",
+            "target_name": target_player["name"] if target_player else f"Player {vote['target_id']}"
+        })
+    return votes_for_reflection
+
+
+def _print_voting_reflection_results(voting_reflection_results: List[dict]):
+    """打印投票后身份审视结果（用于调试）"""
+    for result in voting_reflection_results:
+        p = result["player"]
+        reflection_result = result["reflection_result"]
+        if reflection_result:
+            print(f"    💭 {p['name']} 投票后重新审视身份: {reflection_result.get('self_analysis', {}).get('role_guess', 'unknown')} (信心: {reflection_result.get('self_analysis', {}).get('confidence', 'medium')})")
+
+
+def _check_result(state: GameState, game_over: bool, winner, 
+                  alive_civilians: int, alive_undercover: int) -> GameState:
+    return {
+        "phase": "end" if game_over else "description",
+        "round": state["round"] + (0 if game_over else 1),
+        "game_over": game_over,
+        "winner": winner,
+        "conversation_history": [{
+            "type": "check",
+            "round": state["round"],
+            "alive_civilians": alive_civilians,
+            "alive_undercover": alive_undercover,
+            "game_over": game_over,
+            "winner": winner
+        }]
+    }
+
+
+def check_win_condition(state: GameState) -> GameState:
+    """检查胜利条件节点"""
+    print(f"\n🎯 检查胜利条件...")
+    
+    # 不再保存txt格式的记忆文件，所有信息已保存在JSON格式中
+    # save_agent_memories(state)  # 已禁用
+    
+    players = state["players"]
+    
+    game_over, winner, alive_civilians, alive_undercover = _decide_winner(state)
+    
+    if not game_over:
         # 游戏继续，进行投票后的身份反思
         print("➡️  游戏继续，进入投票后身份反思阶段...")
         
         # 投票后的身份反思：让所有存活玩家基于投票行为重新审视身份
-        agents_map = state.get("agents_map", {})
+        agents_map = get_game_agents(state.get("game_id"))
         current_votes = state.get("current_votes", [])
         output_dir = state.get("output_dir", "game_results")
         game_id = state.get("game_id", "unknown")
         
         # 确定被淘汰的玩家（从上一轮的投票结果中获取）
-        eliminated_player = None
-        elimination_history = state.get("elimination_history", [])
-        if elimination_history:
-            last_elimination = elimination_history[-1]
-            if last_elimination.get("round") == state["round"]:
-                eliminated_player = {
-                    "player_id": last_elimination.get("player_id"),
-                    "name": f"Player {last_elimination.get('player_id')}",
-                    "role": last_elimination.get("role")
-                }
+        eliminated_player = _get_round_eliminated_player(state)
         
         alive_players_for_reflection = [p for p in players if p["alive"]]
         
         # 定义投票后身份反思函数，用于并发执行
-        def process_voting_reflection(reflection_player):
+        def process_voting_reflection(reflection_player, token):
             """处理单个玩家的投票后身份反思（用于并发执行）"""
             if not reflection_player["alive"]:
                 return None
@@ -657,16 +851,7 @@ def check_win_condition(state: GameState) -> GameState:
             other_agent = agents_map[reflection_player["player_id"]]
             
             # 准备投票结果列表（包含 voter_name 和 target_name）
-            votes_for_reflection = []
-            for vote in current_votes:
-                voter_player = next((p for p in players if p["player_id"] == vote["voter_id"]), None)
-                target_player = next((p for p in players if p["player_id"] == vote["target_id"]), None)
-                votes_for_reflection.append({
-                    "voter_id": vote["voter_id"],
-                    "target_id": vote["target_id"],
-                    "voter_name": voter_player["name"] if voter_player else f"Player {vote['voter_id']}",
-                    "target_name": target_player["name"] if target_player else f"Player {vote['target_id']}"
-                })
+            votes_for_reflection = _get_votes_with_names(players, current_votes)
             
             # 进行投票后的身份审视
             reflection_result = other_agent.reflect_on_identity_after_voting(
@@ -674,7 +859,8 @@ def check_win_condition(state: GameState) -> GameState:
                 votes_for_reflection,
                 eliminated_player=eliminated_player,
                 output_dir=output_dir,
-                game_id=game_id
+                game_id=game_id,
+                token=token
             )
             
             return {
@@ -685,55 +871,280 @@ def check_win_condition(state: GameState) -> GameState:
         # 使用线程池并发执行投票后身份反思
         if alive_players_for_reflection and agents_map:
             REFLECTION_TIMEOUT = 120.0  # 身份反思超时时间（秒）
-            with ThreadPoolExecutor(max_workers=len(alive_players_for_reflection)) as executor:
+            reflection_ids = [p["player_id"] for p in alive_players_for_reflection]
+            tokens = _open_reflections(agents_map, reflection_ids)
+            executor = ThreadPoolExecutor(max_workers=len(alive_players_for_reflection))
+            try:
                 # 提交所有投票后身份反思任务
-                future_to_player = {
-                    executor.submit(process_voting_reflection, p): p 
+                futures = [
+                    executor.submit(process_voting_reflection, p, tokens[p["player_id"]])
                     for p in alive_players_for_reflection
-                }
-                
-                # 收集结果（按完成顺序），设置超时
-                voting_reflection_results = []
-                for future in as_completed(future_to_player, timeout=REFLECTION_TIMEOUT):
-                    try:
-                        result = future.result(timeout=REFLECTION_TIMEOUT)
-                        if result:
-                            voting_reflection_results.append(result)
-                    except Exception as e:
-                        # 如果某个任务超时或失败，记录错误但继续处理其他任务
-                        print(f"    ⚠️  投票后身份反思任务超时或失败: {e}")
-                        continue
+                ]
                 
-                # 可选：打印投票后身份审视结果（用于调试）
-                for result in voting_reflection_results:
-                    p = result["player"]
-                    reflection_result = result["reflection_result"]
-                    if reflection_result:
-                        print(f"    💭 {p['name']} 投票后重新审视身份: {reflection_result.get('self_analysis', {}).get('role_guess', 'unknown')} (信心: {reflection_result.get('self_analysis', {}).get('confidence', 'medium')})")
+                # 收集结果（按提交顺序），超时的任务不影响其他结果
+                voting_reflection_results = _collect_results(futures, REFLECTION_TIMEOUT, "投票后身份反思任务")
+            finally:
+                executor.shutdown(wait=False, cancel_futures=True)
+                _close_reflections(agents_map, reflection_ids)
+            
+            # 可选：打印投票后身份审视结果（用于调试）
+            _print_voting_reflection_results(voting_reflection_results)
+    
+    return _check_result(state, game_over, winner, alive_civilians, alive_undercover)
+
+
+async def _gather_with_timeout(coros, timeout: float, error_label: str, fallbacks: List = None) -> List[dict]:
+    """并发等待一组协程，超时的任务会被取消；失败或超时的任务使用 fallbacks 中对应的降级结果（如果提供），否则只记录错误"""
+    tasks = [asyncio.ensure_future(c) for c in coros]
+    if not tasks:
+        return []
+    done, pending = await asyncio.wait(tasks, timeout=timeout)
+    for task in pending:
+        task.cancel()
+        print(f"    ⚠️  {error_label}超时或失败: timeout")
+    results = []
+    for i, task in enumerate(tasks):
+        if task not in done:
+            result = fallbacks[i]() if fallbacks else None
+        else:
+            try:
+                result = task.result()
+            except Exception as e:
+                # 如果某个任务失败，记录错误但继续处理其他任务
+                print(f"    ⚠️  {error_label}超时或失败: {e}")
+                result = fallbacks[i]() if fallbacks else None
+        if result:
+            results.append(result)
+    return results
+
+
+class _AsyncAgentPipeline:
+    """_AgentPipeline 的异步版本：每个Agent一条反思任务链，链上的任务按提交顺序依次执行"""
+    
+    def __init__(self, player_ids: List[int]):
+        self.last = {pid: None for pid in player_ids}
+    
+    def submit(self, player_id: int, fn, *args) -> asyncio.Future:
+        task = asyncio.ensure_future(self._run_after(self.last[player_id], fn, args))
+        self.last[player_id] = task
+        return task
+    
+    @staticmethod
+    async def _run_after(prev, fn, args):
+        if prev is not None:
+            # 前一个任务失败或被取消都不影响后续任务
+            await asyncio.wait([prev])
+        result = fn(*args)
+        if asyncio.iscoroutine(result):
+            result = await result
+        return result
+    
+    async def wait(self, player_id: int, timeout: float) -> bool:
+        task = self.last.get(player_id)
+        if task is None:
+            return True
+        done, _ = await asyncio.wait([task], timeout=timeout)
+        return bool(done)
+    
+    async def close(self):
+        """取消超过截止时间仍未完成的反思"""
+        tasks = [t for t in self.last.values() if t is not None and not t.done()]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.wait(tasks)
+
+
+async def description_phase_async(state: GameState) -> GameState:
+    """描述阶段节点（异步版本）- 发言仍按顺序进行，身份反思按Agent流水线并发执行"""
+    print(f"\n💬 第 {state['round']} 轮 - 描述阶段（每个玩家轮流向所有人说话）")
+    
+    players = state["players"]
+    current_descriptions = []
+    conversation_history = []
+    agents_map = _require_agents_map(state)
+    output_dir = state.get("output_dir", "game_results")
+    game_id = state.get("game_id", "unknown")
+    
+    player_speaking_order = _get_speaking_order(players)
+    round_reflections = ReflectionSchedule.parse(state.get("reflection_schedule")).start_round(
+        [p["player_id"] for p in players if p["alive"]]
+    )
+    history_descriptions = _get_history_descriptions(players, agents_map, state["round"])
+    
+    deadline = time.monotonic() + DESCRIPTION_REFLECTION_DEADLINE
+    
+    async def process_reflection(reflection_player, all_descriptions, speaker_id, token):
+        other_agent = agents_map[reflection_player["player_id"]]
+        reflection_result = await other_agent.reflect_on_identity_async(
+            state["round"],
+            player_speaking_order.get(reflection_player["player_id"], 999),
+            all_descriptions,
+            output_dir=output_dir,
+            game_id=game_id,
+            speaker_id=speaker_id,
+            token=token,
+            history_from_memory=True
+        )
+        return {
+            "player": reflection_player,
+            "reflection_result": reflection_result
+        }
+    
+    alive_ids = [p["player_id"] for p in players if p["alive"]]
+    pipeline = _AsyncAgentPipeline(alive_ids)
+    tokens = _open_reflections(agents_map, alive_ids)
+    reflection_batches = []
+    try:
+        for player in players:
+            if not player["alive"]:
+                continue
+            
+            agent = agents_map[player["player_id"]]
+            # 只等待发言者自己的反思，其他玩家的反思继续在后台进行
+            if not await pipeline.wait(player["player_id"], _remaining(deadline)):
+                tokens[player["player_id"]] = agent.open_reflections()
+            description = await agent.generate_description_async(
+                state["round"],
+                output_dir=output_dir,
+                game_id=game_id
+            )
+            
+            _record_description(state, player, description, agents_map, current_descriptions, conversation_history)
+            
+            due = round_reflections.record(player["player_id"])
+            if due:
+                # 所有反思看到的是同一份快照（历史+当前，包括刚发言的玩家）
+                all_descriptions = history_descriptions + current_descriptions
+                reflection_batches.append([
+                    pipeline.submit(p["player_id"], process_reflection, p, all_descriptions, player["player_id"],
+                                    tokens[p["player_id"]])
+                    for p in players if p["player_id"] in due
+                ])
         
-        # 更新 agents_map（确保反思后的记忆被保存）
-        state["agents_map"] = agents_map
+        for tasks in reflection_batches:
+            reflection_results = await _gather_with_timeout(tasks, _remaining(deadline), "身份反思任务")
+            _print_reflection_results(reflection_results)
+    finally:
+        await pipeline.close()
+        _close_reflections(agents_map, alive_ids)
     
+    # 只返回本节点更新的字段（新的 players 列表，描述历史已更新）
     return {
-        **state,
-        "game_id": state.get("game_id"),  # 明确保留game_id
-        "output_dir": state.get("output_dir", "game_results"),  # 明确保留output_dir
-        "phase": "end" if game_over else "description",
-        "round": state["round"] + (0 if game_over else 1),
-        "game_over": game_over,
-        "winner": winner,
-        "agents_map": state.get("agents_map", {}),  # 明确保留agents_map，确保记忆不丢失
-        "conversation_history": [{
-            "type": "check",
-            "round": state["round"],
-            "alive_civilians": alive_civilians,
-            "alive_undercover": alive_undercover,
-            "game_over": game_over,
-            "winner": winner
-        }]
+        "phase": "voting",
+        "players": _with_description_history(players, current_descriptions),
+        "current_descriptions": current_descriptions,
+        "conversation_history": conversation_history
     }
 
 
+async def voting_phase_async(state: GameState) -> GameState:
+    """投票阶段节点（异步版本）"""
+    print(f"\n🗳️  第 {state['round']} 轮 - 投票阶段")
+    
+    players = state["players"]
+    agents_map = _require_agents_map(state)
+    output_dir = state.get("output_dir", "game_results")
+    game_id = state.get("game_id", "unknown")
+    
+    alive_players_list = [p for p in players if p["alive"]]
+    alive_ids = [p["player_id"] for p in alive_players_list]
+    current_descriptions_list = state["current_descriptions"].copy()
+    
+    async def process_vote(player):
+        agent = agents_map[player["player_id"]]
+        voting_result = await agent.vote_async(
+            alive_ids,
+            current_descriptions_list,
+            state["round"],
+            is_tie_break=False,
+            tie_players=None,
+            output_dir=output_dir,
+            game_id=game_id
+        )
+        return _build_vote_result(player, agent, voting_result, alive_ids)
+    
+    print(f"  🚀 并发执行 {len(alive_players_list)} 个玩家的投票...")
+    
+    VOTING_TIMEOUT = 120.0  # 投票超时时间（秒）
+    vote_results = await _gather_with_timeout(
+        [process_vote(p) for p in alive_players_list], VOTING_TIMEOUT, "投票任务",
+        fallbacks=[partial(_fallback_vote_result, p, agents_map, alive_ids, state["round"])
+                   for p in alive_players_list]
+    )
+    
+    return _apply_vote_results(state, vote_results, current_descriptions_list, agents_map)
+
+
+async def check_win_condition_async(state: GameState) -> GameState:
+    """检查胜利条件节点（异步版本）"""
+    print(f"\n🎯 检查胜利条件...")
+    
+    players = state["players"]
+    game_over, winner, alive_civilians, alive_undercover = _decide_winner(state)
+    
+    agents_map = get_game_agents(state.get("game_id"))
+    alive_players_for_reflection = [p for p in players if p["alive"]]
+    
+    if not game_over and alive_players_for_reflection and agents_map:
+        print("➡️  游戏继续，进入投票后身份反思阶段...")
+        
+        eliminated_player = _get_round_eliminated_player(state)
+        votes_for_reflection = _get_votes_with_names(players, state.get("current_votes", []))
+        
+        async def process_voting_reflection(reflection_player, token):
+            reflection_result = await agents_map[reflection_player["player_id"]].reflect_on_identity_after_voting_async(
+                state["round"],
+                votes_for_reflection,
+                eliminated_player=eliminated_player,
+                output_dir=state.get("output_dir", "game_results"),
+                game_id=state.get("game_id", "unknown"),
+                token=token
+            )
+            return {
+                "player": reflection_player,
+                "reflection_result": reflection_result
+            }
+        
+        REFLECTION_TIMEOUT = 120.0  # 身份反思超时时间（秒）
+        reflection_ids = [p["player_id"] for p in alive_players_for_reflection]
+        tokens = _open_reflections(agents_map, reflection_ids)
+        try:
+            voting_reflection_results = await _gather_with_timeout(
+                [process_voting_reflection(p, tokens[p["player_id"]]) for p in alive_players_for_reflection],
+                REFLECTION_TIMEOUT, "投票后身份反思任务"
+            )
+        finally:
+            _close_reflections(agents_map, reflection_ids)
+        _print_voting_reflection_results(voting_reflection_results)
+    elif not game_over:
+        print("➡️  游戏继续，进入投票后身份反思阶段...")
+    
+    return _check_result(state, game_over, winner, alive_civilians, alive_undercover)
+
+
+def _save_game_entry(path: str, game_id: str, entry: Dict):
+    """把一局游戏的数据以game_id为键追加到JSON文件中（加锁，避免并发对局互相覆盖）"""
+    with _results_file_lock:
+        # 读取现有数据（如果存在）
+        all_games = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    all_games = json.load(f)
+            except (json.JSONDecodeError, FileNotFoundError):
+                all_games = {}
+        
+        # 添加当前游戏的数据
+        all_games[game_id] = entry
+        
+        # 写入文件并立即刷新到磁盘
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(all_games, f, ensure_ascii=False, indent=2, default=json_default)
+            f.flush()  # 立即刷新到磁盘
+            os.fsync(f.fileno())  # 强制同步到磁盘
+
+
 def save_game_results_json(state: GameState, output_dir: str = None):
     """保存游戏结果到JSON文件
     
@@ -755,7 +1166,7 @@ def save_game_results_json(state: GameState, output_dir: str = None):
     
     print(f"🔍 调试: save_game_results_json 使用的 output_dir = {output_dir}")
     
-    agents_map = state.get("agents_map", {})
+    agents_map = get_game_agents(game_id)
     players = state.get("players", [])
     word_pair = state.get("word_pair", {})
     final_round = state.get("round", 0)
@@ -804,23 +1215,7 @@ def save_game_results_json(state: GameState, output_dir: str = None):
     }
     
     game_info_file = os.path.join(output_dir, "game_info.json")
-    # 读取现有数据（如果存在）
-    all_games_info = {}
-    if os.path.exists(game_info_file):
-        try:
-            with open(game_info_file, "r", encoding="utf-8") as f:
-                all_games_info = json.load(f)
-        except (json.JSONDecodeError, FileNotFoundError):
-            all_games_info = {}
-    
-    # 添加当前游戏信息
-    all_games_info[game_id] = game_info
-    
-    # 写入文件并立即刷新到磁盘
-    with open(game_info_file, "w", encoding="utf-8") as f:
-        json.dump(all_games_info, f, ensure_ascii=False, indent=2)
-        f.flush()  # 立即刷新到磁盘
-        os.fsync(f.fileno())  # 强制同步到磁盘
+    _save_game_entry(game_info_file, game_id, game_info)
     print(f"💾 游戏信息已保存到: {game_info_file} (game_id: {game_id})")
     
     # 2. 保存每个Agent的完整记忆（追加到对应的player文件中）
@@ -839,37 +1234,35 @@ def save_game_results_json(state: GameState, output_dir: str = None):
             "word": player.get("word"),
             "alive": player.get("alive"),
             "memory": {
-                "all_descriptions": agent.memory.get("all_descriptions", []),
-                "description_thinking_history": agent.memory.get("description_thinking_history", []),  # 每轮描述前的思考和描述
-                "voting_history": agent.memory.get("voting_history", []),
-                "voting_thinking_history": agent.memory.get("voting_thinking_history", []),  # 投票阶段的思考过程
-                "all_votes_history": agent.memory.get("all_votes_history", []),
-                "player_analyses": agent.memory.get("player_analyses", []),  # 对每个其他玩家的完整分析（包含word_guess和role_guess）
-                "self_analyses": agent.memory.get("self_analyses", [])  # 对自己的完整分析（包含civilian_word_guess和role_guess）
+                "all_descriptions": list(agent.memory.get("all_descriptions", [])),
+                "description_thinking_history": list(agent.memory.get("description_thinking_history", [])),  # 每轮描述前的思考和描述
+                "voting_history": list(agent.memory.get("voting_history", [])),
+                "voting_thinking_history": list(agent.memory.get("voting_thinking_history", [])),  # 投票阶段的思考过程
+                "all_votes_history": list(agent.memory.get("all_votes_history", [])),
+                "player_analyses": list(agent.memory.get("player_analyses", [])),  # 对每个其他玩家的完整分析（包含word_guess和role_guess）
+                "self_analyses": list(agent.memory.get("self_analyses", []))  # 对自己的完整分析（包含civilian_word_guess和role_guess）
             }
         }
         
         agent_memory_file = os.path.join(output_dir, f"agent_player_{player_id}_memory.json")
-        # 读取现有数据（如果存在）
-        all_games_memory = {}
-        if os.path.exists(agent_memory_file):
-            try:
-                with open(agent_memory_file, "r", encoding="utf-8") as f:
-                    all_games_memory = json.load(f)
-            except (json.JSONDecodeError, FileNotFoundError):
-                all_games_memory = {}
-        
-        # 添加当前游戏的记忆
-        all_games_memory[game_id] = agent_memory
-        
-        # 写入文件并立即刷新到磁盘
-        with open(agent_memory_file, "w", encoding="utf-8") as f:
-            json.dump(all_games_memory, f, ensure_ascii=False, indent=2)
-            f.flush()  # 立即刷新到磁盘
-            os.fsync(f.fileno())  # 强制同步到磁盘
+        _save_game_entry(agent_memory_file, game_id, agent_memory)
         print(f"💾 Agent {player_id} 记忆已保存到: {agent_memory_file} (game_id: {game_id})")
 
 
+def _print_latency_summary():
+    """打印各阶段LLM请求延迟（进程内累计）"""
+    summary = get_latency_tracker().summary()
+    if not summary:
+        return
+    print(f"\n⏱️  LLM请求延迟（进程内累计）:")
+    for phase, stats in summary.items():
+        if stats["count"]:
+            print(f"  {phase}: {stats['count']} 次, p50={stats['p50']:.2f}s p95={stats['p95']:.2f}s p99={stats['p99']:.2f}s, "
+                  f"对冲 {stats['hedged']} 次(胜出 {stats['hedge_wins']}), 超时 {stats['timeouts']} 次")
+        else:
+            print(f"  {phase}: 超时 {stats['timeouts']} 次")
+
+
 def end_game(state: GameState) -> GameState:
     """游戏结束节点"""
     print(f"\n" + "="*50)
@@ -892,16 +1285,17 @@ def end_game(state: GameState) -> GameState:
     for elim in state["elimination_history"]:
         print(f"  第{elim['round']}轮: 玩家{elim['player_id']} ({elim['role']}) 被淘汰")
     
+    _print_latency_summary()
+    
     # 保存JSON格式的游戏结果
     print(f"\n💾 保存游戏结果到JSON文件...")
     print(f"🔍 调试: end_game 节点中的 game_id = {state.get('game_id', 'NOT FOUND')}")
     print(f"🔍 调试: end_game 节点中的 output_dir = {state.get('output_dir', 'NOT FOUND')}")
     save_game_results_json(state)
+    # 结果已保存，释放本局的Agent实例
+    release_game(state.get("game_id"))
     
     return {
-        **state,
-        "game_id": state.get("game_id"),  # 明确保留game_id
-        "output_dir": state.get("output_dir", "game_results"),  # 明确保留output_dir
         "conversation_history": [{
             "type": "end",
             "winner": state["winner"],
@@ -0,0 +1,30 @@
+# graph/registry.py
+"""对局运行时注册表：按 game_id 保存每局的 Agent 实例
+
+Agent 实例（含模型客户端、记忆、锁）不可序列化，也不应随状态在节点间复制，
+因此不放在 GameState 中，而是由节点通过 state["game_id"] 在这里查找。
+GameState 只保留小而可序列化的字段，便于 LangGraph 做检查点和多局并发。
+"""
+import threading
+from typing import Dict
+
+_game_agents: Dict[str, Dict[int, object]] = {}
+_registry_lock = threading.Lock()
+
+
+def register_game_agents(game_id: str, agents_map: Dict[int, object]):
+    """登记（或替换）一局游戏的 Agent 实例 {player_id: PlayerAgent}"""
+    with _registry_lock:
+        _game_agents[game_id] = agents_map
+
+
+def get_game_agents(game_id: str) -> Dict[int, object]:
+    """获取一局游戏的 Agent 实例；未登记（或已释放）时返回空字典"""
+    with _registry_lock:
+        return _game_agents.get(game_id, {})
+
+
+def release_game(game_id: str) -> Dict[int, object]:
+    """对局结束后释放其 Agent 实例（重复释放无副作用），返回被释放的 Agent"""
+    with _registry_lock:
+        return _game_agents.pop(game_id, {})
@@ -1,9 +1,11 @@
 # graph/state.py
 from typing import TypedDict, List, Literal, Annotated, Dict, Any
 from operator import add
+from agents.records import Record, record
 
-class PlayerState(TypedDict):
-    """单个玩家的状态"""
+@record
+class PlayerState(Record):
+    """单个玩家的状态（紧凑的 slots 记录，仍可按 dict 方式读写：player["alive"]、player.get(...)）"""
     player_id: int
     name: str
     role: Literal["civilian", "undercover"]
@@ -13,7 +15,7 @@ class PlayerState(TypedDict):
     votes_received: int  # 本轮收到的票数
 
 class GameState(TypedDict, total=False):
-    """游戏全局状态"""
+    """游戏全局状态（节点只返回自己更新的字段）"""
     # 游戏基本信息
     game_id: str  # 游戏唯一ID
     output_dir: str  # 输出目录
@@ -40,8 +42,7 @@ class GameState(TypedDict, total=False):
     # 对话历史（用于调试和展示）
     conversation_history: Annotated[List[dict], add]  # 累加操作
     
-    # Agent实例映射（持久化保存，让Agent有记忆）
-    agents_map: Dict[int, Any]  # {player_id: PlayerAgent实例}
+    # Agent实例不在状态中：按 game_id 保存在 graph/registry.py 的注册表里，状态只保留可序列化的小字段
     
     # 模型配置
     fixed_model_undercover: bool  # 是否根据身份固定分配模型
@@ -49,5 +50,8 @@ class GameState(TypedDict, total=False):
     civilian_model_config: Dict[str, Any]  # 平民模型配置
     default_model_config: Dict[str, Any]  # 默认模型配置（当 fixed_model_undercover=False 时使用）
     
+    # 描述阶段身份反思节奏："every_speaker"（默认）、"per_round" 或整数 k（每k个发言者反思一次）
+    reflection_schedule: Any
+    
     # 词汇对信息（用于保存游戏结果）
     word_pair: Dict[str, str]  # {"civilian": "...", "undercover": "..."}
\ No newline at end of file
@@ -1,25 +1,42 @@
 # graph/workflow.py
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterable, List
 from langgraph.graph import StateGraph, END
 from .state import GameState
+from .registry import release_game
 from .nodes import (
     initialize_game,
     description_phase,
     voting_phase,
     check_win_condition,
+    description_phase_async,
+    voting_phase_async,
+    check_win_condition_async,
     end_game
 )
 
-def create_undercover_workflow() -> StateGraph:
-    """创建谁是卧底游戏的工作流"""
+def create_undercover_workflow(use_async: bool = False) -> StateGraph:
+    """创建谁是卧底游戏的工作流
+    
+    Args:
+        use_async: 是否使用异步节点（需要通过 ainvoke/astream 运行）
+    """
     
     # 创建状态图
     workflow = StateGraph(GameState)
     
     # 添加节点
     workflow.add_node("initialize", initialize_game)
-    workflow.add_node("description", description_phase)
-    workflow.add_node("voting", voting_phase)
-    workflow.add_node("check", check_win_condition)
+    if use_async:
+        workflow.add_node("description", description_phase_async)
+        workflow.add_node("voting", voting_phase_async)
+        workflow.add_node("check", check_win_condition_async)
+    else:
+        workflow.add_node("description", description_phase)
+        workflow.add_node("voting", voting_phase)
+        workflow.add_node("check", check_win_condition)
     workflow.add_node("end", end_game)
     
     # 设置入口点
@@ -46,27 +63,26 @@ def create_undercover_workflow() -> StateGraph:
     return workflow
 
 
-def run_game(num_players: int = 6, num_undercover: int = 1, game_id: str = None, output_dir: str = "game_results",
-             fixed_model_undercover: bool = False, undercover_model_config: dict = None, 
-             civilian_model_config: dict = None, default_model_config: dict = None):
-    """运行一局游戏
-    
-    Args:
-        num_players: 玩家数量
-        num_undercover: 卧底数量
-        game_id: 游戏ID（如果为None则自动生成UUID）
-        output_dir: 输出目录（默认: game_results）
-        fixed_model_undercover: 是否根据身份固定分配模型（默认: False）
-        undercover_model_config: 卧底使用的模型配置字典（例如: {"model": "Qwen/Qwen2.5-7B-Instruct"}）
-        civilian_model_config: 平民使用的模型配置字典（例如: {"model": "Qwen/Qwen2.5-32B-Instruct"}）
-        default_model_config: 默认模型配置字典（当 fixed_model_undercover=False 时使用）
-    """
+# 编译后的工作流只依赖节点与边，与具体对局无关，按 use_async 各编译一次后复用
+_compiled_apps = {}
+_compiled_apps_lock = threading.Lock()
+
+
+def get_compiled_app(use_async: bool = False):
+    """获取（首次调用时编译）共享的工作流应用，可被多局游戏并发调用"""
+    with _compiled_apps_lock:
+        app = _compiled_apps.get(use_async)
+        if app is None:
+            app = _compiled_apps[use_async] = create_undercover_workflow(use_async=use_async).compile()
+        return app
+
+
+def _build_initial_state(num_players: int, num_undercover: int, game_id: str, output_dir: str,
+                         fixed_model_undercover: bool, undercover_model_config: dict,
+                         civilian_model_config: dict, default_model_config: dict,
+                         reflection_schedule=None) -> dict:
     import uuid
     
-    # 创建工作流
-    workflow = create_undercover_workflow()
-    app = workflow.compile()
-    
     # 生成游戏ID（如果未提供）
     if game_id is None:
         game_id = str(uuid.uuid4())
@@ -90,7 +106,8 @@ def run_game(num_players: int = 6, num_undercover: int = 1, game_id: str = None,
         "fixed_model_undercover": fixed_model_undercover,
         "undercover_model_config": undercover_model_config or {},
         "civilian_model_config": civilian_model_config or {},
-        "default_model_config": default_model_config or {}
+        "default_model_config": default_model_config or {},
+        "reflection_schedule": reflection_schedule
     }
     
     # 调试信息：打印模型配置
@@ -99,18 +116,153 @@ def run_game(num_players: int = 6, num_undercover: int = 1, game_id: str = None,
         print(f"🔍 调试: undercover_model_config = {initial_state['undercover_model_config']}")
         print(f"🔍 调试: civilian_model_config = {initial_state['civilian_model_config']}")
     
+    return initial_state
+
+
+def run_game(num_players: int = 6, num_undercover: int = 1, game_id: str = None, output_dir: str = "game_results",
+             fixed_model_undercover: bool = False, undercover_model_config: dict = None, 
+             civilian_model_config: dict = None, default_model_config: dict = None,
+             reflection_schedule=None):
+    """运行一局游戏
+    
+    Args:
+        num_players: 玩家数量
+        num_undercover: 卧底数量
+        game_id: 游戏ID（如果为None则自动生成UUID）
+        output_dir: 输出目录（默认: game_results）
+        fixed_model_undercover: 是否根据身份固定分配模型（默认: False）
+        undercover_model_config: 卧底使用的模型配置字典（例如: {"model": "Qwen/Qwen2.5-7B-Instruct"}）
+        civilian_model_config: 平民使用的模型配置字典（例如: {"model": "Qwen/Qwen2.5-32B-Instruct"}）
+        default_model_config: 默认模型配置字典（当 fixed_model_undercover=False 时使用）
+        reflection_schedule: 描述阶段的身份反思节奏（默认: 每个发言者之后；"per_round": 每轮所有描述结束后一次；
+            整数k: 每k个发言者一次），见 agents/reflection_schedule.py
+    """
+    # 复用已编译的工作流
+    app = get_compiled_app()
+    
+    initial_state = _build_initial_state(num_players, num_undercover, game_id, output_dir,
+                                         fixed_model_undercover, undercover_model_config,
+                                         civilian_model_config, default_model_config, reflection_schedule)
+    
     # 运行工作流
     print("="*50)
     print("🎮 谁是卧底 - Multi-Agent System")
     print("="*50)
     
     final_state = None
-    for state in app.stream(initial_state):
-        final_state = state
+    try:
+        # 节点只返回增量，按 values 模式取每一步之后的完整状态，最后一个即对局结束时的状态
+        for state in app.stream(initial_state, stream_mode="values"):
+            final_state = state
+    finally:
+        # 正常结束时 end_game 已释放；异常中断时也不要让Agent实例留在注册表中
+        release_game(initial_state["game_id"])
+    
+    return final_state
+
+
+async def run_game_async(num_players: int = 6, num_undercover: int = 1, game_id: str = None, output_dir: str = "game_results",
+                         fixed_model_undercover: bool = False, undercover_model_config: dict = None, 
+                         civilian_model_config: dict = None, default_model_config: dict = None,
+                         reflection_schedule=None):
+    """运行一局游戏（异步版本，参数同 run_game）
+    
+    所有 LLM 调用都在当前事件循环上并发执行，可以用 asyncio.gather 同时运行多局游戏。
+    """
+    app = get_compiled_app(use_async=True)
+    
+    initial_state = _build_initial_state(num_players, num_undercover, game_id, output_dir,
+                                         fixed_model_undercover, undercover_model_config,
+                                         civilian_model_config, default_model_config, reflection_schedule)
+    
+    print("="*50)
+    print("🎮 谁是卧底 - Multi-Agent System")
+    print("="*50)
+    
+    final_state = None
+    try:
+        async for state in app.astream(initial_state, stream_mode="values"):
+            final_state = state
+    finally:
+        release_game(initial_state["game_id"])
     
     return final_state
 
 
+def _failed_game_result(state: dict, error: Exception) -> dict:
+    """对局出错时代替最终状态返回的结果（与单局运行器一样只记录错误，不中断整批）"""
+    print(f"[ERROR] 游戏 {state['game_id']} 运行失败: {error!r}，继续运行其他对局...")
+    return {"game_id": state["game_id"], "game_over": False, "winner": None, "error": repr(error)}
+
+
+def _build_batch_states(batch: List[Dict]) -> List[dict]:
+    states = []
+    for game in batch:
+        states.append(_build_initial_state(
+            game.get("num_players", 6), game.get("num_undercover", 1), game.get("game_id"),
+            game.get("output_dir", "game_results"), game.get("fixed_model_undercover", False),
+            game.get("undercover_model_config"), game.get("civilian_model_config"),
+            game.get("default_model_config"), game.get("reflection_schedule")
+        ))
+    return states
+
+
+def run_games(batch: List[Dict], concurrency: int = 1) -> Iterable[dict]:
+    """批量运行多局游戏，所有对局共用同一个已编译的工作流
+    
+    Args:
+        batch: 每局游戏的参数字典列表，键同 run_game 的参数（例如 {"num_players": 5, "game_id": "g1"}）
+        concurrency: 同时进行的对局数
+    
+    Yields:
+        每局结束时的最终状态（按完成顺序，可通过 state["game_id"] 区分）；
+        出错的对局不会中断整批，而是产出 {"game_id", "game_over": False, "winner": None, "error"}
+    """
+    app = get_compiled_app()
+    initial_states = _build_batch_states(batch)
+    
+    def play(state):
+        try:
+            return app.invoke(state)
+        except Exception as e:
+            return _failed_game_result(state, e)
+        finally:
+            release_game(state["game_id"])
+    
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        futures = [executor.submit(play, state) for state in initial_states]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+async def run_games_async(batch: List[Dict], concurrency: int = 1):
+    """批量运行多局游戏（异步版本，参数同 run_games），最多 concurrency 局同时在事件循环上进行
+    
+    Yields:
+        每局结束时的最终状态（按完成顺序）；出错的对局产出错误结果，同 run_games
+    """
+    app = get_compiled_app(use_async=True)
+    initial_states = _build_batch_states(batch)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    
+    async def play(state):
+        async with semaphore:
+            try:
+                return await app.ainvoke(state)
+            except Exception as e:
+                return _failed_game_result(state, e)
+            finally:
+                release_game(state["game_id"])
+    
+    tasks = [asyncio.ensure_future(play(state)) for state in initial_states]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
 if __name__ == "__main__":
     # 运行游戏
     result = run_game(num_players=6, num_undercover=1)
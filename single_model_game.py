@@ -3,38 +3,37 @@ from concurrent.futures import ThreadPoolExecutor
 from agents.game_agent import PlayerAgent
 import random
 from langchain_openai import ChatOpenAI
-from concurrent.futures import ThreadPoolExecutor
 import json
 import os
 import argparse
+import asyncio
 from agents.spy_curator_agent import SpyCuratorAgent
-from agents.spy_cheatsheet_manager import SpyCheatSheetManager
+from agents.spy_cheatsheet_manager import get_shared_manager
 import numpy as np
-from agents.sf_embeddings import SiliconFlowEmbeddings
-
-
-def cosine_sim(a, b):
-    return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
-
-def compute_self_outlier_score(my_word, others_words, embed_model):
-    texts = [my_word] + others_words
-    vecs = embed_model.embed(texts)  
+from agents.embeddings import make_embeddings, set_default_backend
+from agents.concurrency import set_max_inflight_requests, run_games_in_order, run_games_in_order_async
+from agents.reflection_schedule import ReflectionSchedule
+from agents.event_log import PublicEventLog
+from agents.records import PublicMessage, json_default, to_plain
 
-    my_vec = vecs[0]
-    other_vecs = vecs[1:]
-
-    sims = [cosine_sim(my_vec, v) for v in other_vecs]
-    avg_sim = sum(sims) / len(sims)
-
-    outlier_score = 1 - avg_sim
-    return round(float(outlier_score), 3)
 
 def broadcast(msg, target, game_log=None):
+    if game_log is None:
+        for player in target:
+            player.add_memory(msg)
+        return
+
+    # stored once in the game's public log; each listener only extends its view
+    pos = game_log.append(msg)
     for player in target:
-        player.add_memory(msg)
+        player.memory.receive(pos)
 
-    if game_log is not None:
-        game_log.append(msg)
+def new_game_log(all_players):
+    """Public log of one game; every player's memory becomes a view into it."""
+    game_log = PublicEventLog(round_key="round_num")
+    for p in all_players:
+        p.join_game_log(game_log)
+    return game_log
 
 def load_config(path):
     with open(path, "r", encoding="utf-8") as f:
@@ -43,11 +42,9 @@ def load_config(path):
     
 def append_jsonl(path, obj):
     with open(path, "a", encoding="utf-8") as f:
-        f.write(json.dumps(obj, ensure_ascii=False) + "\n")
+        f.write(json.dumps(obj, ensure_ascii=False, default=json_default) + "\n")
 
-def run_one_game(all_players,game_id,save_dir,enable_cheatsheet=False,embed_model=None):
-
-    game_log=[]
+def new_game_info(all_players, game_id):
     game_info = {
         "game_id": game_id,
         "winner": None,
@@ -64,7 +61,145 @@ def run_one_game(all_players,game_id,save_dir,enable_cheatsheet=False,embed_mode
         })
         if p.role == "spy":
             game_info["spy_id"] = p.player_id
+    return game_info
+
+def build_word_similarity(all_players, embed_model):
+    """Embed the game's distinct words once and return ``(word_index, sim_matrix)``.
+
+    The words never change during a game, so every later outlier score can be
+    read from this matrix instead of asking the embedding endpoint again.
+    """
+    if embed_model is None:
+        return None
+    words = list(dict.fromkeys(p.word for p in all_players))
+    unit = embed_model.embed_matrix(words, normalize=True)
+    return {w: i for i, w in enumerate(words)}, unit @ unit.T
+
+def compute_outlier_scores(alive_players, word_sim):
+    if word_sim is None or len(alive_players) < 2:
+        return {p.player_id: None for p in alive_players}
+
+    word_index, sim = word_sim
+    idx = np.array([word_index[p.word] for p in alive_players])
+    sub = sim[np.ix_(idx, idx)]
+    # mean similarity to every *other* alive player's word
+    avg_sim = (sub.sum(axis=1) - np.diag(sub)) / (len(alive_players) - 1)
+    return {
+        p.player_id: round(float(1 - s), 3)
+        for p, s in zip(alive_players, avg_sim)
+    }
+
+def announce_description(round_num, alive_players, game_log):
+    host_msg = f"This is the {round_num} round, please describe your word:"
+    broadcast(
+        msg=PublicMessage(round_num=round_num, role="host", phase="announce_description", content=host_msg),
+        target=alive_players,
+        game_log=game_log,
+    )
+
+def announce_vote(round_num, alive_players, game_log):
+    vote_msg = (
+        f"This is the {round_num} round, now all the alive players have spoken. "
+        "Please vote for the one you think is the spy:"
+    )
+    broadcast(
+        msg=PublicMessage(round_num=round_num, role="host", phase="announce_vote", content=vote_msg),
+        target=alive_players,
+        game_log=game_log,
+    )
+
+def resolve_votes(votes, round_num, all_players, alive_players, game_info, game_log):
+    """Count the votes and announce the result.
+
+    Returns the new list of alive players and whether the spy was caught.
+    """
+    vote_count = {}
+    for src_pid, tgt_pid in votes.items():
+        vote_count[tgt_pid] = vote_count.get(tgt_pid, 0) + 1
+
+    max_votes = max(vote_count.values())
+    candidates = [pid for pid, cnt in vote_count.items() if cnt == max_votes]
+
+    vote_summary = ", ".join([f"Player {src} votes for Player {tgt}" for src, tgt in votes.items()])
+    broadcast(
+        msg=PublicMessage(round_num=round_num, role="host", phase="vote_reveal", content="The vote result is:\n" + vote_summary),
+        target=alive_players,
+        game_log=game_log,
+    )
+
+    if len(candidates) == 1:
+        eliminated = candidates[0]
+        if all_players[eliminated].role == "spy":
+            print(f"Spy {eliminated} eliminated! Civilians win!")
+            game_info["winner"] = "civilians" 
+            return alive_players, True
+
+        alive_players = [p for p in alive_players if p.player_id != eliminated]
+        for p in alive_players:
+            p.identity_info[eliminated] = {"role":"eliminated","reason":"This civilianhas been eliminated. I don't need to consider this player's identity anymore."}
+
+        broadcast(
+            msg=PublicMessage(
+                round_num=round_num,
+                role="host",
+                phase="vote_result",
+                content=f"Player {eliminated} receives {max_votes} votes and is eliminated. The spy is still alive. Game Continue."
+            ),
+            target=alive_players,
+            game_log=game_log,
+        )
+
+    else:
+        broadcast(
+            msg=PublicMessage(
+                round_num=round_num,
+                role="host",
+                phase="vote_result",
+                content=(
+                    f"No elimination this round because multiple players tied with {max_votes} votes: "
+                    + ", ".join(str(x) for x in candidates)
+                )
+            ),
+            target=alive_players,
+            game_log=game_log,
+        )
+
+    return alive_players, False
+
+def finish_game(all_players, game_id, save_dir, game_info, game_log, enable_cheatsheet=False, save_player_logs=True):
+    print("\n===== GAME OVER =====")
+    if game_info["winner"] is None:
+        game_info["winner"] = "spy"  
+    # === Dynamic Cheatsheet Update ===
+    UPDATE_FREQUENCY = 5 
+    if enable_cheatsheet and (game_id % UPDATE_FREQUENCY == 0):
+        reference_player = all_players[0]
+        api_key = reference_player.model_api_key
+        base_url = reference_player.model_base_url
+
+        manager = get_shared_manager(api_key=api_key, base_url=base_url,prefix=reference_player.cheatsheet_prefix,path=f"{reference_player.cheatsheet_prefix}_cheatsheet_memory.json")
+        curator = SpyCuratorAgent(reference_player.model)
 
+        retrieved = manager.retrieve(query="SpyGame general", top_k=8)
+        new_items = curator.summarize(retrieved_items=retrieved, game_log=to_plain(game_log))
+
+        manager.add_items(new_items)
+
+        print("[Cheatsheet Updated: Retrieval + Synthesis Mode]")
+    
+    with open(f"{save_dir}/game_log_{game_id}.json", "w", encoding="utf-8") as f:
+        json.dump({"metadata": game_info, "public_log": list(game_log)}, f, ensure_ascii=False, indent=2, default=json_default)
+
+    if save_player_logs:
+        write_player_logs(all_players, game_id, save_dir)
+
+def run_one_game(all_players,game_id,save_dir,enable_cheatsheet=False,embed_model=None,save_player_logs=True,reflection_schedule=None):
+
+    game_log=new_game_log(all_players)
+    game_info = new_game_info(all_players, game_id)
+    word_sim = build_word_similarity(all_players, embed_model)
+
+    reflection_schedule = ReflectionSchedule.parse(reflection_schedule)
     alive_players = all_players.copy()
     round_num = 1
     max_round = 6
@@ -72,12 +207,9 @@ def run_one_game(all_players,game_id,save_dir,enable_cheatsheet=False,embed_mode
 
         print(f"\n===== Round {round_num} =====")
 
-        host_msg = f"This is the {round_num} round, please describe your word:"
-        broadcast(
-            msg={"round_num": round_num, "role": "host", "phase": "announce_description", "content": host_msg},
-            target=alive_players,
-            game_log=game_log,
-        )
+        announce_description(round_num, alive_players, game_log)
+        outlier_scores = compute_outlier_scores(alive_players, word_sim)
+        round_reflections = reflection_schedule.start_round([p.player_id for p in alive_players])
 
         for now_player in alive_players:
 
@@ -87,26 +219,16 @@ def run_one_game(all_players,game_id,save_dir,enable_cheatsheet=False,embed_mode
                 print(f"[ERROR] Player {now_player.player_id} description failed: {e}")
                 description = "I cannot answer." 
 
-            others = [p for p in alive_players if p.player_id != now_player.player_id]
+            due = round_reflections.record(now_player.player_id)
+            reflectors = [p for p in alive_players if p.player_id in due]
 
             broadcast(
-                msg={"round_num": round_num, "role": now_player.player_id, "phase": "description", "content": description},
+                msg=PublicMessage(round_num=round_num, role=now_player.player_id, phase="description", content=description),
                 target=alive_players,
                 game_log=game_log,
             )
 
             alive_pid=[tmp.player_id for tmp in alive_players]
-            
-            outlier_scores = {}
-            if embed_model is not None:
-                for p in alive_players:
-                    my_word = p.word
-                    others_words = [q.word for q in alive_players if q.player_id != p.player_id]
-                    outlier_scores[p.player_id] = compute_self_outlier_score(
-                        my_word, others_words, embed_model
-                    )
-            else:
-                outlier_scores = {p.player_id: None for p in alive_players}
 
             def safe_reflection(o, round_num, alive_pid):
                 try:
@@ -118,20 +240,12 @@ def run_one_game(all_players,game_id,save_dir,enable_cheatsheet=False,embed_mode
             with ThreadPoolExecutor(max_workers=2) as executor:
                 futures = [
                     executor.submit(safe_reflection, o, round_num, alive_pid)
-                    for o in others
+                    for o in reflectors
                 ]
                 for f in futures:
                     f.result()
 
-        vote_msg = (
-            f"This is the {round_num} round, now all the alive players have spoken. "
-            "Please vote for the one you think is the spy:"
-        )
-        broadcast(
-            msg={"round_num": round_num, "role": "host", "phase": "announce_vote", "content": vote_msg},
-            target=alive_players,
-            game_log=game_log,
-        )
+        announce_vote(round_num, alive_players, game_log)
 
         votes = {}
         alive_pid=[tmp.player_id for tmp in alive_players]
@@ -153,84 +267,88 @@ def run_one_game(all_players,game_id,save_dir,enable_cheatsheet=False,embed_mode
                 vote_target = future.result()
                 votes[player.player_id] = vote_target
 
-        vote_count = {}
-        for src_pid, tgt_pid in votes.items():
-            vote_count[tgt_pid] = vote_count.get(tgt_pid, 0) + 1
+        alive_players, spy_caught = resolve_votes(votes, round_num, all_players, alive_players, game_info, game_log)
+        if spy_caught:
+            break
 
-        max_votes = max(vote_count.values())
-        candidates = [pid for pid, cnt in vote_count.items() if cnt == max_votes]
+        round_num += 1
 
-        vote_summary = ", ".join([f"Player {src} votes for Player {tgt}" for src, tgt in votes.items()])
-        broadcast(
-            msg={"round_num": round_num, "role": "host", "phase": "vote_reveal", "content": "The vote result is:\n" + vote_summary},
-            target=alive_players,
-            game_log=game_log,
-        )
+    finish_game(all_players, game_id, save_dir, game_info, game_log,
+                enable_cheatsheet=enable_cheatsheet, save_player_logs=save_player_logs)
 
+async def run_one_game_async(all_players,game_id,save_dir,enable_cheatsheet=False,embed_model=None,save_player_logs=True,reflection_schedule=None):
+    """Same game as ``run_one_game``, but every LLM call goes through ``ask_async``
+    so many games can share one event loop."""
 
-        if len(candidates) == 1:
-            eliminated = candidates[0]
-            if all_players[eliminated].role == "spy":
-                print(f"Spy {eliminated} eliminated! Civilians win!")
-                game_info["winner"] = "civilians" 
-                break
-    
-            alive_players = [p for p in alive_players if p.player_id != eliminated]
-            for p in alive_players:
-                p.identity_info[eliminated] = {"role":"eliminated","reason":"This civilianhas been eliminated. I don't need to consider this player's identity anymore."}
+    game_log=new_game_log(all_players)
+    game_info = new_game_info(all_players, game_id)
+    word_sim = await asyncio.to_thread(build_word_similarity, all_players, embed_model)
 
-            broadcast(
-                msg={
-                    "round_num": round_num,
-                    "role": "host",
-                    "phase": "vote_result",
-                    "content": f"Player {eliminated} receives {max_votes} votes and is eliminated. The spy is still alive. Game Continue."
-                },
-                target=alive_players,
-                game_log=game_log,
-            )
+    reflection_schedule = ReflectionSchedule.parse(reflection_schedule)
+    alive_players = all_players.copy()
+    round_num = 1
+    max_round = 6
+    while round_num <= max_round and len(alive_players) > 2:
+
+        print(f"\n===== Round {round_num} =====")
+
+        announce_description(round_num, alive_players, game_log)
+        outlier_scores = compute_outlier_scores(alive_players, word_sim)
+        round_reflections = reflection_schedule.start_round([p.player_id for p in alive_players])
+
+        for now_player in alive_players:
+
+            try:
+                description = await now_player.ask_async(phase="description", round_num=round_num)
+            except Exception as e:
+                print(f"[ERROR] Player {now_player.player_id} description failed: {e}")
+                description = "I cannot answer." 
+
+            due = round_reflections.record(now_player.player_id)
+            reflectors = [p for p in alive_players if p.player_id in due]
 
-        else:
             broadcast(
-                msg={
-                    "round_num": round_num,
-                    "role": "host",
-                    "phase": "vote_result",
-                    "content": (
-                        f"No elimination this round because multiple players tied with {max_votes} votes: "
-                        + ", ".join(str(x) for x in candidates)
-                    ),
-                },
+                msg=PublicMessage(round_num=round_num, role=now_player.player_id, phase="description", content=description),
                 target=alive_players,
                 game_log=game_log,
             )
 
-        round_num += 1
+            alive_pid=[tmp.player_id for tmp in alive_players]
 
-    print("\n===== GAME OVER =====")
-    if game_info["winner"] is None:
-        game_info["winner"] = "spy"  
-    # === Dynamic Cheatsheet Update ===
-    UPDATE_FREQUENCY = 5 
-    if enable_cheatsheet and (game_id % UPDATE_FREQUENCY == 0):
-        reference_player = all_players[0]
-        api_key = reference_player.model_api_key
-        base_url = reference_player.model_base_url
+            async def safe_reflection(o):
+                try:
+                    return await o.ask_async(phase="reflection", round_num=round_num, alive_players_id=alive_pid,outlier_score=outlier_scores.get(o.player_id))
+                except Exception as e:
+                    print(f"[ERROR] Reflection failed for Player {o.player_id}: {e}")
+                    return None
 
-        manager = SpyCheatSheetManager(api_key=api_key, base_url=base_url,prefix=reference_player.cheatsheet_prefix,path=f"{reference_player.cheatsheet_prefix}_cheatsheet_memory.json")
-        curator = SpyCuratorAgent(reference_player.model)
+            await asyncio.gather(*(safe_reflection(o) for o in reflectors))
 
-        retrieved = manager.retrieve(query="SpyGame general", top_k=8)
-        new_items = curator.summarize(retrieved_items=retrieved, game_log=game_log)
+        announce_vote(round_num, alive_players, game_log)
+
+        alive_pid=[tmp.player_id for tmp in alive_players]
+
+        async def safe_vote(p):
+            try:
+                return await p.ask_async(phase="vote", round_num=round_num, alive_players_id=alive_pid)
+            except Exception as e:
+                print(f"[ERROR] Vote failed for Player {p.player_id}: {e}")
+                return -1
 
-        for it in new_items:
-            manager.add_item(it)
+        vote_targets = await asyncio.gather(*(safe_vote(p) for p in alive_players))
+        votes = {p.player_id: tgt for p, tgt in zip(alive_players, vote_targets)}
 
-        print("[Cheatsheet Updated: Retrieval + Synthesis Mode]")
-    
-    with open(f"{save_dir}/game_log_{game_id}.json", "w", encoding="utf-8") as f:
-        json.dump({"metadata": game_info, "public_log": game_log}, f, ensure_ascii=False, indent=2)
+        alive_players, spy_caught = resolve_votes(votes, round_num, all_players, alive_players, game_info, game_log)
+        if spy_caught:
+            break
 
+        round_num += 1
+
+    # the cheatsheet curator and the log writes are blocking
+    await asyncio.to_thread(finish_game, all_players, game_id, save_dir, game_info, game_log,
+                            enable_cheatsheet, save_player_logs)
+
+def write_player_logs(all_players, game_id, save_dir):
     for p in all_players:
         append_jsonl(
             f"{save_dir}/player_log_{p.player_id}.jsonl",
@@ -271,14 +389,27 @@ def main(cfg_path=None):
     N_PLAYERS = cfg["n_players"]
     SEED = cfg.get("seed", 42)
     DATA_PATH = cfg.get("data_path", "test_data.json")
+    N_WORKERS = cfg.get("n_workers", 1)
+    MAX_INFLIGHT_REQUESTS = cfg.get("max_inflight_requests", None)
+    ASYNC_MODE = cfg.get("async_mode", False)
+    EMBEDDING_BACKEND = cfg.get("embedding_backend", None)
+    REFLECTION_SCHEDULE = ReflectionSchedule.parse(cfg.get("reflection_schedule", None))
     print(f"EXP_NAME: {EXP_NAME}")
     print(f"SAVE_DIR: {SAVE_DIR}")
     print(f"N_GAMES: {N_GAMES}")
     print(f"N_PLAYERS: {N_PLAYERS}")
     print(f"SEED: {SEED}")
     print(f"DATA_PATH: {DATA_PATH}")
+    print(f"N_WORKERS: {N_WORKERS}")
+    print(f"MAX_INFLIGHT_REQUESTS: {MAX_INFLIGHT_REQUESTS}")
+    print(f"ASYNC_MODE: {ASYNC_MODE}")
+    print(f"EMBEDDING_BACKEND: {EMBEDDING_BACKEND}")
+    print(f"REFLECTION_SCHEDULE: {REFLECTION_SCHEDULE}")
 
     random.seed(SEED)
+    set_max_inflight_requests(MAX_INFLIGHT_REQUESTS)
+    # also picked up by the cheatsheet retrieval of every agent
+    set_default_backend(EMBEDDING_BACKEND)
     if not os.path.exists(SAVE_DIR):
             os.makedirs(SAVE_DIR)
 
@@ -289,7 +420,7 @@ def main(cfg_path=None):
         temperature=cfg.get("temperature", 0.7),
     )
     
-    embed_model = SiliconFlowEmbeddings(
+    embed_model = make_embeddings(
     api_key=cfg["api_key"],       
     base_url=cfg["base_url"],
     model="BAAI/bge-m3"
@@ -307,7 +438,7 @@ def main(cfg_path=None):
 
     test_data = load_test_data(DATA_PATH)
 
-    for game_id in range(N_GAMES):
+    def build_players(game_id):
         spy_id = spy_list[game_id]
 
         civilian_word, spy_word = test_data[game_id]
@@ -317,10 +448,42 @@ def main(cfg_path=None):
             role = "spy" if pid == spy_id else "civilian"
             word = spy_word if pid == spy_id else civilian_word
             all_players.append(PlayerAgent(model=llm, pid=pid, role=role, word=word,enable_cheatsheet=False,cheatsheet_prefix="single"))
+        return all_players
+
+    if ASYNC_MODE:
+        async def play_game_async(game_id):
+            all_players = build_players(game_id)
+            print(f"\n===== Running Game {game_id} =====")
+            await run_one_game_async(all_players, game_id, save_dir=SAVE_DIR,embed_model=embed_model,save_player_logs=False,reflection_schedule=REFLECTION_SCHEDULE)
+            return all_players
+
+        # n_workers is the number of games sharing the event loop
+        asyncio.run(run_games_in_order_async(
+            play_game_async, range(N_GAMES), N_WORKERS,
+            on_finished=lambda game_id, all_players: write_player_logs(all_players, game_id, SAVE_DIR),
+        ))
+        return
+
+    if N_WORKERS > 1:
+        def play_game(game_id):
+            all_players = build_players(game_id)
+            print(f"\n===== Running Game {game_id} =====")
+            run_one_game(all_players, game_id, save_dir=SAVE_DIR,embed_model=embed_model,save_player_logs=False,reflection_schedule=REFLECTION_SCHEDULE)
+            return all_players
+
+        # player_log_*.jsonl are shared across games, so they are appended in game order
+        run_games_in_order(
+            play_game, range(N_GAMES), N_WORKERS,
+            on_finished=lambda game_id, all_players: write_player_logs(all_players, game_id, SAVE_DIR),
+        )
+        return
+
+    for game_id in range(N_GAMES):
+        all_players = build_players(game_id)
 
         print(f"\n===== Running Game {game_id} =====")
         try:
-            run_one_game(all_players, game_id, save_dir=SAVE_DIR,embed_model=embed_model) 
+            run_one_game(all_players, game_id, save_dir=SAVE_DIR,embed_model=embed_model,reflection_schedule=REFLECTION_SCHEDULE) 
             print(f"Game {game_id} finished")
 
         except Exception as e:
@@ -0,0 +1,9 @@
+# tests/conftest.py
+import os
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+for path in (REPO_ROOT, TESTS_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,80 @@
+# tests/fake_models.py
+"""Deterministic stand-ins for the chat model and the embedding client.
+
+Replies are a pure function of the prompt (md5 of its text), so a run is
+reproducible and any change to a prompt shows up as a change in the output.
+"""
+import asyncio
+import hashlib
+import json
+import re
+import threading
+import time
+
+import numpy as np
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+
+class FakeChatModel(BaseChatModel):
+    delay: float = 0.0
+
+    @property
+    def _llm_type(self):
+        return "fake"
+
+    @staticmethod
+    def _text(messages):
+        if isinstance(messages, str):
+            return messages
+        return "\n".join(str(m.content) for m in messages)
+
+    def reply(self, prompt):
+        h = int(hashlib.md5(prompt.encode()).hexdigest(), 16)
+        ids = sorted(set(int(x) for x in re.findall(r"Player (\d+)", prompt)))
+        target = ids[h % len(ids)] if ids else 1
+        return json.dumps({
+            "thinking": f"t{h % 97}", "content": f"desc{h % 1000}", "word_description": f"wd{h % 1000}",
+            "self_analysis": {"role_guess": ["spy", "civilian"][h % 2], "role_reason": "r", "confidence": "high"},
+            "player_analyses": {},
+            "vote_target": target, "vote_reason": "because",
+        })
+
+    def _result(self, messages):
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.reply(self._text(messages))))])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.delay:
+            time.sleep(self.delay)
+        return self._result(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return self._result(messages)
+
+
+class FakeEmbeddings:
+    model = "fake"
+
+    def __init__(self):
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def embed(self, texts):
+        if isinstance(texts, str):
+            texts = [texts]
+        with self._lock:
+            self.calls += 1
+        vectors = []
+        for text in texts:
+            rng = np.random.default_rng(int(hashlib.md5(text.encode()).hexdigest()[:8], 16))
+            vectors.append(rng.standard_normal(64))
+        return vectors
+
+    def embed_matrix(self, texts, normalize=False):
+        matrix = np.asarray(self.embed(texts), dtype=np.float32)
+        if normalize:
+            matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix
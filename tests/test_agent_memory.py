@@ -0,0 +1,109 @@
+# tests/test_agent_memory.py
+"""The AgentMemory indexes answer the same as a linear scan of the plain
+per-agent dict the player agent used to keep."""
+import random
+
+import pytest
+
+from agents.agent_memory import AgentMemory, normalize_player_id
+
+
+def _baseline_descriptions_before(memory, round_num):
+    return [h for h in memory["all_descriptions"] if h["round"] < round_num]
+
+
+def _baseline_round_votes(memory, round_num):
+    return next((e for e in memory["all_votes_history"] if e.get("round", 0) == round_num), None)
+
+
+def _baseline_eliminated_before(memory, current_round):
+    eliminated = []
+    for vote_entry in memory["all_votes_history"]:
+        if vote_entry.get("round", 0) >= current_round:
+            continue
+        vote_counts = {}
+        for vote in vote_entry.get("votes", []):
+            if vote.get("target_id"):
+                vote_counts[vote["target_id"]] = vote_counts.get(vote["target_id"], 0) + 1
+        if vote_counts:
+            max_votes = max(vote_counts.values())
+            candidates = [pid for pid, count in vote_counts.items() if count == max_votes]
+            if len(candidates) == 1:
+                eliminated.append(candidates[0])
+    return sorted(set(eliminated))
+
+
+def _baseline_known_players(memory):
+    ids = {d["player_id"] for d in memory["all_descriptions"] if d.get("player_id")}
+    for entry in memory["all_votes_history"]:
+        for vote in entry.get("votes", []):
+            ids.update(pid for pid in (vote.get("voter_id"), vote.get("target_id")) if pid)
+    for entry in memory["player_analyses"]:
+        ids.update(normalize_player_id(k) for k in entry.get("analyses", {}))
+    return ids
+
+
+def _play(seed, n_players=6, n_rounds=5):
+    """Fill an AgentMemory and the baseline dict with the same random game."""
+    rng = random.Random(seed)
+    memory = AgentMemory()
+    baseline = {"all_descriptions": [], "all_votes_history": [], "player_analyses": []}
+    players = list(range(1, n_players + 1))
+    for round_num in range(1, n_rounds + 1):
+        for pid in rng.sample(players, len(players)):
+            memory.add_description(round_num, pid, f"d{round_num}-{pid}", f"Player {pid}")
+            baseline["all_descriptions"].append(
+                {"round": round_num, "player_id": pid, "description": f"d{round_num}-{pid}", "name": f"Player {pid}"})
+        # tie-break rounds have a second vote entry for the same round
+        for _ in range(rng.choice([1, 1, 2])):
+            votes = [{"voter_id": v, "target_id": rng.choice(players)} for v in players]
+            memory.add_round_votes(round_num, votes)
+            baseline["all_votes_history"].append({"round": round_num, "votes": votes})
+        analyses = {f"player_{pid}": {"suspicion": rng.random()} for pid in rng.sample(players, 3)}
+        memory.set_player_analyses(round_num, "description", analyses)
+        baseline["player_analyses"].append({"round": round_num, "phase": "description", "analyses": analyses})
+    return memory, baseline
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_indexed_queries_match_linear_scan(seed):
+    memory, baseline = _play(seed)
+    for round_num in range(0, 8):
+        assert memory.descriptions_before(round_num) == _baseline_descriptions_before(baseline, round_num)
+        assert memory.round_votes(round_num) == _baseline_round_votes(baseline, round_num)
+        assert memory.eliminated_before(round_num) == _baseline_eliminated_before(baseline, round_num)
+    assert memory.known_players() == _baseline_known_players(baseline)
+    # serialised lists are unchanged
+    assert list(memory["all_descriptions"]) == baseline["all_descriptions"]
+    assert list(memory["all_votes_history"]) == baseline["all_votes_history"]
+
+
+def test_replacing_analyses_rebuilds_player_indexes():
+    memory = AgentMemory()
+    memory.set_player_analyses(1, "description", {"player_2": {"s": 1}, "player_5": {"s": 2}})
+    memory.set_player_analyses(1, "description", {"player_2": {"s": 3}})
+
+    assert memory.known_players() == {2}
+    assert memory.latest_player_analysis("player_2") == {"s": 3}
+    assert memory.latest_player_analysis("player_5") is None
+
+
+@pytest.mark.parametrize("key", ["all_descriptions", "all_votes_history", "voting_history", "player_analyses"])
+def test_indexed_keys_cannot_be_written_directly(key):
+    memory = AgentMemory()
+    with pytest.raises(TypeError):
+        memory[key] = []
+    with pytest.raises(TypeError):
+        memory.update({key: []})
+    with pytest.raises(TypeError):
+        del memory[key]
+    with pytest.raises(TypeError):
+        memory.pop(key)
+
+
+def test_public_records_cannot_be_replaced_by_round():
+    memory = AgentMemory()
+    memory.add_description(1, 2, "d", "Player 2")
+    with pytest.raises(ValueError):
+        memory.replace_round_entry("all_descriptions", {"round": 1, "player_id": 3})
+    assert memory.descriptions_in(1) == [{"round": 1, "player_id": 2, "description": "d", "name": "Player 2"}]
@@ -0,0 +1,190 @@
+# tests/test_description_phase.py
+"""A hanging identity reflection must not hide earlier descriptions from the
+next speaker, and must not hold the description phase past its deadline."""
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import agents.model as model
+import agents.player_agent as player_agent
+import graph.nodes as nodes
+from graph.registry import get_game_agents, release_game
+from fake_models import FakeChatModel
+
+REFLECTION_MARKER = "[identity reflection]\n"
+
+
+class HangingReflectionModel(FakeChatModel):
+    """Answers descriptions at once; identity reflections hang until ``release`` is set."""
+
+    release: threading.Event
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self._text(messages).startswith(REFLECTION_MARKER):
+            self.release.wait(30)
+        return self._result(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self._text(messages).startswith(REFLECTION_MARKER):
+            while not self.release.is_set():
+                await asyncio.sleep(0.01)
+        return self._result(messages)
+
+
+@pytest.fixture
+def hanging_reflections(monkeypatch):
+    release = threading.Event()
+    seen = {}  # speaker id -> current-round descriptions in its description prompt
+
+    reflection_prompt = player_agent.get_identity_reflection_prompt
+    description_prompt = player_agent.get_description_user_prompt
+
+    def marked_reflection_prompt(*args, **kwargs):
+        return REFLECTION_MARKER + reflection_prompt(*args, **kwargs)
+
+    def recording_description_prompt(word, history_text, current_round_descriptions="", player_id=0, *args, **kwargs):
+        seen[player_id] = current_round_descriptions
+        return description_prompt(word, history_text, current_round_descriptions, player_id, *args, **kwargs)
+
+    monkeypatch.setattr(player_agent, "get_identity_reflection_prompt", marked_reflection_prompt)
+    monkeypatch.setattr(player_agent, "get_description_user_prompt", recording_description_prompt)
+    monkeypatch.setattr(model, "ChatOpenAI", lambda **kwargs: HangingReflectionModel(release=release))
+    monkeypatch.setattr(model, "_llm_pool", {})
+    monkeypatch.setattr(nodes, "DESCRIPTION_REFLECTION_DEADLINE", 0.5)
+    yield SimpleNamespace(seen=seen, release=release)
+    release.set()
+
+
+@pytest.fixture
+def reflection_calls(monkeypatch):
+    """Counts reflections that started and that returned (after any memory write)."""
+    calls = {"started": 0, "finished": 0}
+    lock = threading.Lock()
+    reflect = player_agent.PlayerAgent.reflect_on_identity
+    reflect_async = player_agent.PlayerAgent.reflect_on_identity_async
+
+    def bump(key):
+        with lock:
+            calls[key] += 1
+
+    def counting_reflect(self, *args, **kwargs):
+        bump("started")
+        try:
+            return reflect(self, *args, **kwargs)
+        finally:
+            bump("finished")
+
+    async def counting_reflect_async(self, *args, **kwargs):
+        bump("started")
+        try:
+            return await reflect_async(self, *args, **kwargs)
+        finally:
+            bump("finished")
+
+    monkeypatch.setattr(player_agent.PlayerAgent, "reflect_on_identity", counting_reflect)
+    monkeypatch.setattr(player_agent.PlayerAgent, "reflect_on_identity_async", counting_reflect_async)
+    return calls
+
+
+def _initial_state(game_id, tmp_path):
+    state = {"game_id": game_id, "num_players": 5, "num_undercover": 1, "output_dir": str(tmp_path)}
+    return {**state, **nodes.initialize_game(state)}
+
+
+def _check_prompts(delta, seen):
+    spoken = delta["current_descriptions"]
+    assert len(spoken) == 5
+    for i, entry in enumerate(spoken):
+        prompt_text = seen[entry["player_id"]]
+        for earlier in spoken[:i]:
+            assert f"{earlier['name']}: {earlier['description']}" in prompt_text
+
+
+def test_description_prompt_sees_every_earlier_description_when_reflections_hang(tmp_path, hanging_reflections):
+    state = _initial_state("hang-sync", tmp_path)
+    start = time.monotonic()
+    try:
+        delta = nodes.description_phase(state)
+    finally:
+        release_game("hang-sync")
+    # one shared deadline for the phase, not one per speaker or per batch
+    assert time.monotonic() - start < 5
+    _check_prompts(delta, hanging_reflections.seen)
+
+
+def test_async_description_prompt_sees_every_earlier_description_when_reflections_hang(tmp_path, hanging_reflections):
+    state = _initial_state("hang-async", tmp_path)
+    start = time.monotonic()
+    try:
+        delta = asyncio.run(nodes.description_phase_async(state))
+    finally:
+        release_game("hang-async")
+    assert time.monotonic() - start < 5
+    _check_prompts(delta, hanging_reflections.seen)
+
+
+def _wait_for_stragglers(calls):
+    deadline = time.monotonic() + 10
+    while calls["finished"] < calls["started"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert calls["started"] and calls["finished"] == calls["started"]
+
+
+def _check_no_late_writes(agents_map, round_num):
+    for agent in agents_map.values():
+        assert agent.memory.self_analyses_in(round_num) == []
+        assert agent.memory.phase_player_analyses(round_num, "description_reflection") == {}
+
+
+def test_reflections_finishing_after_the_phase_do_not_write_memory(tmp_path, hanging_reflections, reflection_calls):
+    state = _initial_state("late-sync", tmp_path)
+    agents_map = get_game_agents("late-sync")
+    try:
+        nodes.description_phase(state)
+        # the hung reflections now finish, after the phase has given up on them
+        hanging_reflections.release.set()
+        _wait_for_stragglers(reflection_calls)
+    finally:
+        release_game("late-sync")
+    _check_no_late_writes(agents_map, state["round"])
+
+
+def test_async_reflections_finishing_after_the_phase_do_not_write_memory(tmp_path, hanging_reflections, reflection_calls):
+    state = _initial_state("late-async", tmp_path)
+    agents_map = get_game_agents("late-async")
+
+    async def run():
+        await nodes.description_phase_async(state)
+        hanging_reflections.release.set()
+        await asyncio.sleep(0.1)
+
+    try:
+        asyncio.run(run())
+        _wait_for_stragglers(reflection_calls)
+    finally:
+        release_game("late-async")
+    _check_no_late_writes(agents_map, state["round"])
+
+
+def test_reflection_history_is_rendered_from_the_callers_descriptions(monkeypatch):
+    monkeypatch.setattr(model, "ChatOpenAI", lambda **kwargs: FakeChatModel())
+    monkeypatch.setattr(model, "_llm_pool", {})
+    agent = player_agent.PlayerAgent(1, "Player 1", "apple")
+    for pid in (1, 2):
+        agent.memory.add_description(1, pid, f"remembered-{pid}", f"Player {pid}")
+    # same number of history entries as the agent's memory, different content
+    passed = [{"round": 1, "player_id": pid, "description": f"passed-{pid}", "name": f"Player {pid}"} for pid in (1, 2)]
+    passed.append({"round": 2, "player_id": 2, "description": "current", "name": "Player 2"})
+
+    def prompt(**kwargs):
+        messages = agent._build_identity_reflection_messages(2, 2, passed, **kwargs)
+        return "".join(m.content for m in messages)
+
+    text = prompt()
+    assert "passed-1" in text and "remembered-1" not in text
+    # callers that pass the public record can reuse the agent's rendered history
+    text = prompt(history_from_memory=True)
+    assert "remembered-1" in text and "passed-1" not in text
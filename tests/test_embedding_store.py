@@ -0,0 +1,104 @@
+# tests/test_embedding_store.py
+import os
+
+import numpy as np
+import pytest
+
+from agents.embedding_store import EmbeddingStore
+
+
+class CountingFetch:
+    def __init__(self, dim=8):
+        self.dim = dim
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        return [np.full(self.dim, len(t), dtype=np.float32) + np.arange(self.dim) for t in texts]
+
+
+def _expected(texts, dim=8):
+    return np.stack([np.full(dim, len(t), dtype=np.float32) + np.arange(dim) for t in texts])
+
+
+def test_round_trip_across_store_instances_makes_no_requests(tmp_path):
+    texts = ["a", "bb", "a", "ccc"]
+    fetch = CountingFetch()
+
+    first = EmbeddingStore(str(tmp_path)).embed_matrix("m", texts, fetch)
+    assert fetch.calls == [["a", "bb", "ccc"]]
+
+    rerun = CountingFetch()
+    second = EmbeddingStore(str(tmp_path)).embed_matrix("m", texts, rerun)
+
+    assert rerun.calls == []
+    np.testing.assert_array_equal(first, _expected(texts))
+    np.testing.assert_array_equal(second, first)
+    assert second.dtype == np.float32 and second.flags["C_CONTIGUOUS"]
+
+
+def test_only_missing_texts_are_fetched(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.embed_matrix("m", ["a", "bb"], CountingFetch())
+
+    fetch = CountingFetch()
+    out = store.embed_matrix("m", ["bb", "dddd", "a"], fetch)
+
+    assert fetch.calls == [["dddd"]]
+    np.testing.assert_array_equal(out, _expected(["bb", "dddd", "a"]))
+
+
+def test_models_are_cached_separately(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.embed_matrix("m1", ["a"], CountingFetch())
+
+    fetch = CountingFetch(dim=4)
+    out = store.embed_matrix("m2", ["a"], fetch)
+
+    assert fetch.calls == [["a"]]
+    assert out.shape == (1, 4)
+
+
+def test_torn_tail_row_is_truncated_before_appending(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.embed_matrix("m", ["a", "bb"], CountingFetch())
+    vec_path = os.path.join(str(tmp_path), "m.f32")
+    # a process died halfway through writing a row
+    with open(vec_path, "ab") as f:
+        f.write(b"\x00" * 5)
+
+    other = EmbeddingStore(str(tmp_path))
+    out = other.embed_matrix("m", ["ccc", "a", "bb"], CountingFetch())
+
+    np.testing.assert_array_equal(out, _expected(["ccc", "a", "bb"]))
+    assert os.path.getsize(vec_path) == 3 * 8 * 4
+    np.testing.assert_array_equal(
+        EmbeddingStore(str(tmp_path)).embed_matrix("m", ["ccc", "a", "bb"], CountingFetch()), out)
+
+
+def test_partial_index_line_is_ignored_until_complete(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.embed_matrix("m", ["a"], CountingFetch())
+    with open(os.path.join(str(tmp_path), "m.idx"), "a", encoding="utf-8") as f:
+        f.write('{"k": "half')
+
+    fetch = CountingFetch()
+    out = EmbeddingStore(str(tmp_path)).embed_matrix("m", ["a"], fetch)
+
+    assert fetch.calls == []
+    np.testing.assert_array_equal(out, _expected(["a"]))
+
+    # the next append cuts the torn line off instead of gluing onto it
+    EmbeddingStore(str(tmp_path)).embed_matrix("m", ["bb"], CountingFetch())
+    fetch = CountingFetch()
+    out = EmbeddingStore(str(tmp_path)).embed_matrix("m", ["a", "bb"], fetch)
+    assert fetch.calls == []
+    np.testing.assert_array_equal(out, _expected(["a", "bb"]))
+
+
+def test_dim_mismatch_raises(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.embed_matrix("m", ["a"], CountingFetch(dim=8))
+
+    with pytest.raises(ValueError, match="dim"):
+        EmbeddingStore(str(tmp_path)).embed_matrix("m", ["bb"], CountingFetch(dim=4))
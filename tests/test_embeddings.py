@@ -0,0 +1,79 @@
+# tests/test_embeddings.py
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+import agents.embeddings as embeddings
+from agents.embeddings import HashingEmbeddings, get_default_backend, make_embeddings, set_default_backend
+from agents.retrieval_engine import RetrievalEngine
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEXTS = ["apple", "Apple pie", "苹果", "", "a"]
+
+
+def test_hashing_is_deterministic_across_instances_and_processes():
+    first = HashingEmbeddings().embed_matrix(TEXTS)
+    np.testing.assert_array_equal(first, HashingEmbeddings().embed_matrix(TEXTS))
+
+    # crc32 buckets do not depend on the per-process string hash seed
+    code = (
+        "import sys, numpy as np; from agents.embeddings import HashingEmbeddings;"
+        f"sys.stdout.buffer.write(HashingEmbeddings().embed_matrix({TEXTS!r}).tobytes())"
+    )
+    out = subprocess.run([sys.executable, "-c", code], cwd=REPO_ROOT, capture_output=True, check=True,
+                         env={**os.environ, "PYTHONHASHSEED": "123"}).stdout
+    np.testing.assert_array_equal(np.frombuffer(out, dtype=np.float32).reshape(first.shape), first)
+
+
+def test_hashing_rows_are_float32_unit_vectors():
+    matrix = HashingEmbeddings(dim=64).embed_matrix(TEXTS, normalize=True)
+
+    assert matrix.dtype == np.float32 and matrix.shape == (len(TEXTS), 64)
+    assert matrix.flags["C_CONTIGUOUS"]
+    np.testing.assert_allclose(np.linalg.norm(matrix, axis=1), 1.0, rtol=1e-6)
+    # similar texts are closer than unrelated ones
+    assert matrix[0] @ matrix[1] > matrix[0] @ matrix[2]
+
+
+def test_hashing_empty_string_and_single_text():
+    embedder = HashingEmbeddings(dim=32)
+    empty = embedder.embed_matrix("")
+
+    assert empty.shape == (1, 32)
+    assert np.isfinite(empty).all()
+    assert np.linalg.norm(empty) == pytest.approx(1.0)
+    assert embedder.embed_matrix([]).shape == (0, 32)
+    assert len(embedder.embed(["x", "y"])) == 2
+
+
+def test_make_embeddings_hashing_reaches_retrieval_engine(tmp_path):
+    engine = RetrievalEngine(api_key=None, base_url=None, prefix=str(tmp_path / "offline"), embedding_backend="hashing")
+
+    assert isinstance(engine.embedder, HashingEmbeddings)
+    engine.add_many(["the spy hides in plain sight", "describe the word vaguely"])
+    assert engine.search("spy hides", top_k=1)
+
+
+def test_default_backend_reaches_retrieval_engine(tmp_path, monkeypatch):
+    monkeypatch.setattr(embeddings, "_default_backend", "siliconflow")
+    set_default_backend("hashing")
+
+    assert get_default_backend() == "hashing"
+    assert isinstance(make_embeddings(dim=16), HashingEmbeddings)
+    engine = RetrievalEngine(api_key=None, base_url=None, prefix=str(tmp_path / "default"))
+    assert isinstance(engine.embedder, HashingEmbeddings)
+
+    set_default_backend(None)  # keeps the current default
+    assert get_default_backend() == "hashing"
+
+
+def test_unknown_backend_is_rejected(monkeypatch):
+    monkeypatch.setattr(embeddings, "_default_backend", "hashing")
+    with pytest.raises(ValueError, match="bogus"):
+        set_default_backend("bogus")
+    assert get_default_backend() == "hashing"
+    with pytest.raises(ValueError):
+        make_embeddings("bogus")
@@ -0,0 +1,94 @@
+# tests/test_event_log.py
+import json
+import random
+import threading
+
+import pytest
+
+from agents.event_log import PublicEventLog
+
+
+def _game(seed, n_players=5, n_events=60):
+    """Append events to one shared log and, as before, to a plain list per listener.
+
+    Players sometimes miss events (stopped listening) and sometimes add
+    private events of their own.
+    """
+    rng = random.Random(seed)
+    log = PublicEventLog()
+    views = {pid: log.view() for pid in range(1, n_players + 1)}
+    baseline = {pid: [] for pid in views}
+    for i in range(n_events):
+        event = {"round": i // 10 + 1, "player_id": rng.randint(1, n_players), "description": f"e{i}"}
+        pos = log.append(event)
+        for pid, view in views.items():
+            if rng.random() < 0.8:
+                view.receive(pos)
+                baseline[pid].append(event)
+            if rng.random() < 0.2:
+                private = {"round": i // 10 + 1, "player_id": pid, "private": i}
+                view.add_private(private)
+                baseline[pid].append(private)
+    return views, baseline
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_view_merges_public_and_private_events_like_a_per_agent_list(seed):
+    views, baseline = _game(seed)
+    for pid, view in views.items():
+        expected = baseline[pid]
+        assert list(view) == expected
+        assert len(view) == len(expected)
+        assert view.public_count() == sum("private" not in e for e in expected)
+        assert [view[i] for i in range(len(view))] == expected
+        assert [view[-i] for i in range(1, len(view) + 1)] == [expected[-i] for i in range(1, len(expected) + 1)]
+        assert view[3:17:2] == expected[3:17:2]
+        # what save_game_results_json writes is unchanged
+        assert json.dumps(list(view), ensure_ascii=False) == json.dumps(expected, ensure_ascii=False)
+
+
+def test_index_out_of_range():
+    log = PublicEventLog()
+    view = log.view()
+    view.receive(log.append({"round": 1}))
+    with pytest.raises(IndexError):
+        view[1]
+    with pytest.raises(IndexError):
+        view[-2]
+
+
+def test_out_of_order_receive_raises():
+    log = PublicEventLog()
+    view = log.view()
+    first, second = log.append({"round": 1}), log.append({"round": 1})
+    view.receive(second)
+    with pytest.raises(ValueError):
+        view.receive(first)
+    with pytest.raises(ValueError):
+        view.receive(second)
+    assert list(view) == [{"round": 1}]
+
+
+def test_derived_is_computed_once_across_threads():
+    log = PublicEventLog()
+    pos = log.append({"round": 1, "votes": []})
+    calls = []
+    barrier = threading.Barrier(8)
+
+    def compute(event):
+        calls.append(event)
+        return len(calls)
+
+    def worker(results):
+        barrier.wait()
+        results.append(log.derived(pos, "n", compute))
+
+    results = []
+    threads = [threading.Thread(target=worker, args=(results,)) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    # every reader gets the same cached value even if two computed it concurrently
+    assert len(set(results)) == 1
+    assert log.derived(pos, "n", compute) == results[0]
@@ -0,0 +1,29 @@
+# tests/test_game_agent.py
+from collections import OrderedDict
+
+import agents.game_agent as game_agent
+
+
+def test_agent_cache_is_shared_and_bounded(monkeypatch):
+    built = []
+
+    def fake_create_agent(model, tools, system_prompt):
+        built.append((model, system_prompt))
+        return object()
+
+    monkeypatch.setattr(game_agent, "create_agent", fake_create_agent)
+    monkeypatch.setattr(game_agent, "_agents", OrderedDict())
+    monkeypatch.setattr(game_agent, "MAX_CACHED_AGENTS", 2)
+
+    first = game_agent.get_agent("provider:a")
+    assert game_agent.get_agent("provider:a") is first
+    assert game_agent.get_agent("provider:a", "other prompt") is not first
+    assert len(built) == 2
+
+    # "provider:a" was used most recently, so the other prompt is evicted
+    game_agent.get_agent("provider:a")
+    game_agent.get_agent("provider:b")
+    assert len(game_agent._agents) == 2
+    assert game_agent.get_agent("provider:a") is first
+    game_agent.get_agent("provider:a", "other prompt")
+    assert len(built) == 4
@@ -0,0 +1,177 @@
+# tests/test_llm_requests.py
+import asyncio
+import threading
+import time
+
+import numpy as np
+import pytest
+from pydantic import PrivateAttr
+
+import agents.llm_requests as llm_requests
+from agents.concurrency import set_max_inflight_requests
+from agents.llm_requests import HedgedRequester, LatencyTracker
+from fake_models import FakeChatModel
+
+
+class ScriptedModel(FakeChatModel):
+    """Call i sleeps ``script[i][0]`` seconds (cut short by a ``timeout`` kwarg,
+    like the HTTP client) and then fails if ``script[i][1]`` is set."""
+
+    script: list
+    _calls: list = PrivateAttr(default_factory=list)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def _next(self):
+        with self._lock:
+            self._calls.append(threading.current_thread())
+            return self.script[min(len(self._calls), len(self.script)) - 1]
+
+    def _generate(self, messages, stop=None, run_manager=None, timeout=None, **kwargs):
+        delay, fail = self._next()
+        if timeout is not None and timeout < delay:
+            time.sleep(timeout)
+            raise RuntimeError("Request timed out.")
+        time.sleep(delay)
+        if fail:
+            raise RuntimeError("upstream error")
+        return self._result(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        delay, fail = self._next()
+        await asyncio.sleep(delay)
+        if fail:
+            raise RuntimeError("upstream error")
+        return self._result(messages)
+
+
+def _warm_tracker(phase="vote", seconds=0.05, n=20):
+    tracker = LatencyTracker()
+    for _ in range(n):
+        tracker.record(phase, seconds)
+    return tracker
+
+
+def test_latency_tracker_percentiles_and_counters():
+    tracker = LatencyTracker(window=50)
+    samples = [i / 100 for i in range(1, 101)]
+    for s in samples:
+        tracker.record("vote", s)
+    tracker.count("vote", "hedged")
+    tracker.count("vote", "timeouts")
+
+    # only the last `window` samples are kept
+    kept = samples[-50:]
+    stats = tracker.summary()["vote"]
+    assert stats["count"] == 50
+    for q in (50, 95, 99):
+        assert stats[f"p{q}"] == pytest.approx(np.percentile(kept, q))
+        assert tracker.percentile("vote", q) == pytest.approx(np.percentile(kept, q))
+    assert (stats["hedged"], stats["hedge_wins"], stats["timeouts"]) == (1, 0, 1)
+    assert tracker.percentile("vote", 95, min_samples=51) is None
+    assert tracker.percentile("description", 50) is None
+
+    tracker.reset()
+    assert tracker.summary() == {}
+
+
+def test_deadline_raises_timeout_error():
+    tracker = LatencyTracker()
+    requester = HedgedRequester(ScriptedModel(script=[(5.0, False)]), deadlines={"vote": 0.2}, tracker=tracker)
+
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        requester.invoke("Player 1", phase="vote")
+    assert time.monotonic() - start < 1.0
+    assert tracker.summary()["vote"]["timeouts"] == 1
+    assert tracker.summary()["vote"]["count"] == 0
+
+
+def test_unhedged_request_runs_on_caller_thread_and_is_not_queued_behind_hedges():
+    set_max_inflight_requests(1)
+    release = threading.Event()
+    try:
+        # the only hedge worker is busy; the primary request must not wait for it
+        llm_requests._get_hedge_pool().submit(release.wait, 10)
+        llm = ScriptedModel(script=[(0.1, False)])
+        requester = HedgedRequester(llm, deadlines={"vote": 0.5}, tracker=LatencyTracker())
+
+        assert requester.invoke("Player 1", phase="vote").content
+        assert llm._calls == [threading.current_thread()]
+    finally:
+        release.set()
+        set_max_inflight_requests(None)
+
+
+def test_hedge_takes_over_when_primary_fails():
+    tracker = _warm_tracker()
+    llm = ScriptedModel(script=[(0.3, True), (0.01, False)])
+    requester = HedgedRequester(llm, hedge_percentile=50, deadlines={"vote": 2.0}, tracker=tracker)
+
+    response = requester.invoke("Player 1", phase="vote")
+
+    assert response.content
+    assert len(llm._calls) == 2
+    stats = tracker.summary()["vote"]
+    assert (stats["hedged"], stats["hedge_wins"], stats["timeouts"]) == (1, 1, 0)
+
+
+def test_fast_hedge_beats_slow_primary():
+    tracker = _warm_tracker()
+    llm = ScriptedModel(script=[(1.5, False), (0.01, False)])
+    requester = HedgedRequester(llm, hedge_percentile=50, deadlines={"vote": 5.0}, tracker=tracker)
+
+    start = time.monotonic()
+    response = requester.invoke("Player 1", phase="vote")
+
+    assert response.content
+    assert time.monotonic() - start < 1.0
+    stats = tracker.summary()["vote"]
+    assert (stats["hedged"], stats["hedge_wins"], stats["timeouts"]) == (1, 1, 0)
+
+
+def test_sync_deadline_with_hedging_raises_timeout_error():
+    tracker = _warm_tracker()
+    llm = ScriptedModel(script=[(5.0, False)])
+    requester = HedgedRequester(llm, hedge_percentile=50, deadlines={"vote": 0.3}, tracker=tracker)
+
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        requester.invoke("Player 1", phase="vote")
+    assert time.monotonic() - start < 1.0
+    stats = tracker.summary()["vote"]
+    assert (stats["hedged"], stats["hedge_wins"], stats["timeouts"]) == (1, 0, 1)
+
+
+def test_no_hedge_when_primary_is_fast():
+    tracker = _warm_tracker(seconds=0.5)
+    llm = ScriptedModel(script=[(0.01, False)])
+    requester = HedgedRequester(llm, hedge_percentile=50, deadlines={"vote": 2.0}, tracker=tracker)
+
+    requester.invoke("Player 1", phase="vote")
+    time.sleep(0.6)
+
+    assert len(llm._calls) == 1
+    assert tracker.summary()["vote"]["hedged"] == 0
+
+
+def test_async_hedge_returns_first_result():
+    tracker = _warm_tracker()
+    llm = ScriptedModel(script=[(5.0, False), (0.01, False)])
+    requester = HedgedRequester(llm, hedge_percentile=50, deadlines={"vote": 2.0}, tracker=tracker)
+
+    start = time.monotonic()
+    response = asyncio.run(requester.ainvoke("Player 1", phase="vote"))
+
+    assert response.content
+    assert time.monotonic() - start < 1.0
+    stats = tracker.summary()["vote"]
+    assert (stats["hedged"], stats["hedge_wins"]) == (1, 1)
+
+
+def test_async_deadline_raises_timeout_error():
+    tracker = LatencyTracker()
+    requester = HedgedRequester(ScriptedModel(script=[(5.0, False)]), deadlines={"vote": 0.2}, tracker=tracker)
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(requester.ainvoke("Player 1", phase="vote"))
+    assert tracker.summary()["vote"]["timeouts"] == 1
@@ -0,0 +1,54 @@
+# tests/test_records.py
+import json
+
+import pytest
+
+import agents.model as model
+import graph.nodes as nodes
+from agents.records import DescriptionRecord, json_default, to_plain
+from graph.registry import release_game
+from graph.state import PlayerState
+from fake_models import FakeChatModel
+
+
+def test_records_are_slotted_and_serialize_like_dicts():
+    entry = DescriptionRecord(round=1, player_id=2, description="d", name="Player 2")
+    plain = {"round": 1, "player_id": 2, "description": "d", "name": "Player 2"}
+
+    assert not hasattr(entry, "__dict__")
+    assert DescriptionRecord.__slots__ == tuple(plain)
+    assert entry == plain and dict(entry) == plain and {**entry} == plain
+    assert json.dumps(entry, default=json_default) == json.dumps(plain)
+    with pytest.raises(KeyError):
+        entry["extra"] = 1
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    monkeypatch.setattr(model, "ChatOpenAI", lambda **kwargs: FakeChatModel())
+    monkeypatch.setattr(model, "_llm_pool", {})
+
+
+def test_nodes_return_new_player_states_instead_of_mutating(tmp_path, fake_llm):
+    state = {"game_id": "immutable", "num_players": 5, "num_undercover": 1, "output_dir": str(tmp_path)}
+    state = {**state, **nodes.initialize_game(state)}
+    try:
+        initial = state["players"]
+        initial_plain = to_plain(initial)
+        state = {**state, **nodes.description_phase(state)}
+        assert to_plain(initial) == initial_plain
+        described = state["players"]
+        described_plain = to_plain(described)
+        assert all(len(p["description_history"]) == 1 for p in described)
+
+        delta = nodes.voting_phase(state)
+    finally:
+        release_game("immutable")
+
+    # the players of the earlier states are untouched
+    assert to_plain(described) == described_plain
+    assert all(p["alive"] and p["votes_received"] == 0 for p in described)
+    players = delta["players"]
+    assert all(isinstance(p, PlayerState) for p in players)
+    assert sum(p["votes_received"] for p in players) == 5
+    assert sum(not p["alive"] for p in players) == (0 if "eliminated_players" not in delta else 1)
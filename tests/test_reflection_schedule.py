@@ -0,0 +1,114 @@
+# tests/test_reflection_schedule.py
+import json
+import re
+from collections import Counter
+
+import pytest
+
+import agents.model as model
+import agents.player_agent as player_agent
+import graph.nodes as nodes
+from agents.reflection_schedule import ReflectionSchedule
+from graph.registry import get_game_agents, release_game
+from fake_models import FakeChatModel
+
+PLAYERS = [1, 2, 3, 4, 5]
+
+
+def _run_round(schedule, player_ids=PLAYERS):
+    """Due sets after each speaker, in speaking order."""
+    reflections = ReflectionSchedule.parse(schedule).start_round(player_ids)
+    return [reflections.record(pid) for pid in player_ids]
+
+
+def test_parse():
+    assert ReflectionSchedule.parse(None).mode == "every_speaker"
+    assert ReflectionSchedule.parse("per_round").mode == "per_round"
+    assert (ReflectionSchedule.parse(3).mode, ReflectionSchedule.parse(3).k) == ("every_k", 3)
+    assert ReflectionSchedule.parse("every_4").k == 4
+    for bad in ("sometimes", "every_x", 0):
+        with pytest.raises(ValueError):
+            ReflectionSchedule.parse(bad)
+
+
+def test_every_speaker_reflects_everyone_but_the_speaker():
+    assert _run_round("every_speaker") == [[p for p in PLAYERS if p != s] for s in PLAYERS]
+
+
+def test_per_round_reflects_once_after_the_last_speaker():
+    assert _run_round("per_round") == [[], [], [], [], PLAYERS]
+
+
+def test_every_k_reflects_at_each_kth_speaker_and_at_the_end():
+    assert _run_round(2) == [[], PLAYERS, [], PLAYERS, [1, 2, 3, 4]]
+    # the last speaker has heard nobody since the previous checkpoint
+    assert _run_round(1) == _run_round("every_speaker")
+
+
+@pytest.mark.parametrize("n", [4, 8, 12])
+def test_reflection_call_counts(n):
+    ids = list(range(1, n + 1))
+    calls = {schedule: sum(len(due) for due in _run_round(schedule, ids)) for schedule in ("every_speaker", "per_round", 3)}
+    assert calls["every_speaker"] == n * (n - 1)
+    assert calls["per_round"] == n
+    # one call per player at each of the ceil(n/k) checkpoints, minus the last speaker when it closes a group alone
+    checkpoints = -(-n // 3)
+    assert calls[3] in (n * checkpoints, n * checkpoints - 1)
+
+
+class AnalysingModel(FakeChatModel):
+    """Fake replies that also analyse every player named in the prompt."""
+
+    def reply(self, prompt):
+        result = json.loads(super().reply(prompt))
+        ids = sorted(set(int(x) for x in re.findall(r"Player (\d+)", prompt)))
+        result["player_analyses"] = {f"Player {pid}": {"role_guess": "civilian", "role_reason": "r"} for pid in ids}
+        return json.dumps(result)
+
+
+@pytest.fixture
+def reflection_counts(monkeypatch):
+    monkeypatch.setattr(model, "ChatOpenAI", lambda **kwargs: AnalysingModel())
+    monkeypatch.setattr(model, "_llm_pool", {})
+    counts = Counter()
+    reflect = player_agent.PlayerAgent.reflect_on_identity
+
+    def counting_reflect(self, *args, **kwargs):
+        counts[self.player_id] += 1
+        return reflect(self, *args, **kwargs)
+
+    monkeypatch.setattr(player_agent.PlayerAgent, "reflect_on_identity", counting_reflect)
+    return counts
+
+
+@pytest.mark.parametrize("schedule", ["every_speaker", "per_round", 2])
+def test_description_phase_memory_in_each_mode(schedule, tmp_path, reflection_counts):
+    game_id = f"schedule-{schedule}"
+    state = {"game_id": game_id, "num_players": 5, "num_undercover": 1, "output_dir": str(tmp_path),
+             "reflection_schedule": schedule}
+    state = {**state, **nodes.initialize_game(state)}
+    agents_map = get_game_agents(game_id)
+    try:
+        delta = nodes.description_phase(state)
+    finally:
+        release_game(game_id)
+
+    round_num = state["round"]
+    order = [d["player_id"] for d in delta["current_descriptions"]]
+    expected = Counter(pid for due in _run_round(schedule, order) for pid in due)
+    assert reflection_counts == expected
+
+    alive = {str(p["player_id"]) for p in state["players"]}
+    for pid, agent in agents_map.items():
+        # one self analysis per round, replaced by each later reflection
+        self_entries = agent.memory.self_analyses_in(round_num)
+        assert len(self_entries) == 1
+        analysis = self_entries[0]["analysis"]
+        assert analysis["phase"] == "description_reflection"
+        assert analysis["speaking_order"] == order.index(pid) + 1
+        # one merged player-analysis entry for the phase, keyed by plain player ids
+        phase_entries = [e for e in agent.memory.player_analyses_in(round_num) if e.get("phase") == "description_reflection"]
+        assert len(phase_entries) == 1
+        assert set(phase_entries[0]["analyses"]) <= alive
+        # the initial analyses are untouched
+        assert agent.memory.phase_player_analyses(0, "initial")
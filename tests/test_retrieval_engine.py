@@ -0,0 +1,41 @@
+# tests/test_retrieval_engine.py
+import json
+import multiprocessing
+import os
+
+import pytest
+
+from agents.retrieval_engine import RetrievalEngine
+
+
+def _engine(prefix):
+    return RetrievalEngine(api_key=None, base_url=None, prefix=prefix, embedding_backend="hashing")
+
+
+def _add_lines(prefix, name, n):
+    engine = _engine(prefix)
+    for i in range(n):
+        engine.add_many([f"{name} line {i}"])
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="needs fork")
+def test_concurrent_saves_from_two_processes_keep_every_update(tmp_path):
+    prefix = str(tmp_path / "shared")
+    ctx = multiprocessing.get_context("fork")
+    workers = [ctx.Process(target=_add_lines, args=(prefix, name, 8)) for name in ("a", "b")]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join(60)
+        assert w.exitcode == 0
+
+    engine = _engine(prefix)
+    expected = {f"{name} line {i}" for name in ("a", "b") for i in range(8)}
+    assert set(engine.pool_text) == expected
+    assert engine.version == 16
+
+    # only the current snapshot (plus manifest and lock file) is left on disk
+    with open(f"{prefix}_cheatsheet_manifest.json", encoding="utf-8") as f:
+        manifest = json.load(f)
+    snapshot = {manifest[k] for k in ("index", "texts", "pca") if manifest.get(k)}
+    assert set(os.listdir(tmp_path)) == snapshot | {"shared_cheatsheet_manifest.json", "shared_cheatsheet.lock"}
@@ -0,0 +1,63 @@
+# tests/test_runners.py
+"""The experiment runners give the same output sequentially, with threaded
+games and on the asyncio engine, and that output matches the baseline
+(digests in data/runner_baseline.json, recorded before the runners were made
+concurrent)."""
+import hashlib
+import importlib
+import json
+import os
+
+import pytest
+
+from agents.concurrency import set_max_inflight_requests
+from agents.embeddings import set_default_backend
+from fake_models import FakeChatModel, FakeEmbeddings
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "runner_baseline.json")
+
+MODES = {
+    "seq": {},
+    "parallel": {"n_workers": 4, "max_inflight_requests": 4},
+    "async": {"n_workers": 6, "async_mode": True},
+}
+
+
+def _digests(directory):
+    return {
+        name: hashlib.sha256(open(os.path.join(directory, name), "rb").read()).hexdigest()
+        for name in sorted(os.listdir(directory))
+    }
+
+
+def _run(mod, tmp_path, name, **extra):
+    cfg = {
+        "exp_name": name, "model": "m", "base_url": "u", "api_key": "k",
+        "n_games": 6, "n_players": 5, "seed": 1,
+        "data_path": os.path.join(REPO_ROOT, "test_data.json"),
+    }
+    cfg.update(extra)
+    cfg_path = tmp_path / f"{name}.json"
+    cfg_path.write_text(json.dumps(cfg))
+    mod.main(str(cfg_path))
+    return _digests(tmp_path / "results" / name)
+
+
+@pytest.mark.parametrize("module", ["single_model_game", "multi_model_game"])
+def test_runner_modes_match_baseline(module, tmp_path, monkeypatch):
+    mod = importlib.import_module(module)
+    with open(BASELINE, encoding="utf-8") as f:
+        baseline = json.load(f)[module]
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(mod, "make_embeddings", lambda *args, **kwargs: FakeEmbeddings())
+    try:
+        for mode, extra in MODES.items():
+            # a small delay lets concurrent games and requests actually interleave
+            delay = 0.0 if mode == "seq" else 0.005
+            monkeypatch.setattr(mod, "ChatOpenAI", lambda delay=delay, **kwargs: FakeChatModel(delay=delay))
+            assert _run(mod, tmp_path, mode, **extra) == baseline, mode
+    finally:
+        set_max_inflight_requests(None)
+        set_default_backend(None)
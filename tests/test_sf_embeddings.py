@@ -0,0 +1,237 @@
+# tests/test_sf_embeddings.py
+import threading
+
+import numpy as np
+import pytest
+import requests
+
+import agents.sf_embeddings as sf_embeddings
+from agents.embedding_store import EmbeddingStore
+from agents.sf_embeddings import EmbeddingBatcher, SiliconFlowEmbeddings
+
+
+def _client(**kwargs):
+    return SiliconFlowEmbeddings(api_key="k", base_url="http://embed.invalid/v1", use_cache=False, **kwargs)
+
+
+def test_clients_share_a_batcher_only_with_identical_request_settings():
+    first = _client(timeout=30.0, max_retries=2)
+    same = _client(timeout=30.0, max_retries=2)
+    longer_timeout = _client(timeout=90.0, max_retries=2)
+    more_retries = _client(timeout=30.0, max_retries=6)
+
+    assert same._fetch.__self__ is first._fetch.__self__
+    for other in (longer_timeout, more_retries):
+        batcher = other._fetch.__self__
+        assert batcher is not first._fetch.__self__
+        # the batcher sends with the settings of the client that asked for it
+        assert batcher.request.__self__ is other
+
+
+class _CountingRequest:
+    def __init__(self, rows=None, error=None, block=None):
+        self.calls = []
+        self.rows = rows
+        self.error = error
+        self.block = block
+        self._lock = threading.Lock()
+
+    def __call__(self, texts):
+        with self._lock:
+            self.calls.append(list(texts))
+        if self.block is not None:
+            self.block.wait(5)
+        if self.error is not None:
+            raise self.error
+        n = len(texts) if self.rows is None else self.rows
+        return np.array([[float(len(t)), 1.0] for t in texts[:n]], dtype=np.float32)
+
+
+def _submit_concurrently(batcher, batches):
+    barrier = threading.Barrier(len(batches))
+    results = [None] * len(batches)
+
+    def worker(i):
+        barrier.wait()
+        try:
+            results[i] = batcher.submit(batches[i])
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(batches))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    return results
+
+
+BATCHES = [["a", "bb"], ["bb", "ccc"], ["dddd"], ["a"]]
+
+
+def test_concurrent_submits_are_merged_into_one_request():
+    request = _CountingRequest()
+    batcher = EmbeddingBatcher(request, window=0.2, timeout=5)
+
+    results = _submit_concurrently(batcher, BATCHES)
+
+    assert len(request.calls) == 1
+    assert sorted(request.calls[0]) == ["a", "bb", "ccc", "dddd"]
+    for texts, vectors in zip(BATCHES, results):
+        assert [float(v[0]) for v in vectors] == [float(len(t)) for t in texts]
+
+
+def test_failed_request_reaches_every_caller():
+    batcher = EmbeddingBatcher(_CountingRequest(error=RuntimeError("503")), window=0.2, timeout=5)
+
+    results = _submit_concurrently(batcher, BATCHES)
+
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+def test_short_response_fails_every_caller_instead_of_hanging():
+    batcher = EmbeddingBatcher(_CountingRequest(rows=2), window=0.2, timeout=5)
+
+    results = _submit_concurrently(batcher, BATCHES)
+
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+def test_submit_times_out():
+    release = threading.Event()
+    batcher = EmbeddingBatcher(_CountingRequest(block=release), window=0.0, timeout=0.2)
+    try:
+        with pytest.raises(TimeoutError):
+            batcher.submit(["a"])
+    finally:
+        release.set()
+
+
+class _Response:
+    def __init__(self, status_code, headers=None, rows=1):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.rows = rows
+
+    def json(self):
+        return {"data": [{"embedding": [0.5, 0.5]} for _ in range(self.rows)]}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code}", response=self)
+
+
+class _Session:
+    """Replays a script of responses (or exceptions) for successive posts."""
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.posts = 0
+
+    def post(self, url, json=None, headers=None, timeout=None):
+        self.posts += 1
+        item = self.script.pop(0)
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(sf_embeddings.time, "sleep", delays.append)
+    return delays
+
+
+def _scripted_client(request, script, **kwargs):
+    # a distinct endpoint per test keeps the shared per-endpoint counters apart
+    client = SiliconFlowEmbeddings(api_key="k", base_url=f"http://{request.node.name}.invalid/v1",
+                                   use_cache=False, batch_window_ms=0, **kwargs)
+    client.session = _Session(script)
+    return client
+
+
+def test_429_waits_out_a_long_retry_after(request, sleeps):
+    client = _scripted_client(request, [_Response(429, {"Retry-After": "45"}), _Response(200)],
+                              timeout=60.0, backoff_max=20.0)
+
+    assert client.embed_matrix(["a"]).shape == (1, 2)
+    assert sleeps == [45.0]
+    stats = client.get_stats()
+    assert (stats["requests"], stats["retries"], stats["failures"]) == (2, 1, 0)
+
+
+def test_retry_after_is_bounded_by_the_request_timeout(request, sleeps):
+    client = _scripted_client(request, [_Response(503, {"Retry-After": "600"}), _Response(200)], timeout=30.0)
+
+    client.embed_matrix(["a"])
+    assert sleeps == [30.0]
+
+
+def test_5xx_then_success(request, sleeps):
+    client = _scripted_client(request, [_Response(502), requests.ConnectionError("reset"), _Response(200)],
+                              backoff_base=0.5, backoff_max=20.0)
+
+    client.embed_matrix(["a"])
+    assert client.session.posts == 3
+    # jittered exponential backoff: attempt i waits at most backoff_base * 2**i
+    assert len(sleeps) == 2 and 0 <= sleeps[0] <= 0.5 and 0 <= sleeps[1] <= 1.0
+    stats = client.get_stats()
+    assert (stats["requests"], stats["retries"], stats["failures"]) == (3, 2, 0)
+    assert stats["latency_avg"] == pytest.approx(stats["latency_total"] / 3)
+
+
+def test_retries_exhausted(request, sleeps):
+    client = _scripted_client(request, [_Response(500)] * 3, max_retries=2)
+
+    with pytest.raises(requests.HTTPError):
+        client.embed_matrix(["a"])
+    assert client.session.posts == 3 and len(sleeps) == 2
+    stats = client.get_stats()
+    assert (stats["requests"], stats["retries"], stats["failures"]) == (3, 2, 1)
+
+
+def test_connection_errors_exhausted(request, sleeps):
+    client = _scripted_client(request, [requests.Timeout("slow")] * 2, max_retries=1)
+
+    with pytest.raises(requests.Timeout):
+        client.embed_matrix(["a"])
+    stats = client.get_stats()
+    assert (stats["requests"], stats["retries"], stats["failures"]) == (2, 1, 1)
+
+
+def test_client_errors_are_not_retried(request, sleeps):
+    client = _scripted_client(request, [_Response(400)])
+
+    with pytest.raises(requests.HTTPError):
+        client.embed_matrix(["a"])
+    assert sleeps == []
+    assert client.get_stats()["failures"] == 1
+
+
+class _VectorResponse(_Response):
+    def __init__(self, vectors):
+        super().__init__(200)
+        self.vectors = vectors
+
+    def json(self):
+        return {"data": [{"embedding": v} for v in self.vectors]}
+
+
+@pytest.mark.parametrize("cached", [False, True])
+def test_embed_matrix_normalize_gives_contiguous_float32_unit_rows(request, tmp_path, cached):
+    vectors = [[3.0, 4.0, 0.0], [0.0, 0.0, 0.0], [1.0, 1.0, 1.0]]
+    store = EmbeddingStore(str(tmp_path)) if cached else None
+    client = SiliconFlowEmbeddings(api_key="k", base_url=f"http://{request.node.name}.invalid/v1",
+                                   store=store, use_cache=cached, batch_window_ms=0)
+    client.session = _Session([_VectorResponse(vectors)])
+
+    matrix = client.embed_matrix(["a", "b", "c"], normalize=True)
+
+    assert matrix.dtype == np.float32 and matrix.shape == (3, 3)
+    assert matrix.flags["C_CONTIGUOUS"]
+    np.testing.assert_allclose(np.linalg.norm(matrix, axis=1), [1.0, 0.0, 1.0], rtol=1e-6)
+    np.testing.assert_allclose(matrix[0], [0.6, 0.8, 0.0], rtol=1e-6)
+    # unnormalized rows are returned as sent
+    if cached:
+        np.testing.assert_array_equal(client.embed_matrix(["c", "a"]), [[1.0, 1.0, 1.0], [3.0, 4.0, 0.0]])
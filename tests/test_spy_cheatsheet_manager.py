@@ -0,0 +1,69 @@
+# tests/test_spy_cheatsheet_manager.py
+import json
+import os
+
+import faiss
+
+import agents.retrieval_engine as retrieval_engine
+from agents.spy_cheatsheet_manager import SpyCheatSheetManager
+from fake_models import FakeEmbeddings
+
+
+def _bge_fake(*args, **kwargs):
+    embedder = FakeEmbeddings()
+    # unversioned (legacy) stores are only loaded for bge-m3
+    embedder.model = "BAAI/bge-m3"
+    return embedder
+
+
+def _write_legacy_store(prefix, memory_path, texts):
+    """Store as written before the index was bounded: plain text list + IndexFlatIP."""
+    index = faiss.IndexFlatIP(64)
+    index.add(_bge_fake().embed_matrix(texts))
+    faiss.write_index(index, f"{prefix}_cheatsheet.index")
+    with open(f"{prefix}_cheatsheet_texts.json", "w", encoding="utf-8") as f:
+        json.dump(texts, f)
+    with open(memory_path, "w", encoding="utf-8") as f:
+        json.dump(texts, f)
+
+
+def test_loading_oversized_legacy_store_keeps_entries_until_add(tmp_path, monkeypatch):
+    monkeypatch.setattr(retrieval_engine, "make_embeddings", _bge_fake)
+    prefix = str(tmp_path / "single")
+    memory_path = str(tmp_path / "single_cheatsheet_memory.json")
+    texts = [f"tip {i}" for i in range(15)]
+    _write_legacy_store(prefix, memory_path, texts)
+    files_before = sorted(os.listdir(tmp_path))
+    memory_before = open(memory_path, "rb").read()
+
+    manager = SpyCheatSheetManager(path=memory_path, prefix=prefix, capacity=10)
+
+    assert manager.pool == texts
+    assert manager.engine.pool_text == texts
+    assert manager.retrieve("tip 3", top_k=15)
+    # loading wrote nothing: no snapshot, no manifest, memory file untouched
+    assert sorted(os.listdir(tmp_path)) == files_before
+    assert open(memory_path, "rb").read() == memory_before
+
+    manager.add_items(["new tip"])
+
+    assert len(manager.pool) == 10
+    assert "new tip" in manager.pool
+    assert os.path.exists(f"{prefix}_cheatsheet_manifest.json")
+    with open(memory_path, encoding="utf-8") as f:
+        assert json.load(f) == manager.pool
+
+
+def test_loading_memory_file_without_index_writes_nothing(tmp_path, monkeypatch):
+    monkeypatch.setattr(retrieval_engine, "make_embeddings", _bge_fake)
+    prefix = str(tmp_path / "multi")
+    memory_path = str(tmp_path / "multi_cheatsheet_memory.json")
+    texts = [f"line {i}" for i in range(12)]
+    with open(memory_path, "w", encoding="utf-8") as f:
+        json.dump(texts, f)
+
+    manager = SpyCheatSheetManager(path=memory_path, prefix=prefix, capacity=10)
+
+    assert manager.pool == texts
+    assert sorted(os.listdir(tmp_path)) == ["multi_cheatsheet_memory.json"]
+    assert len(manager.retrieve("line 1", top_k=12)) == 12
@@ -0,0 +1,86 @@
+# tests/test_workflow.py
+import asyncio
+
+import pytest
+
+import agents.model as model
+import graph.nodes as nodes
+import graph.registry as registry
+from graph import run_games, run_games_async
+from fake_models import FakeChatModel
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    monkeypatch.setattr(model, "ChatOpenAI", lambda **kwargs: FakeChatModel())
+    monkeypatch.setattr(model, "_llm_pool", {})
+
+
+@pytest.fixture
+def failing_game(monkeypatch):
+    """Game "bad" raises in end_game, after its agents were registered."""
+    registered = []
+    register = nodes.register_game_agents
+    save = nodes.save_game_results_json
+
+    def recording_register(game_id, agents_map):
+        registered.append(game_id)
+        register(game_id, agents_map)
+
+    def flaky_save(state, output_dir=None):
+        if state["game_id"] == "bad":
+            raise RuntimeError("disk full")
+        return save(state, output_dir)
+
+    monkeypatch.setattr(nodes, "register_game_agents", recording_register)
+    monkeypatch.setattr(nodes, "save_game_results_json", flaky_save)
+    return registered
+
+
+def _batch(tmp_path):
+    return [{"num_players": 4, "game_id": game_id, "output_dir": str(tmp_path)} for game_id in ("g1", "bad", "g2")]
+
+
+def _check(results, registered):
+    by_id = {r["game_id"]: r for r in results}
+    assert sorted(by_id) == ["bad", "g1", "g2"]
+    assert "disk full" in by_id["bad"]["error"]
+    for game_id in ("g1", "g2"):
+        assert by_id[game_id]["game_over"] and "error" not in by_id[game_id]
+    # the failed game was registered and still released
+    assert "bad" in registered
+    assert registry.get_game_agents("bad") == {}
+    assert not registry._game_agents
+
+
+def test_run_games_keeps_going_after_a_failed_game(tmp_path, fake_llm, failing_game):
+    _check(list(run_games(_batch(tmp_path), concurrency=2)), failing_game)
+
+
+def test_run_games_async_keeps_going_after_a_failed_game(tmp_path, fake_llm, failing_game):
+    async def collect():
+        return [state async for state in run_games_async(_batch(tmp_path), concurrency=2)]
+
+    _check(asyncio.run(collect()), failing_game)
+
+
+@pytest.mark.parametrize("node", [nodes.description_phase, nodes.voting_phase])
+def test_nodes_refuse_to_recreate_released_agents(tmp_path, fake_llm, node):
+    state = {"game_id": "released", "num_players": 4, "output_dir": str(tmp_path)}
+    state = {**state, **nodes.initialize_game(state), "current_descriptions": []}
+    registry.release_game("released")
+
+    with pytest.raises(RuntimeError, match="released"):
+        node(state)
+    assert registry.get_game_agents("released") == {}
+
+
+def test_async_nodes_refuse_to_recreate_released_agents(tmp_path, fake_llm):
+    state = {"game_id": "released", "num_players": 4, "output_dir": str(tmp_path)}
+    state = {**state, **nodes.initialize_game(state), "current_descriptions": []}
+    registry.release_game("released")
+
+    for node in (nodes.description_phase_async, nodes.voting_phase_async):
+        with pytest.raises(RuntimeError, match="released"):
+            asyncio.run(node(state))
+    assert registry.get_game_agents("released") == {}